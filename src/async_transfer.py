@@ -0,0 +1,351 @@
+import asyncio
+import json
+import threading
+import time
+import logging
+import aiohttp
+from utils import decode_chunk_response, get_hedged_reads, get_hedge_percentile, get_transfer_retries, get_async_concurrency, get_write_acks
+from chunks_utils import latencies
+
+logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+
+
+class AsyncTransferEngine(threading.Thread):
+    """Thread Class for running an asyncio event loop which transfers the chunks of the client; all the transfers share one HTTP session, so hundreds of them can be in flight on few keep-alive connections without a thread for each of them."""
+
+    def __init__(self, concurrency, retries):
+        threading.Thread.__init__(self, daemon=True)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.ready = threading.Event()
+
+    def get_loop(self):
+        """Method for getting the 'loop' object attribute.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+
+        Returns
+        -------
+        self.loop --> asyncio.unix_events._UnixSelectorEventLoop class
+        """
+        return self.loop
+
+    def set_loop(self, loop):
+        """Method for setting the 'loop' object attribute.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        loop --> asyncio.unix_events._UnixSelectorEventLoop class
+
+        Returns
+        -------
+        None
+        """
+        self.loop = loop
+
+    def get_concurrency(self):
+        """Method for getting the 'concurrency' object attribute.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+
+        Returns
+        -------
+        self.concurrency --> int, the maximum number of transfers in flight
+        """
+        return self.concurrency
+
+    def set_concurrency(self, concurrency):
+        """Method for setting the 'concurrency' object attribute.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        concurrency --> int, the maximum number of transfers in flight
+
+        Returns
+        -------
+        None
+        """
+        self.concurrency = concurrency
+
+    def get_retries(self):
+        """Method for getting the 'retries' object attribute.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+
+        Returns
+        -------
+        self.retries --> int, how many times a failed write is retried
+        """
+        return self.retries
+
+    def set_retries(self, retries):
+        """Method for setting the 'retries' object attribute.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        retries --> int, how many times a failed write is retried
+
+        Returns
+        -------
+        None
+        """
+        self.retries = retries
+
+    def run(self):
+        """Target method for the class; the event loop starts and runs forever.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+
+        Returns
+        -------
+        None
+        """
+        asyncio.set_event_loop(self.get_loop())
+        #the session must be created inside the loop which uses it
+        self.session = self.get_loop().run_until_complete(self.open_session())
+        self.ready.set()
+        self.get_loop().run_forever()
+
+    async def open_session(self):
+        """Method for creating the HTTP session shared by all the transfers.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+
+        Returns
+        -------
+        session --> aiohttp.ClientSession class, the session with a pool of at most concurrency connections
+        """
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.get_concurrency()))
+
+    def submit(self, coro):
+        """Method for running a coroutine on the event loop of the engine and waiting for its result.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        coro --> coroutine, the transfers to run
+
+        Returns
+        -------
+        asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result() --> the result of the coroutine
+        """
+        self.ready.wait()
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result()
+
+    async def write_chunk(self, host, chunk, payload, rep):
+        """Method for writing a chunk into its master datanode, retrying it with an exponential backoff if the request fails.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        host --> str, the master datanode of the chunk
+        chunk --> str, the chunk name
+        payload --> bytes, the chunk payload as it will be stored
+        rep --> list, the datanodes which handle the secondary replicas of the chunk
+
+        Returns
+        -------
+        None
+        """
+        #the body is the raw payload, so the datanode streams it to the disk
+        params = {'chunk_replicas': json.dumps(rep), 'chunk_name': chunk, 'acks': get_write_acks(len(rep)+1)}
+        for attempt in range(self.get_retries()+1):
+            try:
+                async with self.session.put('http://{}/chunks'.format(host), params=params, data=payload, headers={'Content-Type': 'application/octet-stream'}) as resp:
+                    resp.raise_for_status()
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                #the last attempt has failed, the error reaches the caller
+                if attempt == self.get_retries():
+                    raise e
+                logging.warning('Transfer failed, retrying: {}'.format(e))
+                await asyncio.sleep(0.1*2**attempt)
+
+    async def request_chunk(self, dn, c):
+        """Method for requesting a chunk to a datanode, recording the latency of the datanode; the error of a failed read is raised.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        dn --> str, the datanode
+        c --> str, the chunk name
+
+        Returns
+        -------
+        content --> bytes, the chunk payload as it's stored
+        """
+        start = time.perf_counter()
+        try:
+            #the chunk is required raw, so the datanode streams it from the disk
+            async with self.session.get('http://{}/chunks'.format(dn), params={'chunk_name': c, 'raw': 1}) as resp:
+                #the datanode does not have the chunk
+                resp.raise_for_status()
+                content = decode_chunk_response(await resp.read(), resp.headers.get('Content-Type'))
+            latencies.record(dn, time.perf_counter()-start)
+            return content
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            latencies.record_failure(dn)
+            raise e
+
+    async def read_chunk(self, datanodes, c):
+        """Method for reading a chunk from the datanodes which handle it, retrying it with an exponential backoff if no datanode answers.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        datanodes --> list, the datanodes which handle the chunk (primary first)
+        c --> str, the chunk name
+
+        Returns
+        -------
+        payload --> bytes, the chunk payload as it's stored
+        """
+        for attempt in range(self.get_retries()+1):
+            try:
+                return await self.read_replicas(datanodes, c)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                #the last attempt has failed, the error reaches the caller
+                if attempt == self.get_retries():
+                    raise e
+                logging.warning('Transfer failed, retrying: {}'.format(e))
+                await asyncio.sleep(0.1*2**attempt)
+
+    async def read_replicas(self, datanodes, c):
+        """Method for reading a chunk from the fastest datanode which handles it, hedging the read as chunks_utils.read_chunk does; the slower request is cancelled as soon as the chunk is got. If no datanode answers, the error of the last one is raised.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        datanodes --> list, the datanodes which handle the chunk (primary first)
+        c --> str, the chunk name
+
+        Returns
+        -------
+        payload --> bytes, the chunk payload as it's stored
+        """
+        remaining = latencies.sort(datanodes)
+        threshold = latencies.threshold(get_hedge_percentile()) if get_hedged_reads() else None
+        hedged = False
+        pending = set()
+        error = aiohttp.ClientError('Chunk {} is not handled by any datanode'.format(c))
+        try:
+            while remaining or pending:
+                if not pending:
+                    pending.add(asyncio.ensure_future(self.request_chunk(remaining.pop(0), c)))
+                #only one hedged request is sent for each chunk
+                (done, pending) = await asyncio.wait(pending, timeout=threshold if remaining and not hedged else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logging.info('Hedging the read of chunk {}'.format(c))
+                    pending.add(asyncio.ensure_future(self.request_chunk(remaining.pop(0), c)))
+                    hedged = True
+                    continue
+                for d in done:
+                    try:
+                        return d.result()
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        logging.error(e)
+                        error = e
+            raise error
+        finally:
+            for p in pending:
+                p.cancel()
+
+    async def gather(self, tasks, progress):
+        """Method for running a batch of transfers, at most concurrency of them in flight.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        tasks --> list, tuples which contains (key of the transfer, coroutine function, arguments of the function)
+        progress --> function, called as progress(done, total, key) every time a transfer ends, None for not reporting the progress
+
+        Returns
+        -------
+        (results, errors) --> tuple(dict, dict), key: key of the transfer, value: result of the transfer, key: key of the failed transfer, value: the exception raised
+        """
+        slots = asyncio.Semaphore(self.get_concurrency())
+        results = {}
+        errors = {}
+        done = [0]
+
+        async def transfer(key, fn, args):
+            async with slots:
+                try:
+                    results[key] = await fn(*args)
+                except Exception as e:
+                    errors[key] = e
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], len(tasks), key)
+
+        await asyncio.gather(*[transfer(key, fn, args) for (key, fn, args) in tasks])
+        return (results, errors)
+
+    def write(self, tasks, progress=None):
+        """Method for writing a batch of chunks.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        tasks --> list, tuples which contains (datanode, chunk name, payload, datanodes which handle the secondary replicas)
+        progress --> function, called as progress(done, total, chunk) every time a chunk is written, None for not reporting the progress
+
+        Returns
+        -------
+        (written, errors) --> tuple(dict, dict), key: chunk name of the chunks written, key: chunk name of the chunks not written, value: the exception raised
+        """
+        return self.submit(self.gather([(chunk, self.write_chunk, (host, chunk, payload, rep)) for (host, chunk, payload, rep) in tasks], progress))
+
+    def read(self, tasks, progress=None):
+        """Method for reading a batch of chunks.
+
+        Parameters
+        ----------
+        self --> AsyncTransferEngine class, self reference to the object instance
+        tasks --> list, tuples which contains (list of datanodes which handle a replica of the chunk, chunk name, sequence number of the chunk)
+        progress --> function, called as progress(done, total, sequence number) every time a chunk is read, None for not reporting the progress
+
+        Returns
+        -------
+        (tot, errors) --> tuple(dict, dict), key: sequence number, value: content of the chunk, key: sequence number of the failed reads, value: the exception raised
+        """
+        return self.submit(self.gather([(sn, self.read_chunk, (dn, c)) for (dn, c, sn) in tasks], progress))
+
+
+#the engine is started once and shared by all the transfers of the client
+async_engine = None
+async_engine_lock = threading.Lock()
+
+
+def get_async_engine():
+    """Function for getting the asyncio transfer engine of the client, it's started at the first transfer.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    async_engine --> AsyncTransferEngine class, the engine shared by all the transfers
+    """
+    global async_engine
+    with async_engine_lock:
+        if async_engine is None:
+            async_engine = AsyncTransferEngine(get_async_concurrency(), get_transfer_retries())
+            async_engine.start()
+    return async_engine
@@ -0,0 +1,384 @@
+#example --> python3 benchmarks.py ec 64 RS-6-3
+#example --> python3 benchmarks.py transfer 1000 2
+#example --> python3 benchmarks.py serve 4
+#example --> python3 benchmarks.py durability 256 16
+#example --> python3 benchmarks.py containers 10000
+#example --> python3 benchmarks.py mmap 10000 64
+
+import sys
+import os
+import time
+import io
+import random
+import shutil
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from requests import Session
+from erasure_coding import encode_stripe, decode_stripe, stripes_number
+from utils import parse_policy, get_replica_set, get_datanodes_list, decode_chunk_response, get_group_commit_window
+import chunks_handler as ch
+from datanode_utils import store_chunk, chunk_path, GroupCommitThread, ContainerStore, MappedChunks
+
+logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def throughput(n_bytes, seconds):
+    """Function for getting a throughput in MB/s.
+
+    Parameters
+    ----------
+    n_bytes --> int, the number of bytes processed
+    seconds --> float, the time spent
+
+    Returns
+    -------
+    n_bytes/(1024*1024)/seconds --> float, the throughput in MB/s
+    """
+    return n_bytes/(1024*1024)/max(seconds, 1e-9)
+
+
+def benchmark_ec(size_mb=64, policy='RS-6-3', cell_size=1024*1024):
+    """Benchmark of the erasure coding: encode and decode throughput (decoding with the maximum number of lost data cells) and storage overhead compared with the replication.
+
+    Parameters
+    ----------
+    size_mb --> int, the size of the file to encode, in MB
+    policy --> str, the erasure coding policy, RS-<DATA_CHUNKS>-<PARITY_CHUNKS>
+    cell_size --> int, the size of each data cell, in bytes
+
+    Returns
+    -------
+    results --> dict, the measures of the benchmark
+    """
+    (data_chunks, parity_chunks) = parse_policy(policy)
+    content = os.urandom(size_mb*1024*1024)
+    cells = [content[start:start+cell_size] for start in range(0, len(content), cell_size)]
+    #encoding
+    start = time.perf_counter()
+    parity = []
+    for stripe in range(stripes_number(len(cells), data_chunks)):
+        parity.append(encode_stripe(cells[stripe*data_chunks:(stripe+1)*data_chunks], data_chunks, parity_chunks))
+    encode_time = time.perf_counter()-start
+    #decoding, losing the first parity_chunks data cells of each stripe (the worst case)
+    start = time.perf_counter()
+    for stripe in range(len(parity)):
+        stripe_cells = {}
+        data = cells[stripe*data_chunks:(stripe+1)*data_chunks]
+        data += [b'']*(data_chunks-len(data))
+        for i in range(data_chunks):
+            stripe_cells[i] = None if i < parity_chunks else data[i]
+        for j in range(parity_chunks):
+            stripe_cells[data_chunks+j] = parity[stripe][j]
+        if decode_stripe(stripe_cells, data_chunks, parity_chunks) != data:
+            logging.error('Stripe {} not decoded correctly'.format(stripe))
+    decode_time = time.perf_counter()-start
+    stored = len(content) + sum(len(p) for stripe in parity for p in stripe)
+    results = {
+        'policy': policy,
+        'size': len(content),
+        'encode_mb_s': throughput(len(content), encode_time),
+        'decode_mb_s': throughput(len(content), decode_time),
+        'ec_overhead': stored/len(content),
+        'replication_overhead': float(get_replica_set()),
+        'tolerated_failures': parity_chunks
+    }
+    return results
+
+
+def benchmark_transfer(engine, files, chunks_per_file, chunk_size):
+    """Benchmark of a transfer engine: write and read throughput of the chunks of some files, all of them transferred together, against the datanodes of the configuration file (they must be running); the chunks are deleted at the end.
+
+    Parameters
+    ----------
+    engine --> str, the transfer engine, either thread or asyncio
+    files --> int, the number of files
+    chunks_per_file --> int, the number of chunks of each file
+    chunk_size --> int, the size of each chunk, in bytes
+
+    Returns
+    -------
+    results --> dict, the measures of the benchmark
+    """
+    datanodes = get_datanodes_list()
+    payload = os.urandom(chunk_size)
+    payloads = {}
+    chunks_to_write = {}
+    replicas = {}
+    chunks = []
+    for f in range(files):
+        for sn in range(chunks_per_file):
+            name = 'benchmark{}{}_{}'.format(engine, f, sn)
+            #the chunks are spread over the datanodes without replicas, only the client data path is measured
+            dn = datanodes[len(chunks)%len(datanodes)]
+            payloads[name] = payload
+            replicas[name] = []
+            chunks_to_write.setdefault(dn, []).append(name)
+            chunks.append(([dn], name, len(chunks)))
+    start = time.perf_counter()
+    ch.write_chunks(chunks_to_write, payloads, replicas, progress=None, engine=engine)
+    write_time = time.perf_counter()-start
+    start = time.perf_counter()
+    tot = ch.read_chunks(chunks, engine=engine)
+    read_time = time.perf_counter()-start
+    if len(tot) != len(chunks) or any(tot[sn] != payload for sn in tot):
+        logging.error('Some chunks not read back correctly')
+    ch.delete_chunks(['benchmark{}'.format(engine)], datanodes)
+    results = {
+        'engine': engine,
+        'chunks': len(chunks),
+        'size': len(chunks)*chunk_size,
+        'write_mb_s': throughput(len(chunks)*chunk_size, write_time),
+        'read_mb_s': throughput(len(chunks)*chunk_size, read_time),
+        'write_chunks_s': len(chunks)/max(write_time, 1e-9),
+        'read_chunks_s': len(chunks)/max(read_time, 1e-9)
+    }
+    return results
+
+
+def benchmark_serve(chunk_size, chunks_number):
+    """Benchmark of the chunks serving of a datanode: read throughput of the chunks served as strings (the get of the old clients) and raw (streamed from the disk), against the first datanode of the configuration file (it must be running); each chunk is read once, so the hot chunks cache of the datanode is not used; the chunks are deleted at the end.
+    
+    Parameters
+    ----------
+    chunk_size --> int, the size of each chunk, in bytes
+    chunks_number --> int, the number of chunks read for each way of serving
+    
+    Returns
+    -------
+    results --> dict, the measures of the benchmark
+    """
+    dn = get_datanodes_list()[0]
+    payload = os.urandom(chunk_size)
+    results = {'size': chunk_size, 'chunks': chunks_number}
+    for (mode, raw) in [('string', {}), ('raw', {'raw': 1})]:
+        names = ['benchmarkserve{}_{}'.format(mode, n) for n in range(chunks_number)]
+        #the chunks are written one by one, only the reads are measured
+        for name in names:
+            ch.write_chunks({dn: [name]}, {name: payload}, {name: []}, progress=None)
+        with Session() as session:
+            start = time.perf_counter()
+            for name in names:
+                resp = session.get('http://{}/chunks'.format(dn), params=dict(raw, chunk_name=name))
+                resp.raise_for_status()
+                if decode_chunk_response(resp.content, resp.headers.get('Content-Type')) != payload:
+                    logging.error('Chunk {} not read back correctly'.format(name))
+            elapsed = time.perf_counter()-start
+            results['{}_mb_s'.format(mode)] = throughput(chunks_number*chunk_size, elapsed)
+            results['{}_ms'.format(mode)] = elapsed/chunks_number*1000
+            #the raw chunks are served also by range
+            if raw:
+                resp = session.get('http://{}/chunks'.format(dn), params=dict(raw, chunk_name=names[0]), headers={'Range': 'bytes=-4096'})
+                results['range'] = resp.status_code == 206 and resp.content == payload[-4096:]
+    ch.delete_chunks(['benchmarkserve'], [dn])
+    return results
+
+
+def benchmark_durability(durability, chunk_size, chunks_number, writers, directory=None, window=0.001):
+    """Benchmark of the durability of the writes of a datanode: write throughput of the chunks stored as a datanode does (see datanode_utils.store_chunk) by concurrent writers, so the cost of syncing the chunks is measured without the network; the chunks are deleted at the end.
+    
+    Parameters
+    ----------
+    durability --> str, either none, chunk or group (see utils.get_durability)
+    chunk_size --> int, the size of each chunk, in bytes
+    chunks_number --> int, the number of chunks written
+    writers --> int, the number of concurrent writers (e.g. the uploads served by the datanode at the same time)
+    directory --> str, the directory in which the chunks are written (it must be on the disk to measure), if None a temporary one
+    window --> float, the time window of a group commit, in seconds
+    
+    Returns
+    -------
+    results --> dict, the measures of the benchmark
+    """
+    payload = os.urandom(chunk_size)
+    storage = tempfile.mkdtemp(prefix='benchmarkdurability', dir=directory)
+    group_commit = GroupCommitThread(window)
+    group_commit.start()
+    try:
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            start = time.perf_counter()
+            futures = [executor.submit(store_chunk, os.path.join(storage, 'chunk{}'.format(n)), io.BytesIO(payload), durability, chunk_size, group_commit) for n in range(chunks_number)]
+            for f in futures:
+                f.result()
+            elapsed = time.perf_counter()-start
+    finally:
+        shutil.rmtree(storage)
+    results = {
+        'durability': durability,
+        'writers': writers,
+        'chunks': chunks_number,
+        'size': chunk_size,
+        'mb_s': throughput(chunks_number*chunk_size, elapsed),
+        'chunks_s': chunks_number/max(elapsed, 1e-9),
+        #every chunk is synced by its writer, the directory is synced after every rename (chunk) or once for each group (group)
+        'syncs': {'none': 0, 'chunk': 2*chunks_number, 'group': chunks_number+group_commit.get_stats()['commits']}[durability]
+    }
+    return results
+
+
+def benchmark_containers(chunk_size, chunks_number, durability='none', directory=None):
+    """Benchmark of the small chunks of a datanode: write, read and delete throughput of the chunks stored into a file each (see datanode_utils.store_chunk) and packed into containers (see datanode_utils.ContainerStore), without the network; with the containers half of the chunks are deleted before the other half, so the time of the compaction is measured too.
+    
+    Parameters
+    ----------
+    chunk_size --> int, the size of each chunk, in bytes
+    chunks_number --> int, the number of chunks
+    durability --> str, either none, chunk or group (see utils.get_durability)
+    directory --> str, the directory in which the chunks are written (it must be on the disk to measure), if None a temporary one
+    
+    Returns
+    -------
+    results --> dict, the measures of the benchmark
+    """
+    payload = os.urandom(chunk_size)
+    names = ['{:024x}_{}'.format(n, 0) for n in range(chunks_number)]
+    results = {'chunks': chunks_number, 'size': chunk_size, 'durability': durability}
+    group_commit = GroupCommitThread(get_group_commit_window())
+    group_commit.start()
+    #a file for each chunk, with the hashed layout
+    storage = tempfile.mkdtemp(prefix='benchmarkcontainers', dir=directory)
+    try:
+        start = time.perf_counter()
+        for c in names:
+            store_chunk(chunk_path(storage, c, 'hashed'), io.BytesIO(payload), durability, chunk_size, group_commit)
+        results['files_write_s'] = chunks_number/max(time.perf_counter()-start, 1e-9)
+        start = time.perf_counter()
+        for c in names:
+            with open(chunk_path(storage, c, 'hashed'), 'rb') as fb:
+                fb.read()
+        results['files_read_s'] = chunks_number/max(time.perf_counter()-start, 1e-9)
+        start = time.perf_counter()
+        for c in names:
+            os.remove(chunk_path(storage, c, 'hashed'))
+        results['files_delete_s'] = chunks_number/max(time.perf_counter()-start, 1e-9)
+    finally:
+        shutil.rmtree(storage)
+    #the chunks packed into containers, small enough for being compacted during the benchmark
+    storage = tempfile.mkdtemp(prefix='benchmarkcontainers', dir=directory)
+    containers = ContainerStore(chunk_size, max(chunk_size*chunks_number//16, chunk_size), 0.5)
+    try:
+        start = time.perf_counter()
+        for c in names:
+            containers.append(storage, c, payload, durability, group_commit)
+        results['containers_write_s'] = chunks_number/max(time.perf_counter()-start, 1e-9)
+        start = time.perf_counter()
+        for c in names:
+            containers.read(c)
+        results['containers_read_s'] = chunks_number/max(time.perf_counter()-start, 1e-9)
+        #half of the chunks deleted make all the containers but the last one worth compacting
+        start = time.perf_counter()
+        containers.remove(storage, names[::2], durability, group_commit)
+        elapsed = time.perf_counter()-start
+        start = time.perf_counter()
+        results['compacted'] = containers.compact(storage)
+        results['compaction_ms'] = (time.perf_counter()-start)*1000
+        start = time.perf_counter()
+        containers.remove(storage, names[1::2], durability, group_commit)
+        results['containers_delete_s'] = chunks_number/max(elapsed+time.perf_counter()-start, 1e-9)
+        results['containers'] = containers.get_stats()['containers']
+    finally:
+        containers.clear()
+        shutil.rmtree(storage)
+    return results
+
+
+def benchmark_mmap(read_size, reads, chunk_size, directory=None):
+    """Benchmark of the range reads of a datanode: throughput of reads at random offsets of a chunk, opening, seeking and reading the file for each one (as a range request served from the file) and slicing the memory mapping of the chunk (see datanode_utils.MappedChunks), both as a view and copied into bytes; the chunk is deleted at the end.
+    
+    Parameters
+    ----------
+    read_size --> int, the size of each read, in bytes
+    reads --> int, the number of reads
+    chunk_size --> int, the size of the chunk, in bytes
+    directory --> str, the directory in which the chunk is written (it must be on the disk to measure), if None a temporary one
+    
+    Returns
+    -------
+    results --> dict, the measures of the benchmark
+    """
+    storage = tempfile.mkdtemp(prefix='benchmarkmmap', dir=directory)
+    path = os.path.join(storage, 'chunk')
+    with open(path, 'wb') as fb:
+        fb.write(os.urandom(chunk_size))
+    offsets = [random.randrange(0, chunk_size-read_size+1) for n in range(reads)]
+    mapped_chunks = MappedChunks(1)
+    results = {'read_size': read_size, 'reads': reads, 'size': chunk_size}
+    try:
+        start = time.perf_counter()
+        for offset in offsets:
+            with open(path, 'rb') as fb:
+                fb.seek(offset)
+                fb.read(read_size)
+        results['read_s'] = reads/max(time.perf_counter()-start, 1e-9)
+        mapped_chunks.view(path, 'chunk').release()
+        start = time.perf_counter()
+        for offset in offsets:
+            with mapped_chunks.view(path, 'chunk') as view:
+                view[offset:offset+read_size].release()
+        results['mmap_view_s'] = reads/max(time.perf_counter()-start, 1e-9)
+        start = time.perf_counter()
+        for offset in offsets:
+            with mapped_chunks.view(path, 'chunk') as view:
+                view[offset:offset+read_size].tobytes()
+        results['mmap_bytes_s'] = reads/max(time.perf_counter()-start, 1e-9)
+    finally:
+        mapped_chunks.clear()
+        shutil.rmtree(storage)
+    for k in ['read', 'mmap_view', 'mmap_bytes']:
+        results[k+'_mb_s'] = results[k+'_s']*read_size/(1024*1024)
+    return results
+
+
+def main():
+    """Main function, the entry point."""
+    suite = sys.argv[1] if len(sys.argv) > 1 else 'ec'
+    if suite == 'ec':
+        size_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+        policy = sys.argv[3] if len(sys.argv) > 3 else 'RS-6-3'
+        r = benchmark_ec(size_mb, policy)
+        print('{} on {} MB: encode {:.1f} MB/s, decode {:.1f} MB/s'.format(r['policy'], r['size']//(1024*1024), r['encode_mb_s'], r['decode_mb_s']))
+        print('storage: {:.2f}x with erasure coding ({} failures tolerated) vs {:.2f}x with replication'.format(r['ec_overhead'], r['tolerated_failures'], r['replication_overhead']))
+    elif suite == 'transfer':
+        small_files = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+        huge_files = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+        #many small files (one 64 KB chunk each) and few huge files (256 MB each, in 4 MB chunks)
+        for (name, files, chunks_per_file, chunk_size) in [('small files', small_files, 1, 64*1024), ('huge files', huge_files, 64, 4*1024*1024)]:
+            for engine in ['thread', 'asyncio']:
+                r = benchmark_transfer(engine, files, chunks_per_file, chunk_size)
+                print('{} ({} chunks, {} MB), {} engine: write {:.1f} MB/s ({:.0f} chunks/s), read {:.1f} MB/s ({:.0f} chunks/s)'.format(name, r['chunks'], r['size']//(1024*1024), r['engine'], r['write_mb_s'], r['write_chunks_s'], r['read_mb_s'], r['read_chunks_s']))
+    elif suite == 'serve':
+        chunks_number = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+        for chunk_size in [1024*1024, 16*1024*1024, 64*1024*1024]:
+            r = benchmark_serve(chunk_size, chunks_number)
+            print('{} MB chunks: string {:.1f} MB/s ({:.1f} ms each), raw {:.1f} MB/s ({:.1f} ms each), range requests {}'.format(r['size']//(1024*1024), r['string_mb_s'], r['string_ms'], r['raw_mb_s'], r['raw_ms'], 'ok' if r['range'] else 'KO'))
+    elif suite == 'durability':
+        chunks_number = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+        writers = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+        directory = sys.argv[4] if len(sys.argv) > 4 else None
+        window = float(sys.argv[5]) if len(sys.argv) > 5 else get_group_commit_window()
+        #small chunks, where the syncs cost the most, and big chunks
+        for chunk_size in [64*1024, 4*1024*1024]:
+            for durability in ['none', 'chunk', 'group']:
+                r = benchmark_durability(durability, chunk_size, chunks_number, writers, directory, window)
+                print('{} KB chunks, {} writers, {} durability: {:.1f} MB/s ({:.0f} chunks/s, {} syncs)'.format(r['size']//1024, r['writers'], r['durability'], r['mb_s'], r['chunks_s'], r['syncs']))
+    elif suite == 'containers':
+        chunks_number = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+        durability = sys.argv[3] if len(sys.argv) > 3 else 'none'
+        directory = sys.argv[4] if len(sys.argv) > 4 else None
+        #tiny chunks (e.g. a 200 bytes file) and chunks as big as the ones packed by default
+        for chunk_size in [200, 64*1024]:
+            r = benchmark_containers(chunk_size, chunks_number, durability, directory)
+            print('{} bytes chunks, {} durability: files write {:.0f}/s, read {:.0f}/s, delete {:.0f}/s; containers write {:.0f}/s, read {:.0f}/s, delete {:.0f}/s, compaction {:.1f} ms ({} containers left)'.format(r['size'], r['durability'], r['files_write_s'], r['files_read_s'], r['files_delete_s'], r['containers_write_s'], r['containers_read_s'], r['containers_delete_s'], r['compaction_ms'], r['containers']))
+    elif suite == 'mmap':
+        reads = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+        chunk_mb = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+        directory = sys.argv[4] if len(sys.argv) > 4 else None
+        for read_size in [4*1024, 1024*1024]:
+            r = benchmark_mmap(read_size, reads, chunk_mb*1024*1024, directory)
+            print('{} KB reads from a {} MB chunk: read {:.0f}/s ({:.1f} MB/s), mmap view {:.0f}/s ({:.1f} MB/s), mmap bytes {:.0f}/s ({:.1f} MB/s)'.format(r['read_size']//1024, r['size']//(1024*1024), r['read_s'], r['read_mb_s'], r['mmap_view_s'], r['mmap_view_mb_s'], r['mmap_bytes_s'], r['mmap_bytes_mb_s']))
+    else:
+        logging.error('Unknown benchmark {}'.format(suite))
+
+
+if __name__ == '__main__':
+    main()
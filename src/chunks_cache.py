@@ -0,0 +1,320 @@
+import os
+import uuid
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from utils import get_chunk_cache_memory, get_chunk_cache_disk, get_chunk_cache_dir
+
+logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+
+
+class ChunkCache():
+    """Class for caching on the client the content of the chunks read, so a file read again (e.g. by head, tail, cat) is not got from the datanodes; the chunks are kept into a bounded memory tier and a bounded disk tier, both evicting the least recently used chunk. A chunk is cached for a version of its file (its update time and its chunks), when the file changes the chunks cached for the old version are invalidated."""
+
+    def __init__(self, memory_size, disk_size, directory):
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.directory = directory
+        #key: cache key, value: content of the chunk, from the least to the most recently used
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        #key: cache key, value: size of the chunk, from the least to the most recently used
+        self.disk = OrderedDict()
+        self.disk_used = 0
+        #key: file id, value: tuple(str, set) with the version of the file and the keys cached for it
+        self.versions = {}
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'memory_evictions': 0, 'disk_evictions': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+        if self.disk_size > 0:
+            self.load_disk()
+
+    def get_memory_size(self):
+        """Method for getting the 'memory_size' object attribute.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+
+        Returns
+        -------
+        self.memory_size --> int, the maximum size of the memory tier, in bytes
+        """
+        return self.memory_size
+
+    def set_memory_size(self, memory_size):
+        """Method for setting the 'memory_size' object attribute.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+        memory_size --> int, the maximum size of the memory tier, in bytes
+
+        Returns
+        -------
+        None
+        """
+        self.memory_size = memory_size
+
+    def get_disk_size(self):
+        """Method for getting the 'disk_size' object attribute.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+
+        Returns
+        -------
+        self.disk_size --> int, the maximum size of the disk tier, in bytes
+        """
+        return self.disk_size
+
+    def set_disk_size(self, disk_size):
+        """Method for setting the 'disk_size' object attribute.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+        disk_size --> int, the maximum size of the disk tier, in bytes
+
+        Returns
+        -------
+        None
+        """
+        self.disk_size = disk_size
+
+    def get_stats(self):
+        """Method for getting the statistics of the cache.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+
+        Returns
+        -------
+        stats --> dict, the hits of each tier, the misses, the evictions of each tier, the files invalidated and the bytes used by each tier
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['memory_used'] = self.memory_used
+            stats['disk_used'] = self.disk_used
+        return stats
+
+    def load_disk(self):
+        """Method for loading the chunks cached on disk by the previous runs of the client, the least recently used first.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+
+        Returns
+        -------
+        None
+        """
+        try:
+            #the cached chunks are readable by the user only, as the files they come from may be
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            entries = [e for e in os.scandir(self.directory) if e.is_file() and not e.name.endswith('.part')]
+        except OSError as e:
+            logging.warning('Chunk cache on disk not available: {}'.format(e))
+            self.disk_size = 0
+            return
+        for e in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self.disk[e.name] = e.stat().st_size
+            self.disk_used += e.stat().st_size
+        self.evict_disk()
+
+    def version(self, file):
+        """Method for getting the version of a file, it changes every time the file is updated or its chunks change.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+        file --> dict, the object which represents the file, as returned by get_file
+
+        Returns
+        -------
+        version --> str, the version of the file
+        """
+        #only the names of the chunks matter, not the datanodes which handle them
+        chunks = file.get('sequence') or sorted(file.get('chunks_bkp', {}).keys())
+        return hashlib.sha1('{}|{}'.format(file.get('update'), ','.join(chunks)).encode()).hexdigest()[:16]
+
+    def validate(self, file):
+        """Method for invalidating the chunks cached for an old version of a file.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+        file --> dict, the object which represents the file, as returned by get_file
+
+        Returns
+        -------
+        version --> str, the current version of the file
+        """
+        version = self.version(file)
+        with self.lock:
+            (cached, keys) = self.versions.get(file['_id'], (version, set()))
+            if cached != version:
+                self.stats['invalidations'] += 1
+                for key in keys:
+                    self.remove(key)
+                keys = set()
+            self.versions[file['_id']] = (version, keys)
+        return version
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def remove(self, key):
+        """Method for removing a chunk from both the tiers, the lock must be held.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+        key --> str, the cache key of the chunk
+
+        Returns
+        -------
+        None
+        """
+        if key in self.memory:
+            self.memory_used -= len(self.memory.pop(key))
+        if key in self.disk:
+            self.disk_used -= self.disk.pop(key)
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def get(self, file, chunk, version):
+        """Method for getting a chunk from the cache; a chunk found on disk is moved into the memory tier too.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+        file --> dict, the object which represents the file, as returned by get_file
+        chunk --> str, the chunk name
+        version --> str, the version of the file (see validate)
+
+        Returns
+        -------
+        content --> bytes, the content of the chunk, None if it's not cached
+        """
+        key = '{}.{}'.format(chunk, version)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return self.memory[key]
+            on_disk = key in self.disk
+            if on_disk:
+                self.disk.move_to_end(key)
+        if on_disk:
+            try:
+                with open(self.path(key), 'rb') as f:
+                    content = f.read()
+                #the modification time keeps the order of use for the next runs of the client
+                os.utime(self.path(key))
+            except OSError:
+                content = None
+            if content is not None:
+                with self.lock:
+                    self.stats['disk_hits'] += 1
+                self.put(file, chunk, version, content, disk=False)
+                return content
+        with self.lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, file, chunk, version, content, disk=True):
+        """Method for putting a chunk into the cache, evicting the least recently used chunks if a tier is full.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+        file --> dict, the object which represents the file, as returned by get_file
+        chunk --> str, the chunk name
+        version --> str, the version of the file (see validate)
+        content --> bytes, the content of the chunk
+        disk --> bool, if True the chunk is written into the disk tier too
+
+        Returns
+        -------
+        None
+        """
+        key = '{}.{}'.format(chunk, version)
+        with self.lock:
+            self.versions.setdefault(file['_id'], (version, set()))[1].add(key)
+            #a chunk bigger than a tier is not cached into it
+            if len(content) <= self.memory_size and key not in self.memory:
+                self.memory[key] = content
+                self.memory_used += len(content)
+                while self.memory_used > self.memory_size:
+                    self.memory_used -= len(self.memory.popitem(last=False)[1])
+                    self.stats['memory_evictions'] += 1
+            disk = disk and len(content) <= self.disk_size and key not in self.disk
+        if disk:
+            try:
+                #a chunk is written partially and then renamed, so a crash never leaves a truncated chunk into the cache; each write has its own partial file, so concurrent puts of the same chunk don't mix
+                tmp = '{}.{}.part'.format(self.path(key), uuid.uuid4().hex)
+                try:
+                    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f:
+                        f.write(content)
+                    os.replace(tmp, self.path(key))
+                except OSError:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    raise
+            except OSError as e:
+                logging.warning('Chunk {} not cached on disk: {}'.format(chunk, e))
+                return
+            with self.lock:
+                #a chunk cached meanwhile by a concurrent put is counted once
+                if key not in self.disk:
+                    self.disk[key] = len(content)
+                    self.disk_used += len(content)
+                self.evict_disk()
+
+    def evict_disk(self):
+        """Method for evicting the least recently used chunks from the disk tier until it fits its size, the lock must be held.
+
+        Parameters
+        ----------
+        self --> ChunkCache class, self reference to the object instance
+
+        Returns
+        -------
+        None
+        """
+        while self.disk_used > self.disk_size:
+            (key, size) = self.disk.popitem(last=False)
+            self.disk_used -= size
+            self.stats['disk_evictions'] += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+
+#the cache is created once and shared by all the reads of the client
+chunk_cache = None
+chunk_cache_lock = threading.Lock()
+
+
+def get_chunk_cache():
+    """Function for getting the chunk cache of the client, it's created at the first read.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    chunk_cache --> ChunkCache class, the cache shared by all the reads, None if it's disabled (both tiers of size 0)
+    """
+    global chunk_cache
+    with chunk_cache_lock:
+        if chunk_cache is None and (get_chunk_cache_memory() > 0 or get_chunk_cache_disk() > 0):
+            chunk_cache = ChunkCache(get_chunk_cache_memory(), get_chunk_cache_disk(), get_chunk_cache_dir())
+    return chunk_cache
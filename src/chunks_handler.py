@@ -1,60 +1,123 @@
 from requests import put, get, delete, post
-from utils import get_chunk_size, get_max_concurrency
+from requests.exceptions import RequestException
+from utils import get_chunk_size, parse_policy, get_file_cells, get_transfer_engine
+from compression_utils import compress_chunk, decompress_chunk
+from erasure_coding import encode_stripe, decode_stripe, rebuild_stripe, stripe_layout, stripes_number
+from exceptions import GetFileException, PutFileException, NotEnoughCellsException
 import json
-import queue 
-import threading 
-from chunks_utils import WriterThread, ReaderThread
+import hashlib
+import logging
+from chunks_utils import get_transfer_executor, write_chunk, read_chunk
+from async_transfer import get_async_engine
+from chunks_cache import get_chunk_cache
 
+logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
 
-def write_chunks(chunks_to_write, content, replicas):
+
+def split_chunks(content, codec='none'):
+    """Function for splitting the content of a file into the payloads of its chunks, compressing each of them with the codec in input.
+    
+    Parameters
+    ----------
+    content --> bytes, file content
+    codec --> str, the codec used for compressing the chunks
+    
+    Returns
+    -------
+    payloads --> list, the payload of each chunk (as it will be stored into the datanodes), sorted by sequence number
+    """
+    payloads = []
+    #each chunk contains a part of the entire content of a file, the last chunk will be smaller, or at least equal to the maximum, in terms of bytes size
+    for start in range(0, len(content), get_chunk_size()):
+        payloads.append(compress_chunk(content[start:start+get_chunk_size()], codec))
+    return payloads
+
+
+def encode_parity(payloads, data_chunks, parity_chunks):
+    """Function for computing the parity chunks of an erasure coded file.
+    
+    Parameters
+    ----------
+    payloads --> list, the payload of each data chunk, sorted by sequence number (see split_chunks)
+    data_chunks --> int, the number of data chunks of a stripe
+    parity_chunks --> int, the number of parity chunks of a stripe
+    
+    Returns
+    -------
+    parity --> list, the payload of each parity chunk, sorted by sequence number (the parity chunks follow the data ones)
+    """
+    parity = []
+    #every stripe groups data_chunks consecutive data chunks
+    for stripe in range(stripes_number(len(payloads), data_chunks)):
+        parity.extend(encode_stripe(payloads[stripe*data_chunks:(stripe+1)*data_chunks], data_chunks, parity_chunks))
+    return parity
+
+
+def hash_chunk(payload):
+    """Function for getting the content address of a chunk, used as chunk name when the chunks are deduplicated.
+    
+    Parameters
+    ----------
+    payload --> bytes, the chunk payload, as it will be stored into the datanodes
+    
+    Returns
+    -------
+    hashlib.sha256(payload).hexdigest() --> str, the SHA-256 hash of the payload
+    """
+    return hashlib.sha256(payload).hexdigest()
+
+
+def log_progress(done, total, chunk):
+    """Function for reporting the progress of a transfer into the log.
+    
+    Parameters
+    ----------
+    done --> int, the number of chunks transferred
+    total --> int, the number of chunks to transfer
+    chunk --> str, the chunk just transferred
+    
+    Returns
+    -------
+    None
+    """
+    logging.info('Chunk {} transferred ({}/{})'.format(chunk, done, total))
+    return
+
+
+def write_chunks(chunks_to_write, payloads, replicas, progress=log_progress, engine=None):
     """Function for writing chunks into the datanodes.
     
     Parameters
     ----------
     chunks_to_write --> dict, key: datanode in which to write, value: list of chunks to write
-    content --> bytes, file content
+    payloads --> dict, key: chunk name, value: payload of the chunk, in the order the chunks must be written
     replicas --> dict, key: chunks, value: list of node which have the replice for the chunk
+    progress --> function, called as progress(done, total, chunk) every time a chunk is written, None for not reporting the progress
+    engine --> str, the transfer engine (thread or asyncio), if None the one of the configuration file
     
     Returns
     -------
     None
     """
+    order = {chunk: number for (number, chunk) in enumerate(payloads)}
     chunks = []
     #create a list of datanode, chunk name and sequence number
     for host in chunks_to_write:
         for chunk in chunks_to_write[host]:
-            chunks.append([host,chunk,int(chunk.split('_')[1])])
+            chunks.append([host,chunk,order[chunk]])
     #sort the list using the sequence number
     chunks.sort(key=lambda x: x[2])
-    start=0
-    end=get_chunk_size()
-    queue_lock = threading.Lock() 
-    chunks_queue = queue.Queue() 
-    queue_lock.acquire() 
-    #insert all the elements present inside the sorted list of chunks to write into a queue, 
-    #taking also start and end bytes (each chunk contains a part of the entire content of a file)
-    for [host,chunk,number] in chunks[:-1]:
-        rep = replicas[chunk]
-        chunks_queue.put([host,chunk,number,start,end,rep])
-        start = end
-        end += get_chunk_size()
-    [host,chunk,number] = chunks[-1]
-    rep = replicas[chunk]
-    #the last chunk will be smaller, or at least equal to the maximum, in terms of bytes size 
-    chunks_queue.put([host,chunk,number,start,end,rep])
-    queue_lock.release()   
-    threads = []
-    thread_id = 1
-    #start the writing process
-    #initialize a pool of threads which will write concurrently 
-    #the pool can contain at most get_max_concurrency() threads 
-    for i in range(get_max_concurrency()):
-        thread = WriterThread(thread_id, chunks_queue, queue_lock, content) 
-        thread.start() 
-        threads.append(thread) 
-        thread_id += 1
-    for t in threads: 
-        t.join() 
+    #submit the writes to the transfer engine in order, taking also the payload of the chunk (each chunk contains a part of the entire content of a file)
+    if (engine or get_transfer_engine()) == 'asyncio':
+        (written, errors) = get_async_engine().write([(host, chunk, payloads[chunk], replicas[chunk]) for [host,chunk,number] in chunks], progress)
+    else:
+        tasks = [(chunk, write_chunk, (host, chunk, payloads[chunk], replicas[chunk])) for [host,chunk,number] in chunks]
+        (written, errors) = get_transfer_executor().run(tasks, progress)
+    #the chunks not written after all the retries make the file not readable
+    if errors:
+        for chunk in errors:
+            logging.error('Chunk {} not written: {}'.format(chunk, errors[chunk]))
+        raise PutFileException(list(errors.keys()))
     return
 
 
@@ -97,37 +160,145 @@ def copy_chunks(old_id, new_id, hosts):
     return
 
 
-def get_chunks(chunks):
+def read_chunks(chunks, progress=None, engine=None, errors=None):
+    """Function for reading the chunks from the datanodes as they are stored; the chunks which cannot be read from any datanode are missing from the result.
+    
+    Parameters
+    ----------
+    chunks --> list, tuples which contains (list of datanodes which handle a replica of a chunk of file, chunk name, sequence number of the chunk)
+    progress --> function, called as progress(done, total, sequence number) every time a chunk is read, None for not reporting the progress
+    engine --> str, the transfer engine (thread or asyncio), if None the one of the configuration file
+    errors --> dict, filled with the errors of the chunks not read (key: sequence number, value: the exception raised), None for only logging them
+    
+    Returns
+    -------
+    tot --> dict, key: sequence number, value: content of the i chunk
+    """
+    #submit the reads to the transfer engine, a chunk can be read from any datanode which handles it
+    if (engine or get_transfer_engine()) == 'asyncio':
+        (tot, failed) = get_async_engine().read(chunks, progress)
+    else:
+        tasks = [(sn, read_chunk, (dn, c)) for (dn, c, sn) in chunks]
+        (tot, failed) = get_transfer_executor().run(tasks, progress)
+    for sn in failed:
+        logging.error('Chunk {} not read: {}'.format(sn, failed[sn]))
+    if errors is not None:
+        errors.update(failed)
+    #if the content of a chunk has not been got, the chunk will be missing from the result
+    #the caller decides if the file is corrupted or if the chunk can be reconstructed
+    for sn in [sn for sn in tot if tot[sn] is None]:
+        del tot[sn]
+    return tot
+
+
+def reconstruct_chunks(tot, missing, cells, data_cells, data_chunks, parity_chunks):
+    """Function for reconstructing the missing data chunks of an erasure coded file from the other cells of their stripes.
+    
+    Parameters
+    ----------
+    tot --> dict, key: sequence number, value: content of the chunks already read
+    missing --> list, the sequence numbers of the data chunks to reconstruct
+    cells --> dict, key: sequence number, value: tuple(list, str) with the datanodes which handle the cell and the cell name (see utils.get_file_cells)
+    data_cells --> int, the number of data chunks of the file
+    data_chunks --> int, the number of data chunks of a stripe
+    parity_chunks --> int, the number of parity chunks of a stripe
+    
+    Returns
+    -------
+    None
+    """
+    stripes = {}
+    for sn in missing:
+        (stripe, layout) = stripe_layout(sn, data_cells, data_chunks, parity_chunks)
+        stripes[stripe] = layout
+    #read all the other cells of the stripes to reconstruct, the missing ones are skipped
+    to_read = []
+    for layout in stripes.values():
+        for sn in layout:
+            if sn is not None and sn not in tot and sn not in missing and sn in cells:
+                to_read.append((cells[sn][0], cells[sn][1], sn))
+    tot.update(read_chunks(to_read))
+    for layout in stripes.values():
+        stripe_cells = {}
+        for (i, sn) in enumerate(layout):
+            #the data cells beyond the end of the file are empty
+            stripe_cells[i] = b'' if sn is None else tot.get(sn)
+        try:
+            data = decode_stripe(stripe_cells, data_chunks, parity_chunks)
+        except NotEnoughCellsException as e:
+            logging.error(e.message)
+            raise GetFileException()
+        for (i, sn) in enumerate(layout[:data_chunks]):
+            if sn in missing:
+                tot[sn] = data[i]
+    return
+
+
+def get_chunks(chunks, codec='none', ec=None, cells=None, data_cells=None, progress=None):
     """Function for getting the chunks content of a file (operation required for get_file, head, tail, cat).
     
     Parameters
     ----------
     chunks --> list, tuples which contains (list of datanodes which handle a replica of a chunk of file, chunk name, sequence number of the chunk)
+    codec --> str, the codec used for compressing the chunks of the file
+    ec --> tuple(int, int), the number of data and parity chunks of a stripe if the file is erasure coded, None otherwise
+    cells --> dict, all the cells of an erasure coded file (see utils.get_file_cells), needed for reconstructing the missing chunks
+    data_cells --> int, the number of data chunks of an erasure coded file
+    progress --> function, called as progress(done, total, sequence number) every time a chunk is read, None for not reporting the progress
+    
+    Returns
+    -------
+    tot --> dict, key: sequence number, value: content of the i chunk
+    """
+    errors = {}
+    tot = read_chunks(chunks, progress, errors=errors)
+    missing = [sn for (dn, c, sn) in chunks if sn not in tot]
+    #an erasure coded file can be read also if some chunks are missing, reconstructing them from the other cells of the stripes
+    if missing and ec is not None:
+        logging.warning('Reconstructing {} missing chunks'.format(len(missing)))
+        reconstruct_chunks(tot, missing, cells, data_cells, ec[0], ec[1])
+        #the other cells read for the reconstruction are not part of the content required
+        required = set(x[2] for x in chunks)
+        for sn in list(tot.keys()):
+            if sn not in required:
+                del tot[sn]
+    #some chunk has not been read from any datanode, the file is corrupted; the error of the datanodes is the cause
+    elif missing:
+        raise GetFileException() from next(iter(errors.values()), None)
+    #the chunks are stored compressed into the datanodes, decompress them
+    for sn in tot:
+        tot[sn] = decompress_chunk(tot[sn], codec)
+    return tot
+
+
+def get_file_chunks(file, chunks):
+    """Function for getting the content of some chunks of a file, using the codec and the storage policy recorded into the file metadata.
+    
+    Parameters
+    ----------
+    file --> dict, the object which represents the file, as returned by get_file
+    chunks --> list, the data chunks to get (see utils.get_data_chunks)
     
     Returns
     -------
     tot --> dict, key: sequence number, value: content of the i chunk
     """
+    cache = get_chunk_cache()
+    if cache is None:
+        return get_chunks(chunks, file.get('codec', 'none'), parse_policy(file.get('policy')), get_file_cells(file), file.get('data_cells'))
+    #the chunks cached for the current version of the file are not got from the datanodes
+    version = cache.validate(file)
     tot = {}
-    queue_lock = threading.Lock() 
-    chunks_queue = queue.Queue() 
-    queue_lock.acquire() 
-    #create a queue in which every element contains the datanodes responsible for a certain chunk, the chunk name and the sequence number
     for (dn, c, sn) in chunks:
-        chunks_queue.put([dn, c, sn])
-    queue_lock.release()   
-    threads = []
-    thread_id = 1
-    #start the reading process
-    #initialize a pool of threads which will read concurrently 
-    #the pool can contain at most get_max_concurrency() threads 
-    for i in range(get_max_concurrency()):
-        thread = ReaderThread(thread_id, chunks_queue, queue_lock, tot) 
-        thread.start() 
-        threads.append(thread) 
-        thread_id += 1
-    for t in threads: 
-        t.join() 
+        content = cache.get(file, c, version)
+        if content is not None:
+            tot[sn] = content
+    missing = [(dn, c, sn) for (dn, c, sn) in chunks if sn not in tot]
+    if missing:
+        got = get_chunks(missing, file.get('codec', 'none'), parse_policy(file.get('policy')), get_file_cells(file), file.get('data_cells'))
+        for (dn, c, sn) in missing:
+            cache.put(file, c, version, got[sn])
+        tot.update(got)
     return tot
 
 
@@ -155,19 +326,55 @@ def start_recovery(chunks_to_replicate):
     return
 
 
-def start_flush(chunks_to_flush, dn):
+def start_flush(chunks_to_flush, dn, timeout=None):
     """Function for deleting the chunks for which a failed datanode is not a master/replica node anymore after the node has recovered from failure.
     
     Parameters
     ----------
     chunks_to_flush --> list, the chunks to flush
     dn --> str, the datanode for which the flush is needed, the recovered one 
+    timeout --> float, how many seconds the datanode is waited for, None for no limit
     
     Returns
     -------
     None
     """
     #delete from a datanode all the chunks for which it's not neither a master nor a slave anymore
-    delete('http://{}/recovery'.format(dn), data = {'chunks': json.dumps(chunks_to_flush)})
+    delete('http://{}/recovery'.format(dn), data = {'chunks': json.dumps(chunks_to_flush)}, timeout=timeout)
+    return
+
+
+def start_ec_recovery(cells_to_rebuild):
+    """Function for executing the recovery of erasure coded files after a datanode failure; the lost cells are rebuilt from the surviving cells of their stripes and written into the new choosen datanodes.
+    
+    Parameters
+    ----------
+    cells_to_rebuild --> list, the list of the stripes to rebuild, list of dictionaries with keys data_chunks, parity_chunks, cells (list of tuples (datanode, cell name) for each cell of the stripe, None for the data cells beyond the end of the file) and lost (dict, key: index of the lost cell into the stripe, value: new datanode)
+    
+    Returns
+    -------
+    None
+    """
+    for stripe in cells_to_rebuild:
+        to_read = []
+        for (i, cell) in enumerate(stripe['cells']):
+            if cell is not None and i not in stripe['lost']:
+                to_read.append(([cell[0]], cell[1], i))
+        stripe_cells = read_chunks(to_read)
+        #the data cells beyond the end of the file are empty
+        for (i, cell) in enumerate(stripe['cells']):
+            if cell is None:
+                stripe_cells[i] = b''
+        try:
+            rebuilt = rebuild_stripe(stripe_cells, stripe['data_chunks'], stripe['parity_chunks'])
+        except NotEnoughCellsException as e:
+            logging.critical(e.message)
+            continue
+        #write the rebuilt cells into the new datanodes, the cells have no secondary replicas
+        for i in stripe['lost']:
+            try:
+                write_chunk(stripe['lost'][i], stripe['cells'][i][1], rebuilt[i], [])
+                logging.info('Rebuild cell {} into {}'.format(stripe['cells'][i][1], stripe['lost'][i]))
+            except RequestException as e:
+                logging.error(e)
     return
-        
@@ -1,306 +1,483 @@
 import threading 
 import json
-from requests import put, get, delete, post
+import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from requests import Session
 from requests.exceptions import RequestException
-from exceptions import GetFileException
+from utils import decode_chunk_response, get_hedged_reads, get_hedge_percentile, get_max_concurrency, get_transfer_retries, get_write_acks
 import logging
 
 logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
 
-class WriterThread(threading.Thread): 
-    """Thread Class for writing concurrently the chunks inside the datanodes. The thread will read the next chunk to write from a queue and start the writing process throught REST web services."""
+
+class LatencyTracker():
+    """Class for keeping track of the chunks read latencies of each datanode; an exponentially weighted moving average (EWMA) per datanode allows to choose the fastest replica first, the latencies of the last reads give the threshold after which a read is hedged."""
     
-    def __init__(self, thread_id, queue, lock, content): 
-        threading.Thread.__init__(self) 
-        self.thread_id = thread_id 
-        self.queue = queue 
-        self.lock = lock
-        self.content = content 
+    def __init__(self, alpha=0.2, window=100, penalty=5.0):
+        self.alpha = alpha
+        self.window = window
+        self.penalty = penalty
+        self.ewma = {}
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
         
-    def get_thread_id(self):
-        """Method for getting the 'thread_id' object attribute.
+    def get_alpha(self):
+        """Method for getting the 'alpha' object attribute.
         
         Parameters
         ----------
-        self --> WriterThread class, self reference to the object instance
+        self --> LatencyTracker class, self reference to the object instance
         
         Returns
         -------
-        self.thread_id --> int, the id of the thread
+        self.alpha --> float, the weight of the last latency in the moving average
         """
-        return self.thread_id
+        return self.alpha
       
-    def set_thread_id(self, thread_id):
-        """Method for setting the 'thread_id' object attribute.
+    def set_alpha(self, alpha):
+        """Method for setting the 'alpha' object attribute.
         
         Parameters
         ----------
-        self --> WriterThread class, self reference to the object instance
-        thread_id --> int, the id of the thread
+        self --> LatencyTracker class, self reference to the object instance
+        alpha --> float, the weight of the last latency in the moving average
         
         Returns
         -------
         None
         """
-        self.thread_id = thread_id
+        self.alpha = alpha
         
-    def get_queue(self):
-        """Method for getting the 'queue' object attribute.
+    def get_penalty(self):
+        """Method for getting the 'penalty' object attribute.
         
         Parameters
         ----------
-        self --> WriterThread class, self reference to the object instance
+        self --> LatencyTracker class, self reference to the object instance
         
         Returns
         -------
-        self.queue --> queue.Queue class, the queue of the chunks to write
+        self.penalty --> float, the latency in seconds recorded for a datanode when a read from it fails
         """
-        return self.queue
+        return self.penalty
       
-    def set_queue(self, queue):
-        """Method for setting the 'queue' object attribute.
+    def set_penalty(self, penalty):
+        """Method for setting the 'penalty' object attribute.
         
         Parameters
         ----------
-        self --> WriterThread class, self reference to the object instance
-        queue --> queue.Queue class, the queue of the chunks to write
+        self --> LatencyTracker class, self reference to the object instance
+        penalty --> float, the latency in seconds recorded for a datanode when a read from it fails
         
         Returns
         -------
         None
         """
-        self.queue = queue
-        
-    def get_lock(self):
-        """Method for getting the 'lock' object attribute.
-        
-        Parameters
-        ----------
-        self --> WriterThread class, self reference to the object instance
+        self.penalty = penalty
         
-        Returns
-        -------
-        self.lock --> _thread.lock class
-        """
-        return self.lock
-      
-    def set_lock(self, lock):
-        """Method for setting the 'lock' object attribute.
+    def update(self, dn, seconds):
+        """Method for updating the moving average of a datanode with a new latency.
         
         Parameters
         ----------
-        self --> WriterThread class, self reference to the object instance
-        lock --> _thread.lock class
+        self --> LatencyTracker class, self reference to the object instance
+        dn --> str, the datanode
+        seconds --> float, the latency of the last read from the datanode
         
         Returns
         -------
         None
         """
-        self.lock = lock
-        
-    def get_content(self):
-        """Method for getting the 'content' object attribute.
+        #the first latency of a datanode is its average
+        if dn not in self.ewma:
+            self.ewma[dn] = seconds
+        else:
+            self.ewma[dn] = self.get_alpha()*seconds + (1-self.get_alpha())*self.ewma[dn]
         
-        Parameters
-        ----------
-        self --> WriterThread class, self reference to the object instance
-        
-        Returns
-        -------
-        self.content --> bytes, the file content
-        """
-        return self.content
-      
-    def set_content(self, content):
-        """Method for setting the 'content' object attribute.
+    def record(self, dn, seconds):
+        """Method for recording the latency of a successful read.
         
         Parameters
         ----------
-        self --> WriterThread class, self reference to the object instance
-        content --> bytes, the file content
+        self --> LatencyTracker class, self reference to the object instance
+        dn --> str, the datanode from which the chunk has been read
+        seconds --> float, the latency of the read
         
         Returns
         -------
         None
         """
-        self.content = content
+        with self.lock:
+            self.update(dn, seconds)
+            self.samples.append(seconds)
         
-    def run(self): 
-        """Target method for the class; the thread will get from a queue the next chunk to write and the nodes which must have a copy of the chunk (pimary node and replica nodes) and start the writing process throught REST web services.
+    def record_failure(self, dn):
+        """Method for recording a failed read, the datanode will be tried after the other ones until its next successful reads.
         
         Parameters
         ----------
-        self --> WriterThread class, self reference to the object instance
+        self --> LatencyTracker class, self reference to the object instance
+        dn --> str, the datanode from which the chunk has not been read
         
         Returns
         -------
         None
-        """ 
-        #while the queue of chunks to write is not empty, take the next one and start the writing process
-        while not self.get_queue().empty():
-            #acquire the lock on the queue in order not to create concurrency errors
-            self.get_lock().acquire()
-            [host,chunk,number,start,end,rep] = self.get_queue().get()
-            #release the lock 
-            self.get_lock().release() 
-            try:
-                #call the REST service for writing the current chunk
-                put('http://{}/chunks'.format(host), data={'chunk_replicas': json.dumps(rep), 'chunk_name': chunk, 'chunk_payload': self.get_content()[start:end]})
-            except RequestException as e:
-                logging.error(e)
-            
-            
-class ReaderThread(threading.Thread): 
-    """Thread Class for reading concurrently the chunks content from the datanodes. The thread will read the next chunk to read from a queue and start the reading process throught REST web services."""
-    
-    def __init__(self, thread_id, queue, lock, tot): 
-        threading.Thread.__init__(self) 
-        self.thread_id = thread_id 
-        self.queue = queue
-        self.lock = lock 
-        self.tot = tot
+        """
+        with self.lock:
+            self.update(dn, self.get_penalty())
         
-    def get_thread_id(self):
-        """Method for getting the 'thread_id' object attribute.
+    def sort(self, datanodes):
+        """Method for sorting the datanodes which handle a chunk from the fastest to the slowest; the datanodes never read before are tried first, so that their latency gets known.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
+        self --> LatencyTracker class, self reference to the object instance
+        datanodes --> list, the datanodes which handle the chunk (primary first)
         
         Returns
         -------
-        self.thread_id --> int, the id of the thread
+        sorted(datanodes, key=...) --> list, the datanodes sorted by average latency, the order in input is kept for equal latencies
         """
-        return self.thread_id
-      
-    def set_thread_id(self, thread_id):
-        """Method for setting the 'thread_id' object attribute.
+        with self.lock:
+            return sorted(datanodes, key=lambda dn: self.ewma.get(dn, 0.0))
+        
+    def threshold(self, percentile):
+        """Method for getting the latency after which a read is considered slow.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
-        thread_id --> int, the id of the thread
+        self --> LatencyTracker class, self reference to the object instance
+        percentile --> float, the percentile of the last latencies, between 0 and 100
         
         Returns
         -------
-        None
+        threshold --> float, the latency in seconds, None if there are not enough latencies recorded for estimating it
         """
-        self.thread_id = thread_id
+        with self.lock:
+            #with few reads the percentile is not meaningful, so the reads are not hedged
+            if len(self.samples) < 10:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered)-1, int(len(ordered)*percentile/100))]
+
+
+#the latencies of the datanodes are shared by all the reads of the client
+latencies = LatencyTracker()
+
+
+#the HTTP sessions of the client, each one keeps its connections to the datanodes alive; a session is used by one transfer at a time
+http_sessions = queue.LifoQueue()
+
+
+def acquire_http_session():
+    """Function for taking an HTTP session from the pool of the client, a new one is created if all of them are in use.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    session --> requests.Session class, the HTTP session
+    """
+    try:
+        return http_sessions.get_nowait()
+    except queue.Empty:
+        return Session()
+
+
+def release_http_session(session):
+    """Function for giving back an HTTP session to the pool of the client.
+    
+    Parameters
+    ----------
+    session --> requests.Session class, the HTTP session
+    
+    Returns
+    -------
+    None
+    """
+    http_sessions.put(session)
+
+
+#the requests of the reads run on a pool of their own, so a read running on the transfer pool never waits for a thread of the same pool; each read has at most two requests in flight, the first one and the hedged one
+request_executor = None
+request_executor_lock = threading.Lock()
+
+
+def get_request_executor():
+    """Function for getting the pool of threads which sends the requests of the reads, it's created at the first read.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    request_executor --> concurrent.futures.ThreadPoolExecutor class, the pool shared by all the reads
+    """
+    global request_executor
+    with request_executor_lock:
+        if request_executor is None:
+            request_executor = ThreadPoolExecutor(max_workers=2*get_max_concurrency(), thread_name_prefix='request')
+    return request_executor
+
+
+def request_chunk(dn, c):
+    """Function for requesting a chunk to a datanode, recording the latency of the datanode; the error of a failed read is raised.
+    
+    Parameters
+    ----------
+    dn --> str, the datanode
+    c --> str, the chunk name
+    
+    Returns
+    -------
+    content --> bytes, the chunk payload as it's stored
+    """
+    start = time.perf_counter()
+    session = acquire_http_session()
+    try:
+        #the chunk is required raw, so the datanode streams it from the disk
+        resp = session.get('http://{}/chunks'.format(dn), params={'chunk_name': c, 'raw': 1})
+        #the datanode does not have the chunk
+        resp.raise_for_status()
+        latencies.record(dn, time.perf_counter()-start)
+        return decode_chunk_response(resp.content, resp.headers.get('Content-Type'))
+    except RequestException as e:
+        latencies.record_failure(dn)
+        raise e
+    finally:
+        release_http_session(session)
+
+
+def read_chunk(datanodes, c):
+    """Function for reading a chunk from the fastest datanode which handles it; if the datanode doesn't answer within the hedging threshold, the chunk is requested also to the next one and the first answer is taken; if a datanode fails, the next one is tried. If no datanode answers, the error of the last one is raised, so the transfer executor retries the read and the caller gets the error.
+    
+    Parameters
+    ----------
+    datanodes --> list, the datanodes which handle the chunk (primary first)
+    c --> str, the chunk name
+    
+    Returns
+    -------
+    payload --> bytes, the chunk payload as it's stored
+    """
+    executor = get_request_executor()
+    remaining = latencies.sort(datanodes)
+    threshold = latencies.threshold(get_hedge_percentile()) if get_hedged_reads() else None
+    hedged = False
+    pending = set()
+    error = RequestException('Chunk {} is not handled by any datanode'.format(c))
+    try:
+        while remaining or pending:
+            if not pending:
+                pending.add(executor.submit(request_chunk, remaining.pop(0), c))
+            #only one hedged request is sent for each chunk
+            (done, pending) = wait(pending, timeout=threshold if remaining and not hedged else None, return_when=FIRST_COMPLETED)
+            if not done:
+                logging.info('Hedging the read of chunk {}'.format(c))
+                pending.add(executor.submit(request_chunk, remaining.pop(0), c))
+                hedged = True
+                continue
+            for d in done:
+                try:
+                    return d.result()
+                except RequestException as e:
+                    logging.error(e)
+                    error = e
+        raise error
+    finally:
+        #the slower request is not waited, it ends on the pool (it's cancelled if it has not started yet)
+        for p in pending:
+            p.cancel()
+
+
+def write_chunk(host, chunk, payload, rep):
+    """Function for writing a chunk into its master datanode, which will forward it to the datanodes handling the secondary replicas; the datanode answers when write_acks copies of the chunk have been written.
+    
+    Parameters
+    ----------
+    host --> str, the master datanode of the chunk
+    chunk --> str, the chunk name
+    payload --> bytes, the chunk payload as it will be stored
+    rep --> list, the datanodes which handle the secondary replicas of the chunk
+    
+    Returns
+    -------
+    None
+    """
+    session = acquire_http_session()
+    try:
+        #call the REST service for writing the current chunk, the body is the raw payload so the datanode streams it to the disk
+        resp = session.put('http://{}/chunks'.format(host), params={'chunk_replicas': json.dumps(rep), 'chunk_name': chunk, 'acks': get_write_acks(len(rep)+1)}, data=payload, headers={'Content-Type': 'application/octet-stream'})
+        #the datanode has not written the chunk
+        resp.raise_for_status()
+    finally:
+        release_http_session(session)
+    return
+
+
+class TransferExecutor():
+    """Class for running the chunks transfers (reads and writes) of the client on a long lived pool of threads, shared by all the files; the transfers are retried and their results and errors are given back to the caller through futures."""
+    
+    def __init__(self, max_workers, retries):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='transfer')
+        self.retries = retries
+        #bound the transfers waiting for a thread, so a huge file doesn't fill the memory with pending payloads
+        self.slots = threading.BoundedSemaphore(4*max_workers)
         
-    def get_queue(self):
-        """Method for getting the 'queue' object attribute.
+    def get_executor(self):
+        """Method for getting the 'executor' object attribute.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
+        self --> TransferExecutor class, self reference to the object instance
         
         Returns
         -------
-        self.queue --> queue.Queue class, the queue of the chunks to read
+        self.executor --> concurrent.futures.ThreadPoolExecutor class, the pool of threads
         """
-        return self.queue
+        return self.executor
       
-    def set_queue(self, queue):
-        """Method for setting the 'queue' object attribute.
+    def set_executor(self, executor):
+        """Method for setting the 'executor' object attribute.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
-        queue --> queue.Queue class, the queue of the chunks to read
+        self --> TransferExecutor class, self reference to the object instance
+        executor --> concurrent.futures.ThreadPoolExecutor class, the pool of threads
         
         Returns
         -------
         None
         """
-        self.queue = queue
+        self.executor = executor
         
-    def get_lock(self):
-        """Method for getting the 'lock' object attribute.
+    def get_retries(self):
+        """Method for getting the 'retries' object attribute.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
+        self --> TransferExecutor class, self reference to the object instance
         
         Returns
         -------
-        self.lock --> _thread.lock class
+        self.retries --> int, how many times a failed transfer is retried
         """
-        return self.lock
+        return self.retries
       
-    def set_lock(self, lock):
-        """Method for setting the 'lock' object attribute.
+    def set_retries(self, retries):
+        """Method for setting the 'retries' object attribute.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
-        lock --> _thread.lock class
+        self --> TransferExecutor class, self reference to the object instance
+        retries --> int, how many times a failed transfer is retried
         
         Returns
         -------
         None
         """
-        self.lock = lock
+        self.retries = retries
         
-    def get_tot(self):
-        """Method for getting the 'tot' object attribute.
+    def attempt(self, fn, *args):
+        """Method for running a transfer, retrying it with an exponential backoff if a request fails.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
+        self --> TransferExecutor class, self reference to the object instance
+        fn --> function, the transfer to run
+        args --> the arguments of the transfer
         
         Returns
         -------
-        self.tot --> dict, the total content of the read file
+        fn(*args) --> the result of the transfer
         """
-        return self.tot
-      
-    def set_tot(self, tot):
-        """Method for setting the 'tot' object attribute.
+        for attempt in range(self.get_retries()+1):
+            try:
+                return fn(*args)
+            except RequestException as e:
+                #the last attempt has failed, the error reaches the caller
+                if attempt == self.get_retries():
+                    raise e
+                logging.warning('Transfer failed, retrying: {}'.format(e))
+                time.sleep(0.1*2**attempt)
+        
+    def submit(self, fn, *args):
+        """Method for submitting a transfer to the pool; it blocks while too many transfers are waiting for a thread.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
-        tot --> dict, the total content of the read file
+        self --> TransferExecutor class, self reference to the object instance
+        fn --> function, the transfer to run
+        args --> the arguments of the transfer
         
         Returns
         -------
-        None
+        future --> concurrent.futures.Future class, the future of the transfer
         """
-        self.tot = tot
-        
-    def run(self): 
-        """Target method for the class; the thread will get from a queue the next chunk to read and the list of nodes which have a copy of the chunk (primary and replica nodes) and start the writing process throught REST web services.
+        self.slots.acquire()
+        try:
+            future = self.get_executor().submit(self.attempt, fn, *args)
+        except Exception as e:
+            self.slots.release()
+            raise e
+        future.add_done_callback(lambda f: self.slots.release())
+        return future
+        
+    def run(self, tasks, progress=None):
+        """Method for running a batch of transfers and waiting for all of them.
         
         Parameters
         ----------
-        self --> ReaderThread class, self reference to the object instance
+        self --> TransferExecutor class, self reference to the object instance
+        tasks --> list, tuples which contains (key of the transfer, function, arguments of the function)
+        progress --> function, called as progress(done, total, key) every time a transfer ends, None for not reporting the progress
         
         Returns
         -------
-        None
-        """ 
-        #while the queue of chunks to read is not empty, take the next one and start the reading process
-        while not self.get_queue().empty():
-            #acquire the lock on the queue in order not to create concurrency errors
-            self.get_lock().acquire()
-            [datanodes, c, sn] = self.get_queue().get()
-            #release the lock 
-            self.get_lock().release() 
-            got = False
-            #a chunk can be read not only from the master datanode, but also from the slaves one
-            for dn in datanodes:
-                try:
-                    content = get('http://{}/chunks'.format(dn), params={'chunk_name': c}).content
-                    self.get_tot()[sn] = content[1:-2]
-                    #the chunk content has been got, so stop the reading process for that chunk because it's completed
-                    got = True
-                    break
-                except RequestException as e:
-                    #raise SystemExit(e)
-                    logging.error(e)
-            #if the content of the current chunk has not been got, than raise an exception
-            #the file is corrupted
-            if not got:
-                raise GetFileException()
-                
-                
\ No newline at end of file
+        (results, errors) --> tuple(dict, dict), key: key of the transfer, value: result of the transfer, key: key of the failed transfer, value: the exception raised
+        """
+        futures = {}
+        #the submission is done while the first transfers are already running
+        for (key, fn, args) in tasks:
+            futures[self.submit(fn, *args)] = key
+        results = {}
+        errors = {}
+        done = 0
+        for future in as_completed(futures):
+            key = futures[future]
+            done += 1
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                errors[key] = e
+            if progress is not None:
+                progress(done, len(futures), key)
+        return (results, errors)
+
+
+#the pool is created once and shared by all the transfers of the client
+transfer_executor = None
+transfer_executor_lock = threading.Lock()
+
+
+def get_transfer_executor():
+    """Function for getting the transfer executor of the client, it's created at the first transfer.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    transfer_executor --> TransferExecutor class, the executor shared by all the transfers
+    """
+    global transfer_executor
+    with transfer_executor_lock:
+        if transfer_executor is None:
+            transfer_executor = TransferExecutor(get_max_concurrency(), get_transfer_retries())
+    return transfer_executor
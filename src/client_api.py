@@ -0,0 +1,390 @@
+#example --> client = HMDFSClient('user', 'user1.'); with client.open('/user/file.txt') as f: f.seek(1024); data = f.read(100)
+
+import io
+import shutil
+import tempfile
+import threading
+import time
+import posixpath
+import xmlrpc.client
+import logging
+from pathlib import Path
+import chunks_handler as ch
+import commands_interpreter as ci
+from file_reader import HMDFSFile
+from compression_utils import compress_chunk
+from erasure_coding import encode_stripe
+from utils import get_chunk_size, get_compression_codec, parse_policy, get_deduplication, get_transfer_engine, get_max_concurrency, get_async_concurrency
+
+logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+
+#the errors of the namenode which have a builtin counterpart, raised to the applications instead of the rpc faults
+fault_errors = {
+    'NotFoundException': FileNotFoundError,
+    'AccessDeniedException': PermissionError,
+    'AccessDeniedAtLeastOneException': PermissionError,
+    'AlreadyExistsException': FileExistsError,
+    'AlreadyExistsDirectoryException': IsADirectoryError,
+    'NotDirectoryException': NotADirectoryError
+}
+#how many times a put refused while the garbage collector deletes some of its chunks is retried, and the seconds between the attempts
+collecting_retries = 10
+collecting_pause = 1
+
+
+def read_stripes(stream, codec, ec):
+    """Function for reading a stream one stripe at a time, so only the chunks of a stripe are kept into memory; each data chunk holds exactly get_chunk_size() bytes of the content (except the last one), as split_chunks does.
+
+    Parameters
+    ----------
+    stream --> io.BufferedIOBase class, the content of the file, read from its current position to its end
+    codec --> str, the codec used for compressing the chunks
+    ec --> tuple(int, int), the number of data and parity chunks of each stripe, None if the file is replicated (a stripe is a single chunk)
+
+    Returns
+    -------
+    stripes --> generator, tuple(int, list, list) for each stripe: the size of its content, the payloads of its data chunks and the payloads of its parity chunks
+    """
+    data_chunks = 1 if ec is None else ec[0]
+    while True:
+        (size, payloads) = (0, [])
+        for number in range(data_chunks):
+            piece = b''
+            #a stream can return less bytes than required before its end (e.g. a pipe)
+            while len(piece) < get_chunk_size():
+                data = stream.read(get_chunk_size()-len(piece))
+                if not data:
+                    break
+                piece += data
+            if not piece:
+                break
+            size += len(piece)
+            payloads.append(compress_chunk(piece, codec))
+        if not payloads:
+            return
+        yield (size, payloads, [] if ec is None else encode_stripe(payloads, ec[0], ec[1]))
+        if size < data_chunks*get_chunk_size():
+            return
+
+
+def write_window(chunks_to_write, payloads, replicas, written):
+    """Function for writing the chunks of a window of a file being streamed, skipping the ones already written (e.g. a deduplicated chunk repeated into the file).
+
+    Parameters
+    ----------
+    chunks_to_write --> dict, key: datanode in which to write, value: list of chunks to write, of the whole file (as returned by put_file)
+    payloads --> dict, key: chunk name, value: payload of the chunk, of the window only
+    replicas --> dict, key: chunks, value: list of node which have the replice for the chunk
+    written --> set, the names of the chunks of the file already written, updated with the ones of the window
+
+    Returns
+    -------
+    None
+    """
+    payloads = {c: payloads[c] for c in payloads if c not in written}
+    if not payloads:
+        return
+    window = {host: [c for c in chunks_to_write[host] if c in payloads] for host in chunks_to_write}
+    ch.write_chunks(window, payloads, replicas, progress=None)
+    written.update(payloads)
+
+
+class HMDFSClient():
+    """Class for using the H(M)DFS from a Python application; the client keeps the master namenode, the session and the connection to the namenode across the calls, so each call costs only its own rpc and chunk transfers."""
+
+    def __init__(self, username, password=None):
+        self.username = username
+        self.password = password
+        self.master = None
+        self.groups = []
+        self.proxy = None
+        #the connection to the namenode is used by one call at a time
+        self.lock = threading.Lock()
+        self.connect()
+
+    def get_master(self):
+        """Method for getting the 'master' object attribute.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+
+        Returns
+        -------
+        self.master --> str, the master namenode used by the client
+        """
+        return self.master
+
+    def set_master(self, master):
+        """Method for setting the 'master' object attribute.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        master --> str, the master namenode used by the client
+
+        Returns
+        -------
+        None
+        """
+        self.master = master
+
+    def get_groups(self):
+        """Method for getting the 'groups' object attribute.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+
+        Returns
+        -------
+        self.groups --> list, the groups to which the user belongs
+        """
+        return self.groups
+
+    def set_groups(self, groups):
+        """Method for setting the 'groups' object attribute.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        groups --> list, the groups to which the user belongs
+
+        Returns
+        -------
+        None
+        """
+        self.groups = groups
+
+    def connect(self, refresh=False):
+        """Method for finding the master namenode and opening a session with it; with a password the login is done without asking it, otherwise a session already opened by the user is reused (see commands_interpreter.open_session).
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        refresh --> bool, if True the master namenode is looked for again and a new session is opened
+
+        Returns
+        -------
+        None
+        """
+        master = ci.get_master_namenode(refresh)
+        if master is None:
+            raise ConnectionError('no datanode knows the master namenode')
+        if refresh:
+            ci.save_session(self.username, None)
+        if self.password is not None and (refresh or self.username not in ci.load_sessions()):
+            with xmlrpc.client.ServerProxy('http://{}/'.format(master), allow_none=True) as proxy:
+                session = proxy.login(self.username, self.password)
+            ci.save_session(self.username, session)
+        (loc_namenode, usr) = ci.open_session(self.username, master)
+        if self.proxy is not None:
+            self.proxy('close')()
+        self.proxy = xmlrpc.client.ServerProxy(loc_namenode, allow_none=True)
+        self.master = master
+        self.groups = usr['groups']
+
+    def call(self, method, *args):
+        """Method for calling a rpc function of the master namenode; if the namenode is down, it's not the master anymore or the session has expired, the client connects again and the call is retried once.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        method --> str, the name of the rpc function
+        args --> the arguments of the rpc function
+
+        Returns
+        -------
+        result --> the result of the rpc function
+        """
+        for retry in [False, True]:
+            try:
+                with self.lock:
+                    return getattr(self.proxy, method)(*args)
+            except OSError as e:
+                if retry:
+                    raise e
+            except xmlrpc.client.Fault as err:
+                if retry or ('NotMasterException' not in err.faultString and 'InvalidSessionException' not in err.faultString):
+                    #the errors about the resources are raised as the builtin ones
+                    for name in fault_errors:
+                        if "exceptions.{}'".format(name) in err.faultString:
+                            raise fault_errors[name](err.faultString.split(':', 1)[-1])
+                    raise err
+            logging.warning('Connecting again to the master namenode')
+            self.connect(True)
+
+    def stat(self, path):
+        """Method for getting the metadata of a file or a directory.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        path --> str, the absolute path to the resource
+
+        Returns
+        -------
+        stat --> dict, the object which represents the resource (name, type, size, owner, group, mode, creation...)
+        """
+        path = Path(path)
+        #the root directory is not into any directory
+        if path.name == '':
+            return {'name': '/', 'type': 'd'}
+        for r in self.call('ls', str(path.parent), self.username, self.groups):
+            if r['name'] == path.name:
+                return r
+        raise FileNotFoundError(str(path))
+
+    def listdir(self, path):
+        """Method for getting the names of the files and of the directories into a directory.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        path --> str, the absolute path to the directory
+
+        Returns
+        -------
+        names --> list, the names of the resources into the directory
+        """
+        if self.stat(path)['type'] != 'd':
+            raise NotADirectoryError(path)
+        return [r['name'] for r in self.call('ls', path, self.username, self.groups)]
+
+    def walk(self, top):
+        """Method for walking a directory tree as os.walk does, top-down; the whole tree is got with a single rpc, the directory names yielded can be removed for not walking into them.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        top --> str, the absolute path to the directory
+
+        Returns
+        -------
+        (dirpath, dirnames, filenames) --> generator of tuple(str, list, list), for each directory its path, the names of its subdirectories and the names of its files
+        """
+        tree = self.call('get_tree', top, self.username, self.groups)
+        dirnames = {d: [] for d in tree['directories']}
+        filenames = {d: [] for d in tree['directories']}
+        for d in tree['directories']:
+            if d != '.':
+                dirnames[posixpath.dirname(d) or '.'].append(posixpath.basename(d))
+        for f in tree['files']:
+            filenames[posixpath.dirname(f['path']) or '.'].append(posixpath.basename(f['path']))
+
+        def walk_dir(d):
+            yield (posixpath.normpath(posixpath.join(top, d)), dirnames[d], filenames[d])
+            for name in dirnames[d]:
+                yield from walk_dir(posixpath.normpath(posixpath.join(d, name)))
+
+        return walk_dir('.')
+
+    def open(self, path, mode='rb', buffering=-1):
+        """Method for opening a file of the H(M)DFS for reading.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        path --> str, the absolute path to the file
+        mode --> str, only rb is supported, the files are written with write_stream
+        buffering --> int, the size of the read buffer, -1 for a chunk, 0 for no buffer
+
+        Returns
+        -------
+        f --> io.BufferedReader class, a seekable binary file object (HMDFSFile if buffering is 0)
+        """
+        if mode != 'rb':
+            raise ValueError('invalid mode: {}, only rb is supported'.format(mode))
+        raw = HMDFSFile(self.call('get_file', path, self.username, self.groups))
+        if buffering == 0:
+            return raw
+        return io.BufferedReader(raw, buffer_size=get_chunk_size() if buffering < 0 else buffering)
+
+    def write_stream(self, path, stream, policy=None):
+        """Method for putting a file into the H(M)DFS from a binary stream (or bytes) without keeping the file into memory: the stream is read twice one stripe at a time, first for sizing and hashing the chunks allocated by the namenode, then for writing them a window at a time. A stream which can't seek is spooled into a temporary file first; the content must not change while it's written.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+        path --> str, the absolute path to the new file
+        stream --> io.BufferedIOBase class or bytes, the content of the file, read from its current position
+        policy --> str, the storage policy of the file, if None the one of the directory is inherited
+
+        Returns
+        -------
+        fid --> str, the MongoDB object id of the file
+        """
+        if isinstance(stream, (bytes, bytearray)):
+            stream = io.BytesIO(stream)
+        elif not (hasattr(stream, 'seekable') and stream.seekable()):
+            spool = tempfile.SpooledTemporaryFile(max_size=get_chunk_size())
+            shutil.copyfileobj(stream, spool, get_chunk_size())
+            spool.seek(0)
+            with spool:
+                return self.write_stream(path, spool, policy)
+        codec = get_compression_codec()
+        if policy is None:
+            policy = self.call('get_policy', path, self.username, self.groups)
+        ec = parse_policy(policy)
+        dedup = ec is None and get_deduplication()
+        start = stream.tell()
+        (size, stored_size, hashes, data_chunks) = (0, 0, [], 0)
+        for (stripe_size, payloads, parity) in read_stripes(stream, codec, ec):
+            size += stripe_size
+            stored_size += sum(len(p) for p in payloads+parity)
+            data_chunks += len(payloads)
+            if dedup:
+                hashes.extend(ch.hash_chunk(p) for p in payloads)
+        hashes = hashes if dedup else None
+        for attempt in range(collecting_retries):
+            try:
+                (fid, chunks_to_write, replicas) = self.call('put_file', path, size, self.username, self.groups, codec, stored_size, policy, hashes)
+                break
+            except xmlrpc.client.Fault as err:
+                if 'ChunksCollectingException' not in err.faultString or attempt == collecting_retries-1:
+                    raise err
+                time.sleep(collecting_pause)
+        #the chunks are written a window at a time, enough to keep the transfer engine busy
+        window_size = 2*(get_async_concurrency() if get_transfer_engine() == 'asyncio' else get_max_concurrency())
+        stream.seek(start)
+        (window, written, number) = ({}, set(), 0)
+        for (stripe, (stripe_size, payloads, parity)) in enumerate(read_stripes(stream, codec, ec)):
+            for p in payloads:
+                if number >= data_chunks or (dedup and ch.hash_chunk(p) != hashes[number]):
+                    raise IOError('File {} not written: the stream has changed while it was written'.format(path))
+                window[hashes[number] if dedup else '{}_{}'.format(fid, number)] = p
+                number += 1
+            #the parity chunks follow all the data chunks of the file
+            for (j, p) in enumerate(parity):
+                window['{}_{}'.format(fid, data_chunks+stripe*ec[1]+j)] = p
+            if len(window) >= window_size:
+                write_window(chunks_to_write, window, replicas, written)
+                window = {}
+        write_window(chunks_to_write, window, replicas, written)
+        if number != data_chunks:
+            raise IOError('File {} not written: the stream has changed while it was written'.format(path))
+        #the deduplicated chunks written can be shared with the other files only now that the datanodes have acknowledged them
+        if hashes is not None:
+            self.call('commit_chunks', [fid], self.username, self.groups)
+        return fid
+
+    def close(self):
+        """Method for closing the connection to the namenode.
+
+        Parameters
+        ----------
+        self --> HMDFSClient class, self reference to the object instance
+
+        Returns
+        -------
+        None
+        """
+        if self.proxy is not None:
+            self.proxy('close')()
+            self.proxy = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -61,3 +61,156 @@ def get_trash(client):
     metadatafs = client['metadatafs']
     return metadatafs['trash']
 
+
+def get_deletions(client):
+    """Return the db containing the queue of the chunks to delete from the datanodes, the prefixes of the files removed for each datanode.
+    
+    Parameters
+    ----------
+    client --> pymongo.mongo_client.MongoClient class, MongoDB client
+    
+    Returns
+    -------
+    metadatafs['deletions'] --> pymongo.collection.Collection, reference to collection deletions
+    """
+    #get the MongoDb collection called "deletions"
+    metadatafs = client['metadatafs']
+    return metadatafs['deletions']
+
+
+def get_chunks_store(client):
+    """Return the db containing the content addressed chunks, with their reference counts and the datanodes which handle them.
+    
+    Parameters
+    ----------
+    client --> pymongo.mongo_client.MongoClient class, MongoDB client
+    
+    Returns
+    -------
+    metadatafs['chunks'] --> pymongo.collection.Collection, reference to collection chunks
+    """
+    #get the MongoDb collection called "chunks"
+    metadatafs = client['metadatafs']
+    return metadatafs['chunks']
+
+
+class JournaledCollection:
+    """Class which wraps a MongoDB collection, recording into a journal how to undo every write done through it (the documents inserted and the previous version of the documents updated or deleted)."""
+
+    def __init__(self, collection, journal):
+        self.collection = collection
+        self.journal = journal
+
+    def __getattr__(self, name):
+        #the reads are not recorded
+        return getattr(self.collection, name)
+
+    def insert_one(self, document, *args, **kwargs):
+        res = self.collection.insert_one(document, *args, **kwargs)
+        self.journal.append(('inserted', self.collection, res.inserted_id))
+        return res
+
+    def insert_many(self, documents, *args, **kwargs):
+        res = self.collection.insert_many(documents, *args, **kwargs)
+        for inserted_id in res.inserted_ids:
+            self.journal.append(('inserted', self.collection, inserted_id))
+        return res
+
+    def update_one(self, condition, update, *args, **kwargs):
+        previous = self.collection.find_one(condition)
+        res = self.collection.update_one(condition, update, *args, **kwargs)
+        if previous is not None:
+            self.journal.append(('updated', self.collection, previous))
+        #the update has inserted a new document
+        elif res.upserted_id is not None:
+            self.journal.append(('inserted', self.collection, res.upserted_id))
+        return res
+
+    def update_many(self, condition, update, *args, **kwargs):
+        previous = list(self.collection.find(condition))
+        res = self.collection.update_many(condition, update, *args, **kwargs)
+        for doc in previous:
+            self.journal.append(('updated', self.collection, doc))
+        return res
+
+    def delete_one(self, condition, *args, **kwargs):
+        previous = self.collection.find_one(condition)
+        res = self.collection.delete_one(condition, *args, **kwargs)
+        if previous is not None:
+            self.journal.append(('updated', self.collection, previous))
+        return res
+
+    def delete_many(self, condition, *args, **kwargs):
+        previous = list(self.collection.find(condition))
+        res = self.collection.delete_many(condition, *args, **kwargs)
+        for doc in previous:
+            self.journal.append(('updated', self.collection, doc))
+        return res
+
+
+class JournaledClient:
+    """Class which wraps a MongoDB client, so that the writes done by the fs_handler functions can be undone (used for the batches of operations); the database is not locked, the writes of the other clients are not isolated from the ones recorded."""
+
+    def __init__(self, client):
+        self.client = client
+        self.journal = []
+
+    def __getitem__(self, name):
+        return JournaledDatabase(self.client[name], self.journal)
+
+    def get_journal(self):
+        """Method for getting the 'journal' object attribute.
+
+        Parameters
+        ----------
+        self --> JournaledClient class, self reference to the object instance
+
+        Returns
+        -------
+        self.journal --> list, tuples which contains (kind of write, collection, inserted id or previous version of the document), in the order the writes have been done
+        """
+        return self.journal
+
+    def set_journal(self, journal):
+        """Method for setting the 'journal' object attribute.
+
+        Parameters
+        ----------
+        self --> JournaledClient class, self reference to the object instance
+        journal --> list, tuples which contains (kind of write, collection, inserted id or previous version of the document)
+
+        Returns
+        -------
+        None
+        """
+        self.journal = journal
+
+    def rollback(self, since=0):
+        """Method for undoing the writes recorded into the journal, the last one first.
+
+        Parameters
+        ----------
+        self --> JournaledClient class, self reference to the object instance
+        since --> int, the position into the journal of the first write to undo
+
+        Returns
+        -------
+        None
+        """
+        while len(self.journal) > since:
+            (kind, collection, doc) = self.journal.pop()
+            if kind == 'inserted':
+                collection.delete_one({'_id': doc})
+            else:
+                collection.replace_one({'_id': doc['_id']}, doc, upsert=True)
+
+
+class JournaledDatabase:
+    """Class which wraps a MongoDB database, its collections are journaled."""
+
+    def __init__(self, database, journal):
+        self.database = database
+        self.journal = journal
+
+    def __getitem__(self, name):
+        return JournaledCollection(self.database[name], self.journal)
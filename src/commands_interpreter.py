@@ -6,14 +6,20 @@ from pathlib import Path
 from itertools import product
 import xmlrpc.client
 import logging
+import time
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 import fs_handler as fsh
 import initializer as ini
 import users_groups_handler as ugh
 from collections_handler import get_users
-from exceptions import InvalidSyntaxException, CommandNotFoundException, UserNotFoundException, AccessDeniedException, NotFoundException, RootNecessaryException, NotDirectoryException, NotParentException, AlreadyExistsException, NotEmptyException, AccessDeniedAtLeastOneException, InvalidModException, GroupAlreadyExistsException, UserAlreadyExistsException, GroupNotFoundException, MainUserGroupException
+from exceptions import GetFileException, PutFileException, InvalidPolicyException, InvalidSyntaxException, CommandNotFoundException, UserNotFoundException, AccessDeniedException, NotFoundException, RootNecessaryException, NotDirectoryException, NotParentException, AlreadyExistsException, NotEmptyException, AccessDeniedAtLeastOneException, InvalidModException, GroupAlreadyExistsException, UserAlreadyExistsException, GroupNotFoundException, MainUserGroupException
 import chunks_handler as ch
-from utils import get_chunk_size, get_datanodes, get_namenodes
+from compression_utils import decompress_chunk
+from file_reader import HMDFSFile
+from chunks_cache import get_chunk_cache
+from utils import get_chunk_size, get_datanodes, get_namenodes, get_compression_codec, get_deduplication, get_data_chunks, parse_policy, get_batch_size, get_master_cache_ttl, get_master_lookup_timeout, TimeoutTransport
 
 logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
 #get datanodes and namenodes settings
@@ -134,7 +140,7 @@ def rm(cmd, grp, loc_namenode):
     #call the rm command with a rpc
     with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
         try:
-            (deleted, hosts) = proxy.rm(path, required_by, grp) #no print
+            proxy.rm(path, required_by, grp) #no print
         except xmlrpc.client.Fault as err:
             #the user is not allowed to remove
             if 'AccessDeniedException' in err.faultString:
@@ -149,9 +155,7 @@ def rm(cmd, grp, loc_namenode):
             if 'RootDirectoryException' in err.faultString:
                 logging.warning(err.faultString)
             return
-    #if some file has been deleted, delete the chunks from the datanodes 
-    if deleted:
-        ch.delete_chunks(deleted, hosts)
+    #the chunks of the files deleted are deleted in background by the datanodes, the namenode has queued them with the metadata
     return
 
 
@@ -172,7 +176,7 @@ def rmr(cmd, grp, loc_namenode):
     #call the rm command with a rpc
     with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
         try:
-            (deleted,hosts) = proxy.rmr(path, required_by, grp) #no print
+            proxy.rmr(path, required_by, grp) #no print
         except xmlrpc.client.Fault as err:
             #the user is not allowed to remove the directory inserted
             if 'AccessDeniedException' in err.faultString:
@@ -187,9 +191,7 @@ def rmr(cmd, grp, loc_namenode):
             if 'RootDirectoryException' in err.faultString:
                 logging.warning(err.faultString)
             return
-    #if some file has been deleted, delete the chunks from the datanodes 
-    if deleted:
-        ch.delete_chunks(deleted, hosts)
+    #the chunks of the files deleted are deleted in background by the datanodes, the namenode has queued them with the metadata
     return
 
 
@@ -219,18 +221,12 @@ def get_file(cmd, grp, loc_namenode):
             if 'NotFoundException' in err.faultString:
                 logging.warning(err.faultString)
             return
-    chunks = []
-    #create the list of the chunks and the datanodes which handle the replicas of every chunk
-    for dn in file['chunks']:
-        for c in file['chunks'][dn]:
-            datanodes = [dn] + file['replicas'][c]
-            #insert into the list the chunk, the list of the datanodes which handle the chunk and the sequence number
-            chunks.append((datanodes,c,int(c.split('_')[1])))
-    #sort in base on the sequence number
-    chunks.sort(key = lambda x: x[2])
+    #create the list of the chunks and the datanodes which handle the replicas of every chunk, sorted in base on the sequence number
+    #the parity chunks of an erasure coded file are not part of the content
+    chunks = get_data_chunks(file)
     #get the content of every chunk which composes the entire file
     try:
-        tot = ch.get_chunks(chunks)
+        tot = ch.get_file_chunks(file, chunks)
     except GetFileException as e:
         logging.warning(e.message)
         return
@@ -245,6 +241,115 @@ def get_file(cmd, grp, loc_namenode):
     return
 
 
+def get_batch(batch, local_path):
+    """Function for getting a batch of files of get_dir: the chunks of all the files are read together by the transfer engine and each file is written into the local tree when it's complete.
+    
+    Parameters
+    ----------
+    batch --> list, the objects which represent the files, as returned by get_tree
+    local_path --> str, the local directory in which the tree is written
+    
+    Returns
+    -------
+    got --> int, the number of files got
+    """
+    chunks = []
+    #the chunks of different files are keyed by the index of the file and their sequence number
+    for (i, file) in enumerate(batch):
+        chunks.extend([(dn, c, (i, sn)) for (dn, c, sn) in get_data_chunks(file)])
+    tot = ch.read_chunks(chunks)
+    got = 0
+    for (i, file) in enumerate(batch):
+        data = get_data_chunks(file)
+        content = {sn: tot[(i, sn)] for (dn, c, sn) in data if (i, sn) in tot}
+        try:
+            if len(content) == len(data):
+                content = {sn: decompress_chunk(content[sn], file.get('codec', 'none')) for sn in content}
+            #some chunks have not been read, they are reconstructed as get_file does (or the file is corrupted)
+            else:
+                content = ch.get_file_chunks(file, data)
+        except GetFileException as e:
+            logging.warning('{} not got: {}'.format(file['path'], e.message))
+            continue
+        #the file is written with a temporary name, so a file with its own name is always complete
+        file_path = os.path.normpath(os.path.join(local_path, file['path']))
+        try:
+            with open(file_path + '.part', 'wb') as lf:
+                for k in sorted(content.keys()):
+                    lf.write(content[k])
+            os.replace(file_path + '.part', file_path)
+        except Exception as e:
+            logging.warning(e)
+            continue
+        got += 1
+    return got
+
+
+def get_dir(cmd, grp, loc_namenode):
+    """Allow to execute get_dir command.
+    
+    Parameters
+    ----------
+    cmd --> str, the command
+    grp --> list, the list of groups to which the user belongs
+    loc_namenode --> str, the master namenode in the moment in which the command has been invoked
+    
+    Returns
+    -------
+    None
+    """
+    f, required_by, path, local_path = cmd.split()
+    #get the metadata of the whole tree with a rpc
+    with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+        try:
+            tree = proxy.get_tree(path, required_by, grp)
+        except xmlrpc.client.Fault as err:
+            #the user is not allowed to get the directory
+            if 'AccessDeniedException' in err.faultString:
+                logging.warning(err.faultString)
+            #the user is not allowed to get at least one resource into the directory
+            if 'AccessDeniedAtLeastOneException' in err.faultString:
+                logging.warning(err.faultString)
+            #the directory does not exist
+            if 'NotFoundException' in err.faultString:
+                logging.warning(err.faultString)
+            #the path is a file
+            if 'NotDirectoryException' in err.faultString:
+                logging.warning(err.faultString)
+            return
+    #create the local tree, parents first
+    try:
+        for d in tree['directories']:
+            os.makedirs(os.path.join(local_path, d), exist_ok=True)
+    except Exception as e:
+        logging.warning(e)
+        return
+    #the files already got completely (e.g. by an interrupted get_dir) are skipped
+    files = []
+    for file in tree['files']:
+        file_path = os.path.normpath(os.path.join(local_path, file['path']))
+        if not os.path.isfile(file_path) or os.path.getsize(file_path) != file['size']:
+            files.append(file)
+    if len(files) < len(tree['files']):
+        logging.info('{} files already got, skipped'.format(len(tree['files'])-len(files)))
+    #the files are got in batches, the content of a batch is kept in memory until its files are written
+    got = 0
+    batch = []
+    batch_size = 0
+    for file in files:
+        if batch and batch_size+file['size'] > get_batch_size():
+            got += get_batch(batch, local_path)
+            logging.info('{}/{} files got'.format(got, len(files)))
+            batch = []
+            batch_size = 0
+        batch.append(file)
+        batch_size += file['size']
+    if batch:
+        got += get_batch(batch, local_path)
+    logging.info('{}/{} files got'.format(got, len(files)))
+    return
+
+
 def get_chunks(cmd, grp, loc_namenode):
     """Allow to get the chunks of a file and to print on the console.
     
@@ -307,24 +412,14 @@ def cat(cmd, grp, loc_namenode):
             if 'NotFoundException' in err.faultString:
                 logging.warning(err.faultString)
             return
-    chunks = []
-    #create the list of the chunks and the datanodes which handle the replicas of every chunk
-    for dn in file['chunks']:
-        for c in file['chunks'][dn]:
-            datanodes = [dn] + file['replicas'][c]
-            #insert into the list the chunk, the list of the datanodes which handle the chunk and the sequence number
-            chunks.append((datanodes,c,int(c.split('_')[1])))
-    #sort in base on the sequence number
-    chunks.sort(key = lambda x: x[2])
-    #get the content of every chunk which composes the entire file
+    #print the content of every chunk in output as soon as it's got, while the next chunks are read ahead
     try:
-        tot = ch.get_chunks(chunks)
-    except GetFileException as e:
-        logging.warning(e.message)
+        with HMDFSFile(file) as f:
+            for content in iter(lambda: f.read(get_chunk_size()), b''):
+                print(content.decode('ISO-8859-1'), end='')
+    except IOError as e:
+        logging.warning(e)
         return
-    #print the content of the chunks in ouput
-    for k in sorted(tot.keys()):
-        print(tot[k].decode('ISO-8859-1'), end='')
     print('')
     return
 
@@ -357,22 +452,16 @@ def head(cmd, grp, loc_namenode):
             if 'NotFoundException' in err.faultString:
                 logging.warning(err.faultString)
             return
-    chunks = []
-    #create the list of the chunks and the datanodes which handle the replicas of every chunk
-    for dn in file['chunks']:
-        for c in file['chunks'][dn]:
-            datanodes = [dn] + file['replicas'][c]
-            #insert into the list the chunk, the list of the datanodes which handle the chunk and the sequence number
-            chunks.append((datanodes,c,int(c.split('_')[1])))
-    #sort in base on the sequence number
-    chunks.sort(key = lambda x: x[2])
+    #create the list of the chunks and the datanodes which handle the replicas of every chunk, sorted in base on the sequence number
+    #the parity chunks of an erasure coded file are not part of the content
+    chunks = get_data_chunks(file)
     #the number of chunks which contain the bytes the user want to read
     n_chunks = int(n_bytes/get_chunk_size())
     #the number of remaning bytes which don't fit into the last chunk
     remain_bytes = n_bytes%get_chunk_size()
     #get the content of chunks selected
     try:
-        tot = ch.get_chunks(chunks[:n_chunks+1])
+        tot = ch.get_file_chunks(file, chunks[:n_chunks+1])
     except GetFileException as e:
         logging.warning(e.message)
         return
@@ -414,22 +503,16 @@ def tail(cmd, grp, loc_namenode):
             if 'NotFoundException' in err.faultString:
                 logging.warning(err.faultString)
             return
-    chunks = []
-    #create the list of the chunks and the datanodes which handle the replicas of every chunk
-    for dn in file['chunks']:
-        for c in file['chunks'][dn]:
-            datanodes = [dn] + file['replicas'][c]
-            #insert into the list the chunk, the list of the datanodes which handle the chunk and the sequence number
-            chunks.append((datanodes,c,int(c.split('_')[1])))
-    #sort in base on the sequence number
-    chunks.sort(key = lambda x: x[2])
+    #create the list of the chunks and the datanodes which handle the replicas of every chunk, sorted in base on the sequence number
+    #the parity chunks of an erasure coded file are not part of the content
+    chunks = get_data_chunks(file)
     #the number of chunks which contain the bytes the user want to read
     n_chunks = int(n_bytes/get_chunk_size())
     #the number of remaning bytes which don't fit into the last chunk
     remain_bytes = n_bytes%get_chunk_size()
     #get the content of chunks selected
     try:
-        tot = ch.get_chunks(chunks[-(n_chunks+1):])
+        tot = ch.get_file_chunks(file, chunks[-(n_chunks+1):])
     except GetFileException as e:
         logging.warning(e.message)
         return 
@@ -604,11 +687,13 @@ def du(cmd, grp, loc_namenode):
     -------
     None
     """
-    f, required_by, path = cmd.split()
+    f, required_by, path, *flag = cmd.split()
+    #S --> size of the (compressed) chunks stored into the datanodes, L (default) --> logical size of the files
+    stored = flag == ['S']
     #call the du command with a rpc
     with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
         try:
-            size = proxy.du(path, required_by, grp) #gives back result
+            size = proxy.du(path, required_by, grp, stored) #gives back result
             print('total size: {} B'.format(size))
         except xmlrpc.client.Fault as err:
             #the user is not allowed to get the disk usage for the directory/file
@@ -731,7 +816,7 @@ def put_file(cmd, grp, loc_namenode):
     -------
     None
     """
-    f, required_by, local_file_path, file_path = cmd.split()
+    f, required_by, local_file_path, file_path, *policy = cmd.split()
     #get the binary content of the local file 
     try:
         size = os.path.getsize(local_file_path)
@@ -740,10 +825,27 @@ def put_file(cmd, grp, loc_namenode):
     except Exception as e:
         logging.warning(e)
         return
-    #call the put_file command with a rpc
-    with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+    codec = get_compression_codec()
+    with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+        #without an explicit storage policy, the file inherits the one of the directory in which it's put
+        if policy:
+            policy = policy[0]
+        else:
+            try:
+                policy = proxy.get_policy(file_path, required_by, grp)
+            except xmlrpc.client.Fault as err:
+                logging.warning(err.faultString)
+                return
+        #parse the storage policy of the file
         try:
-            (fid,chunks_to_write, replicas) = proxy.put_file(file_path, size, required_by, grp)
+            ec = parse_policy(policy)
+        except InvalidPolicyException as e:
+            logging.warning(e.message)
+            return
+        (payloads, stored_size, hashes) = prepare_chunks(content, codec, ec)
+        #call the put_file command with a rpc
+        try:
+            (fid,chunks_to_write, replicas) = proxy.put_file(file_path, size, required_by, grp, codec, stored_size, policy, hashes)
         except xmlrpc.client.Fault as err:
             #the user is not allowed to put the local file into the inserted path
             if 'AccessDeniedException' in err.faultString:
@@ -757,9 +859,269 @@ def put_file(cmd, grp, loc_namenode):
             #a directory with the same name of the file already exists
             if 'AlreadyExistsDirectoryException' in err.faultString:
                 logging.warning(err.faultString)
+            #the codec used for compressing the chunks is not available on the namenode
+            if 'CodecNotFoundException' in err.faultString:
+                logging.warning(err.faultString)
             return
     #write the content of the local file into the datanodes
-    ch.write_chunks(chunks_to_write, content, replicas)
+    try:
+        ch.write_chunks(chunks_to_write, name_payloads(fid, payloads, hashes), replicas)
+    except PutFileException as e:
+        logging.warning(e.message)
+        return
+    #the deduplicated chunks written can be shared with the other files only now that the datanodes have acknowledged them
+    if hashes is not None:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+            proxy.commit_chunks([fid], required_by, grp)
+    return
+
+
+def prepare_chunks(content, codec, ec):
+    """Function for preparing the chunks of a file before putting it: the content is split into chunks compressed with the codec, the parity chunks are added for an erasure coded file and the chunks are hashed if they must be deduplicated.
+    
+    Parameters
+    ----------
+    content --> bytes, the content of the file
+    codec --> str, the codec used for compressing the chunks
+    ec --> tuple(int, int), the number of data and parity chunks of each stripe, None if the file is replicated
+    
+    Returns
+    -------
+    (payloads, stored_size, hashes) --> tuple(list, int, list), the payloads of the chunks in order, their total size, their hashes (None if the chunks are not deduplicated)
+    """
+    #split the content into chunks and compress each of them with the configured codec
+    payloads = ch.split_chunks(content, codec)
+    #for an erasure coded file, compute the parity chunks of every stripe
+    if ec is not None:
+        payloads.extend(ch.encode_parity(payloads, ec[0], ec[1]))
+    stored_size = sum(len(p) for p in payloads)
+    #the chunks of a replicated file can be deduplicated, they are addressed by the hash of their payload
+    hashes = [ch.hash_chunk(p) for p in payloads] if ec is None and get_deduplication() else None
+    return (payloads, stored_size, hashes)
+
+
+def name_payloads(fid, payloads, hashes):
+    """Function for naming each payload of a file as the chunk it will be written into.
+    
+    Parameters
+    ----------
+    fid --> str, the MongoDB object id of the file
+    payloads --> list, the payloads of the chunks of the file, in order
+    hashes --> list, the hashes of the payloads, None if the chunks are not deduplicated
+    
+    Returns
+    -------
+    payloads --> dict, key: chunk name, value: payload of the chunk, in order
+    """
+    #only the chunks not already stored are returned by the namenode for a deduplicated file
+    if hashes is not None:
+        return dict(zip(hashes, payloads))
+    return {'{}_{}'.format(fid, number): p for (number, p) in enumerate(payloads)}
+
+
+def put_batch(proxy, batch, policies, policy, required_by, grp):
+    """Function for putting a batch of files of put_dir: the chunks of all the files are allocated with a single rpc and written together by the transfer engine.
+    
+    Parameters
+    ----------
+    proxy --> xmlrpc.client.ServerProxy class, the proxy of the master namenode
+    batch --> list, tuples which contains (local path, path, size) of each file
+    policies --> dict, key: path of a directory, value: its storage policy
+    policy --> str, the storage policy of all the files, if None each file inherits the one of its directory
+    required_by --> str, user who required the operation
+    grp --> list, the list of groups to which the user belongs
+    
+    Returns
+    -------
+    put --> int, the number of files put, whose chunks have all been written (and committed, if deduplicated)
+    """
+    codec = get_compression_codec()
+    files = []
+    contents = []
+    #the size of a file is the one of the content read, the file could have changed since the batch was made
+    for (local_file_path, file_path, listed_size) in batch:
+        try:
+            with open(local_file_path, 'rb') as lf:
+                content = lf.read()
+        except Exception as e:
+            logging.warning(e)
+            continue
+        file_policy = policy if policy is not None else policies[str(Path(file_path).parent)]
+        (payloads, stored_size, hashes) = prepare_chunks(content, codec, parse_policy(file_policy))
+        files.append({'path': file_path, 'size': len(content), 'codec': codec, 'stored_size': stored_size, 'policy': file_policy, 'hashes': hashes})
+        contents.append(payloads)
+    #allocate the chunks of all the files with a rpc
+    try:
+        results = proxy.put_files(files, required_by, grp)
+    except xmlrpc.client.Fault as err:
+        #e.g. the namenode is not the master anymore or the session has expired
+        logging.warning(err.faultString)
+        return 0
+    except OSError:
+        logging.error('namenode down')
+        return 0
+    chunks_to_write = {}
+    replicas = {}
+    payloads = {}
+    allocated = 0
+    for (f, p, r) in zip(files, contents, results):
+        #the file has not been put, e.g. it already exists
+        if 'error' in r:
+            logging.warning('{} not put: {}'.format(f['path'], r['error']))
+            continue
+        payloads.update(name_payloads(r['fid'], p, f['hashes']))
+        for host in r['chunks']:
+            chunks_to_write.setdefault(host, []).extend(r['chunks'][host])
+        replicas.update(r['replicas'])
+        allocated += 1
+    #write the chunks of all the files of the batch into the datanodes
+    try:
+        ch.write_chunks(chunks_to_write, payloads, replicas, progress=None)
+    except PutFileException as e:
+        logging.warning(e.message)
+        return 0
+    #the deduplicated chunks written can be shared with the other files only now that the datanodes have acknowledged them
+    fids = [r['fid'] for (f, r) in zip(files, results) if 'error' not in r and f['hashes'] is not None]
+    if len(fids) > 0:
+        try:
+            proxy.commit_chunks(fids, required_by, grp)
+        except xmlrpc.client.Fault as err:
+            logging.warning(err.faultString)
+            return allocated-len(fids)
+        except OSError:
+            logging.error('namenode down')
+            return allocated-len(fids)
+    return allocated
+
+
+def put_dir(cmd, grp, loc_namenode):
+    """Allow to execute put_dir command.
+    
+    Parameters
+    ----------
+    cmd --> str, the command
+    grp --> list, the list of groups to which the user belongs
+    loc_namenode --> str, the master namenode in the moment in which the command has been invoked
+    
+    Returns
+    -------
+    None
+    """
+    f, required_by, local_dir_path, dir_path, *policy = cmd.split()
+    policy = policy[0] if policy else None
+    try:
+        parse_policy(policy)
+    except InvalidPolicyException as e:
+        logging.warning(e.message)
+        return
+    if not os.path.isdir(local_dir_path):
+        logging.warning('{} is not a directory'.format(local_dir_path))
+        return
+    #walk the local tree, each directory is listed before its children
+    directories = []
+    files = []
+    for (curr_dir, dirs, names) in os.walk(local_dir_path):
+        dirs.sort()
+        relative = os.path.relpath(curr_dir, local_dir_path)
+        curr_path = Path(dir_path) if relative == '.' else Path(dir_path).joinpath(relative)
+        directories.append(str(curr_path))
+        for name in sorted(names):
+            files.append((os.path.join(curr_dir, name), str(curr_path.joinpath(name))))
+    with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+        #create all the directories with a rpc
+        try:
+            policies = proxy.mkdirs(directories, required_by, grp)
+        except xmlrpc.client.Fault as err:
+            #the user is not allowed to create the directories
+            if 'AccessDeniedException' in err.faultString:
+                logging.warning(err.faultString)
+            #a file with the same name of a directory already exists
+            if 'NotDirectoryException' in err.faultString:
+                logging.warning(err.faultString)
+            return
+        #the files are put in batches, the content of a batch is kept in memory until its chunks are written
+        put = 0
+        batch = []
+        batch_size = 0
+        for (local_file_path, file_path) in files:
+            try:
+                size = os.path.getsize(local_file_path)
+            except Exception as e:
+                logging.warning(e)
+                continue
+            if batch and batch_size+size > get_batch_size():
+                put += put_batch(proxy, batch, policies, policy, required_by, grp)
+                logging.info('{}/{} files put'.format(put, len(files)))
+                batch = []
+                batch_size = 0
+            batch.append((local_file_path, file_path, size))
+            batch_size += size
+        if batch:
+            put += put_batch(proxy, batch, policies, policy, required_by, grp)
+        logging.info('{}/{} files put'.format(put, len(files)))
+    return
+
+
+def setpolicy(cmd, grp, loc_namenode):
+    """Allow to execute setpolicy command.
+    
+    Parameters
+    ----------
+    cmd --> str, the command
+    grp --> list, the list of groups to which the user belongs
+    loc_namenode --> str, the master namenode in the moment in which the command has been invoked
+    
+    Returns
+    -------
+    None
+    """
+    f, required_by, path, policy = cmd.split()
+    #call the setpolicy command with a rpc
+    with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        try:
+            proxy.setpolicy(path, policy, required_by, grp) #no print, no result
+        except xmlrpc.client.Fault as err:
+            #the user is not allowed to change the storage policy of the directory
+            if 'AccessDeniedException' in err.faultString:
+                logging.warning(err.faultString)
+            #the path does not exist
+            if 'NotFoundException' in err.faultString:
+                logging.warning(err.faultString)
+            #the path is a file, its policy cannot be changed
+            if 'NotDirectoryException' in err.faultString:
+                logging.warning(err.faultString)
+            #the storage policy given is not valid
+            if 'InvalidPolicyException' in err.faultString:
+                logging.warning(err.faultString)
+    return
+
+
+def getpolicy(cmd, grp, loc_namenode):
+    """Allow to execute getpolicy command.
+    
+    Parameters
+    ----------
+    cmd --> str, the command
+    grp --> list, the list of groups to which the user belongs
+    loc_namenode --> str, the master namenode in the moment in which the command has been invoked
+    
+    Returns
+    -------
+    None
+    """
+    f, required_by, path = cmd.split()
+    #call the get_policy command with a rpc
+    with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        try:
+            policy = proxy.get_policy(path, required_by, grp) #gives back result
+            print('storage policy: {}'.format(policy))
+        except xmlrpc.client.Fault as err:
+            #the user is not allowed to get the storage policy of the resource
+            if 'AccessDeniedException' in err.faultString:
+                logging.warning(err.faultString)
+            #the path does not exist
+            if 'NotFoundException' in err.faultString:
+                logging.warning(err.faultString)
     return
 
 
@@ -968,6 +1330,108 @@ def usermod(cmd, grp, loc_namenode):
     return
 
 
+#arguments of each operation which can be put into a batch, in the order in which they are written into a batch file
+batch_args = {
+    'mkdir': ['path', 'parent'],
+    'touch': ['path'],
+    'mv': ['orig', 'dest'],
+    'chown': ['path', 'new_own'],
+    'chgrp': ['path', 'new_grp'],
+    'chmod': ['path', 'new_mod'],
+    'setpolicy': ['path', 'policy'],
+    'ls': ['path'],
+    'get_file': ['path'],
+    'get_policy': ['path'],
+    'count': ['path'],
+    'countr': ['path'],
+    'du': ['path']
+}
+
+
+def run_batch(ops, required_by, grp, loc_namenode, atomic=False):
+    """Function for executing many metadata operations with a single rpc, it's the API for the scripts which create or change many resources.
+    
+    Parameters
+    ----------
+    ops --> list, the operations, dicts which contains the name of the operation (key: op) and its arguments (see batch_args), e.g. {'op': 'mkdir', 'path': '/user/dir', 'parent': 'F'}
+    required_by --> str, user who required the operations
+    grp --> list, the list of groups to which the user belongs
+    loc_namenode --> str, the master namenode
+    atomic --> bool, if True either all the operations are executed or none of them
+    
+    Returns
+    -------
+    (committed, results) --> tuple(bool, list), False if the batch has been undone, for each operation a dict which contains either its result (key: result) or the error for which it has failed (key: error)
+    """
+    with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+        (committed, results) = proxy.batch(ops, required_by, grp, atomic)
+    return (committed, results)
+
+
+def batch(cmd, grp, loc_namenode):
+    """Allow to execute batch command.
+    
+    Parameters
+    ----------
+    cmd --> str, the command
+    grp --> list, the list of groups to which the user belongs
+    loc_namenode --> str, the master namenode in the moment in which the command has been invoked
+    
+    Returns
+    -------
+    None
+    """
+    f, required_by, local_file_path, *atomic = cmd.split()
+    #each line of the batch file is an operation followed by its arguments, e.g. chmod /user/file.txt 750
+    ops = []
+    try:
+        with open(local_file_path, 'r') as lf:
+            for line in lf:
+                if not line.strip():
+                    continue
+                op, *args = line.split()
+                if op not in batch_args or len(args) != len(batch_args[op]):
+                    logging.warning('Invalid operation: {}'.format(line.strip()))
+                    return
+                ops.append(dict(zip(batch_args[op], args), op=op))
+    except Exception as e:
+        logging.warning(e)
+        return
+    (committed, results) = run_batch(ops, required_by, grp, loc_namenode, atomic == ['atomic'])
+    for (op, r) in zip(ops, results):
+        if 'error' in r:
+            logging.warning('{} {}: {}'.format(op['op'], ' '.join(op[a] for a in batch_args[op['op']]), r['error']))
+    if not committed:
+        logging.warning('The batch has been undone')
+    else:
+        logging.info('{}/{} operations executed'.format(len([r for r in results if 'error' not in r]), len(ops)))
+    return
+
+
+def cachestats(cmd, grp, loc_namenode):
+    """Allow to print the statistics of the client chunk cache.
+    
+    Parameters
+    ----------
+    cmd --> str, the command
+    grp --> list, the list of groups to which the user belongs
+    loc_namenode --> str, the master namenode in the moment in which the command has been invoked
+    
+    Returns
+    -------
+    None
+    """
+    cache = get_chunk_cache()
+    if cache is None:
+        print('chunk cache disabled')
+        return
+    stats = cache.get_stats()
+    print('memory: {} B used, {} hits, {} evictions'.format(stats['memory_used'], stats['memory_hits'], stats['memory_evictions']))
+    print('disk: {} B used, {} hits, {} evictions'.format(stats['disk_used'], stats['disk_hits'], stats['disk_evictions']))
+    print('misses: {}, files invalidated: {}'.format(stats['misses'], stats['invalidations']))
+    return
+
+
 def status():
     """Allow to execute status command.
     
@@ -1032,6 +1496,10 @@ available_cmds = {
         'func': get_file, 
         'pattern': '^get_file [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+$', 
         'example': 'get_file <USERNAME> <PATH> <LOCAL_FILE_PATH>'},
+    'get_dir': {
+        'func': get_dir, 
+        'pattern': '^get_dir [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+$', 
+        'example': 'get_dir <USERNAME> <PATH> <LOCAL_DIR_PATH>'},
     'get_chunks': {
         'func': get_chunks, 
         'pattern': '^get_chunks [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+$', 
@@ -1066,8 +1534,8 @@ available_cmds = {
         'example': 'countr <USERNAME> <PATH>'},
     'du': {
         'func': du, 
-        'pattern': '^du [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+$', 
-        'example': 'du <USERNAME> <PATH>'},
+        'pattern': '^du [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+( [LS])?$', 
+        'example': 'du <USERNAME> <PATH> [L|S]'},
     'chown': {
         'func': chown, 
         'pattern': '^chown [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+ [A-Za-z0-9_]+$', 
@@ -1082,8 +1550,20 @@ available_cmds = {
         'example': 'chmod <USERNAME> <PATH> <NEW_MOD>'},
     'put_file': {
         'func': put_file, 
-        'pattern': '^put_file [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+$', 
-        'example': 'put_file <USERNAME> <LOCAL_FILE_PATH> <PATH>'},
+        'pattern': '^put_file [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+( (replication|RS-[0-9]+-[0-9]+))?$', 
+        'example': 'put_file <USERNAME> <LOCAL_FILE_PATH> <PATH> [POLICY]'},
+    'put_dir': {
+        'func': put_dir, 
+        'pattern': '^put_dir [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+( (replication|RS-[0-9]+-[0-9]+))?$', 
+        'example': 'put_dir <USERNAME> <LOCAL_DIR_PATH> <PATH> [POLICY]'},
+    'setpolicy': {
+        'func': setpolicy, 
+        'pattern': '^setpolicy [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+ (replication|RS-[0-9]+-[0-9]+)$', 
+        'example': 'setpolicy <USERNAME> <PATH> <POLICY>'},
+    'getpolicy': {
+        'func': getpolicy, 
+        'pattern': '^getpolicy [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+$', 
+        'example': 'getpolicy <USERNAME> <PATH>'},
     'mkfs': {
         'func': mkfs, 
         'pattern': '^mkfs [A-Za-z0-9_]+$', 
@@ -1112,6 +1592,14 @@ available_cmds = {
         'func': usermod, 
         'pattern': '^usermod [A-Za-z0-9_]+ [A-Za-z0-9_]+ ([A-Za-z0-9_]+ )+[\+\-]$', 
         'example': 'usermod <USERNAME> <USER> <GROUPS>{1,N} <OPERATION>'},
+    'batch': {
+        'func': batch,
+        'pattern': '^batch [A-Za-z0-9_]+ (/([A-Za-z0-9_\-\.]+/)*([A-Za-z0-9_\-\.]+)*/*)+( atomic)?$',
+        'example': 'batch <USERNAME> <LOCAL_FILE_PATH> [atomic]'},
+    'cachestats': {
+        'func': cachestats,
+        'pattern': '^cachestats [A-Za-z0-9_]+$',
+        'example': 'cachestats <USERNAME>'},
     'status': {
         'func': status,
         'pattern': '^status [A-Za-z0-9_]+$',
@@ -1144,30 +1632,153 @@ def validate_cmd(cmd):
         raise CommandNotFoundException()
         
 
-def get_master_namenode():
-    """Function for retrieving the master namenode at the moment the command is invoked; the function will ask each datanode which is the current namenode and use quorum to understand which is the real master.
+#the master namenode found by the last lookup and until when it can be used without asking the datanodes again
+master_cache = {'namenode': None, 'expiration': 0}
+
+
+def ask_master_namenode(dn):
+    """Function for asking a datanode which is the current master namenode.
     
     Parameters
     ----------
+    dn --> dict, the datanode setting
     
     Returns
     -------
-    max(quorum,key=quorum.count) --> str, the current master namenode
+    master --> str, the master namenode for the datanode, None if the datanode does not answer in time
     """
-    quorum = []
-    for dn in datanodes:
-        uri = "http://{}:{}/".format(dn['host'], dn['port_gencom'])
-        try:
-            #get the current master namenode for the datanode with a rpc
-            with xmlrpc.client.ServerProxy(uri, allow_none=True) as proxy:
-                master = proxy.get_master_namenode()
-                quorum.append(master)
-        except ConnectionRefusedError:
-            #the datanode is down currently
-            logging.error("datanode {}:{} down!!!".format(dn['host'], dn['port_gencom']))
-            pass
+    uri = "http://{}:{}/".format(dn['host'], dn['port_gencom'])
+    try:
+        #get the current master namenode for the datanode with a rpc
+        with xmlrpc.client.ServerProxy(uri, transport=TimeoutTransport(get_master_lookup_timeout()), allow_none=True) as proxy:
+            return proxy.get_master_namenode()
+    except (OSError, xmlrpc.client.Error):
+        #the datanode is down currently (or it does not answer in time)
+        logging.error("datanode {}:{} down!!!".format(dn['host'], dn['port_gencom']))
+        return None
+
+
+def get_master_namenode(refresh=False):
+    """Function for retrieving the master namenode at the moment the command is invoked; the function will ask each datanode which is the current namenode and use quorum to understand which is the real master; the master found is cached and used until it expires.
+    
+    Parameters
+    ----------
+    refresh --> bool, if True the datanodes are asked again even if the master cached has not expired
+    
+    Returns
+    -------
+    max(quorum,key=quorum.count) --> str, the current master namenode, None if no datanode answers
+    """
+    if not refresh and master_cache['namenode'] is not None and time.monotonic() < master_cache['expiration']:
+        return master_cache['namenode']
+    #ask all the datanodes in parallel, so a datanode which hangs delays the lookup by the timeout at most
+    with ThreadPoolExecutor(max_workers=len(datanodes)) as executor:
+        quorum = [master for master in executor.map(ask_master_namenode, datanodes) if master is not None]
+    if not quorum:
+        master_cache['namenode'] = None
+        return None
     #the master namenode is the one which is master for the highest number of datanodes 
-    return max(quorum,key=quorum.count) 
+    master_cache['namenode'] = max(quorum,key=quorum.count)
+    master_cache['expiration'] = time.monotonic() + get_master_cache_ttl()
+    return master_cache['namenode']
+
+
+#the sessions opened by the client are kept into a file readable only by the local user, so the scripts which run many commands don't ask the password every time
+sessions_file = os.path.join(os.path.expanduser('~'), '.hmdfs_sessions')
+
+
+def load_sessions():
+    """Function for loading the sessions opened by the client.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    sessions --> dict, key: username, value: the session as returned by the login of the namenode
+    """
+    try:
+        with open(sessions_file, 'r') as sf:
+            sessions = json.load(sf)
+    except Exception:
+        return {}
+    #the expired sessions are useless
+    return {u: sessions[u] for u in sessions if sessions[u]['expiration'] > time.time()}
+
+
+def save_session(username, session):
+    """Function for saving a session opened by the client, None for removing it.
+    
+    Parameters
+    ----------
+    username --> str, the user of the session
+    session --> dict, the session as returned by the login of the namenode
+    
+    Returns
+    -------
+    None
+    """
+    sessions = load_sessions()
+    if session is None:
+        sessions.pop(username, None)
+    else:
+        sessions[username] = session
+    try:
+        with open(os.open(sessions_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as sf:
+            json.dump(sessions, sf)
+    except Exception as e:
+        logging.warning(e)
+    return
+
+
+def session_uri(master, username, token):
+    """Function for getting the uri of the master namenode with the credentials of a session, every rpc call done with it is authenticated.
+    
+    Parameters
+    ----------
+    master --> str, the master namenode
+    username --> str, the user of the session
+    token --> str, the session token
+    
+    Returns
+    -------
+    'http://{}:{}@{}/'.format(username, token, master) --> str, the uri
+    """
+    return 'http://{}:{}@{}/'.format(username, token, master)
+
+
+def open_session(username, master):
+    """Function for opening a session with the master namenode; a session already opened is reused, the password is asked only for a new one.
+    
+    Parameters
+    ----------
+    username --> str, the user of the session
+    master --> str, the master namenode
+    
+    Returns
+    -------
+    (loc_namenode, usr) --> tuple(str, dict), the uri of the master namenode with the credentials of the session, the name of the user (key: name) and the groups to which the user belongs (key: groups)
+    """
+    session = load_sessions().get(username)
+    if session is not None:
+        loc_namenode = session_uri(master, username, session['token'])
+        try:
+            #check the session and get the groups of the user with a rpc
+            with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+                return (loc_namenode, proxy.whoami())
+        except xmlrpc.client.Fault as err:
+            #e.g. the password of the user has been changed
+            if 'InvalidSessionException' not in err.faultString:
+                raise err
+            logging.warning(err.faultString)
+            save_session(username, None)
+    password = getpass('Insert your password, please:')
+    #login with a rpc, the password is sent only once for the whole session
+    with xmlrpc.client.ServerProxy('http://{}/'.format(master), allow_none=True) as proxy:
+        session = proxy.login(username, password)
+    save_session(username, session)
+    return (session_uri(master, username, session['token']), {'name': username, 'groups': session['groups']})
 
 
 def exec_cmd(cmd):
@@ -1187,20 +1798,25 @@ def exec_cmd(cmd):
         logging.warning(e.message)
         return
     username = cmd.split()[1]
-    loc_namenode = 'http://{}/'.format(get_master_namenode()) #get the current master namenode
-    try:
-        #get the user object from MongoDB with a rpc
-        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
-            usr = proxy.get_user(username)
-            if not usr:
-                raise UserNotFoundException(username) #the user does not exist
-    except ConnectionRefusedError:
-        logging.error('namenode down') #the master namenode is down
+    #the master namenode cached is looked for again if it does not answer or it's not the master anymore
+    for refresh in [False, True]:
+        master = get_master_namenode(refresh) #get the current master namenode
+        if master is None:
+            logging.error('no datanode knows the master namenode')
+            return
+        try:
+            #open a session with the master namenode, or reuse the one already opened
+            (loc_namenode, usr) = open_session(username, master)
+            break
+        except OSError:
+            logging.error('namenode down') #the master namenode is down
+        except xmlrpc.client.Fault as err:
+            logging.warning(err.faultString)
+            #the user does not exist or the password is wrong
+            if 'NotMasterException' not in err.faultString:
+                return
+    else:
         return
-    password = getpass('Insert your password, please:')
-    #verify if the password inserted by the user is the same of the user MongoDB object
-    if usr['password'] != password:
-        raise AccessDeniedException()
     if func.__name__ == 'status':
         if username == 'root': 
             func()
@@ -0,0 +1,93 @@
+import zlib
+import lzma
+from exceptions import CodecNotFoundException
+
+#the registered codecs, key: codec name, value: dict with the compress and decompress functions
+codecs_registry = {}
+
+
+def register_codec(name, compress, decompress):
+    """Function for registering a codec that can be used for compressing the chunks payloads; it allows to plug new codecs besides the default ones.
+
+    Parameters
+    ----------
+    name --> str, the name of the codec, the one recorded into the file document
+    compress --> function, takes the chunk payload as bytes and returns the compressed bytes
+    decompress --> function, takes the compressed bytes and returns the original chunk payload as bytes
+
+    Returns
+    -------
+    None
+    """
+    codecs_registry[name] = {'compress': compress, 'decompress': decompress}
+    return
+
+
+def get_codecs():
+    """Function for getting the names of the available codecs.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    list(codecs_registry.keys()) --> list, the names of the registered codecs
+    """
+    return list(codecs_registry.keys())
+
+
+def get_codec(name):
+    """Function for getting a registered codec.
+
+    Parameters
+    ----------
+    name --> str, the name of the codec
+
+    Returns
+    -------
+    codecs_registry[name] --> dict, key: compress or decompress, value: the function which does the operation
+    """
+    #a file without codec has been written before compression was available, so it's not compressed
+    if not name:
+        name = 'none'
+    try:
+        return codecs_registry[name]
+    except KeyError:
+        raise CodecNotFoundException(name) #the codec is not registered on this node
+
+
+def compress_chunk(payload, codec):
+    """Function for compressing the payload of a chunk with the codec in input.
+
+    Parameters
+    ----------
+    payload --> bytes, the chunk payload
+    codec --> str, the name of the codec
+
+    Returns
+    -------
+    get_codec(codec)['compress'](payload) --> bytes, the compressed chunk payload
+    """
+    return get_codec(codec)['compress'](payload)
+
+
+def decompress_chunk(payload, codec):
+    """Function for decompressing the payload of a chunk with the codec in input.
+
+    Parameters
+    ----------
+    payload --> bytes, the compressed chunk payload
+    codec --> str, the name of the codec
+
+    Returns
+    -------
+    get_codec(codec)['decompress'](payload) --> bytes, the original chunk payload
+    """
+    return get_codec(codec)['decompress'](payload)
+
+
+#default codecs, all of them are available in the standard library
+register_codec('none', lambda payload: bytes(payload), lambda payload: bytes(payload))
+register_codec('zlib', lambda payload: zlib.compress(payload, 6), zlib.decompress)
+register_codec('lzma', lambda payload: lzma.compress(payload, preset=6), lzma.decompress)
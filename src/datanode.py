@@ -1,13 +1,12 @@
 ###example --> python3 datanode.py datanode1
 
 import sys
-from flask import Flask, request
+from flask import Flask, request, Response
 from flask_restful import Resource, Api
-from utils import get_datanode_setting, get_replica_set, get_datanodes_list
+from utils import get_datanode_setting, get_replica_set, get_datanodes_list, get_datanode_cache_size, get_datanode_cache_policy, get_mmap_cache_size, get_durability, get_group_commit_window, get_storage_layout, get_datanode_storages, get_disk_workers, get_small_chunk_size, get_container_size, get_compaction_ratio
 import os
-import glob
+import io
 import json
-from shutil import copyfile
 from pubsub import pub
 from requests.exceptions import RequestException
 from requests import put, get, delete, post
@@ -16,10 +15,149 @@ import websockets
 import functools
 import logging
 import datetime
-from datanode_utils import HeartbeatThread, ServerThread, GeneralCommunicationsThread, write_replica, take_best_active_nn
+import errno
+import threading
+from datanode_utils import HeartbeatThread, ServerThread, GeneralCommunicationsThread, HotChunksCache, MappedChunks, ChunksIndex, ContainerStore, StorageDisks, GroupCommitThread, DeletionThread, store_chunk, write_replica, take_best_active_nn, chunk_path, view_blocks, file_blocks
 
 s = get_datanode_setting(sys.argv[1])
 (heartbeat_to, host_master, port_master) = take_best_active_nn()
+#the chunks read more often are kept in memory
+hot_chunks = HotChunksCache(get_datanode_cache_size(), get_datanode_cache_policy())
+#the chunks read by ranges are kept memory mapped
+mapped_chunks = MappedChunks(get_mmap_cache_size())
+#the chunks stored are indexed by file and disk, so the ones of a file are found without scanning the storage directories
+chunks_index = ChunksIndex()
+#the storage directories of the datanode, one for each disk, each one with its own pool of I/O threads
+disks = StorageDisks(get_datanode_storages(s), get_disk_workers(), chunks_index)
+#the chunks written concurrently are synced together with the group durability
+group_commit = GroupCommitThread(get_group_commit_window())
+#the small chunks are packed into big append-only files, instead of a file each
+containers = ContainerStore(get_small_chunk_size(), get_container_size(), get_compaction_ratio())
+
+
+def write_chunk(chunk_name, stream, expected=None):
+    """Function for writing a chunk into a disk of the datanode: a small one is packed into a container, a big one is stored into a file of its own; an overwritten chunk stays into its disk and its old copy is removed.
+    
+    Parameters
+    ----------
+    chunk_name --> str, the name of the chunk
+    stream --> file-like object, the content of the chunk (e.g. the body of the request)
+    expected --> int, the size the chunk must have (e.g. the content length of the request), None if it's not known (the chunk is not packed)
+    
+    Returns
+    -------
+    (storage, content) --> tuple(str, bytes), the storage directory of the chunk and its content if it has been packed, otherwise None
+    """
+    storage = chunks_index.locate(chunk_name) or disks.choose()
+    packed = containers.locate(chunk_name)
+    content = None
+    if containers.fits(expected):
+        content = stream.read()
+        #the upload has been interrupted, the old content of the chunk (if any) is kept
+        if len(content) != expected:
+            raise IOError('Chunk {} truncated: {} bytes of {}'.format(chunk_name, len(content), expected))
+        disks.run(storage, containers.append, storage, chunk_name, content, get_durability(), group_commit)
+        #the chunk was stored into a file of its own
+        if packed is None and chunks_index.locate(chunk_name) is not None:
+            disks.run(storage, os.remove, chunk_path(storage, chunk_name))
+    else:
+        disks.run(storage, store_chunk, chunk_path(storage, chunk_name), stream, get_durability(), expected, group_commit)
+        #the chunk was packed into a container
+        if packed is not None:
+            disks.run(packed, containers.remove, packed, [chunk_name], get_durability(), group_commit)
+    chunks_index.add(chunk_name, storage)
+    compact(storage)
+    return (storage, content)
+
+
+def read_chunk(chunk_name):
+    """Function for reading a chunk stored into a disk of the datanode as a stream, from its container or from its own file.
+    
+    Parameters
+    ----------
+    chunk_name --> str, the name of the chunk
+    
+    Returns
+    -------
+    (stream, size) --> tuple(file-like object, int), the content of the chunk and its size, in bytes
+    """
+    storage = chunks_index.locate(chunk_name)
+    if storage is None:
+        raise FileNotFoundError(errno.ENOENT, 'Chunk not found', chunk_name)
+    if containers.locate(chunk_name) is not None:
+        content = disks.run(storage, containers.read, chunk_name)
+        return (io.BytesIO(content), len(content))
+    fb = disks.run(storage, open, chunk_path(storage, chunk_name), 'rb')
+    return (fb, os.fstat(fb.fileno()).st_size)
+
+
+def remove_chunks(chunk_names):
+    """Function for removing chunks from the disks of the datanode, by the pools of their disks and the disks in parallel; the packed chunks of a disk are deleted together, with a single sync.
+    
+    Parameters
+    ----------
+    chunk_names --> list, the names of the chunks
+    
+    Returns
+    -------
+    None
+    """
+    removals = []
+    packed = {}
+    for c in chunk_names:
+        storage = chunks_index.locate(c)
+        if storage is None:
+            continue
+        if containers.locate(c) is not None:
+            packed.setdefault(storage, []).append(c)
+        else:
+            removals.append(([c], disks.submit(storage, os.remove, chunk_path(storage, c))))
+    for storage in packed:
+        removals.append((packed[storage], disks.submit(storage, containers.remove, storage, packed[storage], get_durability(), group_commit)))
+    for (names, future) in removals:
+        try:
+            future.result()
+            for c in names:
+                logging.info('Delete chunk {}'.format(c))
+        except Exception as e:
+            logging.error(str(e))
+    chunks_index.remove(chunk_names)
+    hot_chunks.invalidate(chunk_names)
+    mapped_chunks.invalidate(chunk_names)
+    for storage in packed:
+        compact(storage)
+
+
+def delete_files(prefixes):
+    """Function for deleting all the chunks of some files from the disks of the datanode.
+    
+    Parameters
+    ----------
+    prefixes --> list, the prefixes of the names of the chunks (the chunks with the same prefix belong to the same file)
+    
+    Returns
+    -------
+    None
+    """
+    chunks_lst = []
+    for pref in prefixes:
+        chunks_lst.extend(chunks_index.find(pref))
+    remove_chunks(chunks_lst)
+
+
+def compact(storage):
+    """Function for compacting in background the containers of a disk with too much garbage, by the pool of the disk.
+    
+    Parameters
+    ----------
+    storage --> str, the storage directory of the disk
+    
+    Returns
+    -------
+    None
+    """
+    if containers.needs_compaction(storage):
+        disks.submit(storage, containers.compact, storage)
 
 
 class ChunksHandler(Resource):
@@ -34,13 +172,67 @@ class ChunksHandler(Resource):
         
         Returns
         -------
-        chunk_content --> str, the content of the chunk
+        chunk_content --> str or flask.Response class, the content of the chunk, as a string or (raw request) as it's stored
         """
         chunk_name = request.args['chunk_name']
-        #get the chunk content as an array of bytes
-        with open(s['storage']+chunk_name, 'rb') as fb:
-            chunk_content = bytearray(fb.read()).decode('ISO-8859-1')
-        fb.close()
+        #the chunk is read from the disk which stores it
+        storage = chunks_index.locate(chunk_name)
+        if storage is None:
+            return 'Chunk {} not found'.format(chunk_name), 404
+        path = chunk_path(storage, chunk_name)
+        try:
+            #a packed chunk is read with a single read from its container, which is kept open
+            if containers.locate(chunk_name) is not None:
+                chunk_content = disks.run(storage, containers.read, chunk_name)
+                logging.info('Get chunk {}'.format(chunk_name))
+                if request.args.get('raw'):
+                    return Response(chunk_content, mimetype='application/octet-stream').make_conditional(request, accept_ranges=True, complete_length=len(chunk_content))
+                return chunk_content.decode('ISO-8859-1')
+            #range request: a single range is sliced from the mapping of the chunk, without opening and reading the file; the chunks of a bad disk are never mapped, an I/O error would kill the datanode
+            if request.args.get('raw') and request.range is not None and len(request.range.ranges) == 1 and 'If-Range' not in request.headers and mapped_chunks.get_size() > 0 and storage in disks.get_good():
+                view = disks.run(storage, mapped_chunks.view, path, chunk_name)
+                byte_range = request.range.range_for_length(len(view))
+                logging.info('Get chunk {}'.format(chunk_name))
+                if byte_range is None:
+                    return Response(status=416, headers={'Content-Range': 'bytes */{}'.format(len(view))})
+                response = Response(view_blocks(view, byte_range[0], byte_range[1], disks, storage), status=206, mimetype='application/octet-stream')
+                response.headers['Content-Range'] = 'bytes {}-{}/{}'.format(byte_range[0], byte_range[1]-1, len(view))
+                response.headers['Accept-Ranges'] = 'bytes'
+                response.content_length = byte_range[1]-byte_range[0]
+                return response
+            #raw request: the chunk is sent as it's stored, streamed from the disk in fixed size blocks read by the I/O threads of its disk unless it's a hot chunk, and the range requests are served
+            if request.args.get('raw'):
+                chunk_content = disks.run(storage, hot_chunks.lookup, path, chunk_name)
+                logging.info('Get chunk {}'.format(chunk_name))
+                if chunk_content is not None:
+                    return Response(chunk_content, mimetype='application/octet-stream').make_conditional(request, accept_ranges=True, complete_length=len(chunk_content))
+                fd = disks.run(storage, os.open, path, os.O_RDONLY)
+                try:
+                    size = disks.run(storage, os.fstat, fd).st_size
+                    (start, stop) = (0, size)
+                    #a single range is served, the other range requests get the whole chunk
+                    ranged = request.range is not None and len(request.range.ranges) == 1 and 'If-Range' not in request.headers
+                    if ranged:
+                        byte_range = request.range.range_for_length(size)
+                        if byte_range is None:
+                            os.close(fd)
+                            return Response(status=416, headers={'Content-Range': 'bytes */{}'.format(size)})
+                        (start, stop) = byte_range
+                    response = Response(file_blocks(fd, start, stop, disks, storage), status=206 if ranged else 200, mimetype='application/octet-stream')
+                except:
+                    os.close(fd)
+                    raise
+                response.call_on_close(functools.partial(os.close, fd))
+                if ranged:
+                    response.headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, stop-1, size)
+                response.headers['Accept-Ranges'] = 'bytes'
+                response.content_length = stop-start
+                return response
+            #get the chunk content, from the disk only if it's not a hot chunk
+            chunk_content = disks.run(storage, hot_chunks.read, path, chunk_name).decode('ISO-8859-1')
+        except OSError as e:
+            logging.error('Chunk {} not read: {}'.format(chunk_name, e))
+            return 'Chunk {} not read: {}'.format(chunk_name, e), 503
         logging.info('Get chunk {}'.format(chunk_name))
         return chunk_content
 
@@ -55,16 +247,39 @@ class ChunksHandler(Resource):
         -------
         None
         """
-        chunk_replicas = request.form['chunk_replicas']
-        chunk_name = request.form['chunk_name']
-        chunk_payload = bytearray(request.form['chunk_payload'], encoding = 'ISO-8859-1')
-        #write the binary content into the chunk 
-        with open(s['storage']+chunk_name, 'wb') as fb:
-            fb.write(chunk_payload)
-        fb.close()
+        #raw request: the body is the binary content of the chunk, streamed to the disk without loading it into memory
+        if request.mimetype == 'application/octet-stream':
+            chunk_replicas = request.args['chunk_replicas']
+            chunk_name = request.args['chunk_name']
+            chunk_stream = request.stream
+            acks = request.args.get('acks')
+        else:
+            chunk_replicas = request.form['chunk_replicas']
+            chunk_name = request.form['chunk_name']
+            chunk_stream = io.BytesIO(bytearray(request.form['chunk_payload'], encoding = 'ISO-8859-1'))
+            acks = request.form.get('acks')
+        #the copies (this one and the next replicas) which must be written before answering, all of them if not given
+        acks = len(json.loads(chunk_replicas))+1 if acks is None else int(acks)
+        #write the binary content into the chunk, packed into a container if it's small
+        try:
+            (storage, chunk_content) = write_chunk(chunk_name, chunk_stream, request.content_length if request.mimetype == 'application/octet-stream' else len(request.form['chunk_payload'].encode('ISO-8859-1')))
+        except OSError as e:
+            logging.error('Chunk {} not written: {}'.format(chunk_name, e))
+            return 'Chunk {} not written: {}'.format(chunk_name, e), 503
+        #the old content of an overwritten chunk must not be served anymore
+        hot_chunks.invalidate([chunk_name])
+        mapped_chunks.invalidate([chunk_name])
         logging.info('Put chunk {}'.format(chunk_name))
-        #publish a message in the channel "replicas" with the chunk to replicate, the content/payload and the list of datanodes which must handle the replicas for that chunk
-        pub.sendMessage('replicas', chunk_name=request.form['chunk_name'], chunk_payload=request.form['chunk_payload'], chunk_replicas=request.form['chunk_replicas'])
+        #publish a message in the channel "replicas" with the chunk to replicate, where it's stored and the list of datanodes which must handle the replicas for that chunk
+        #the replicas required are written before answering, the other ones in background
+        message = {'chunk_name': chunk_name, 'chunk_path': chunk_path(storage, chunk_name), 'chunk_replicas': chunk_replicas, 'acks': max(acks-1, 0), 'chunk_content': chunk_content}
+        if acks > 1:
+            try:
+                pub.sendMessage('replicas', **message)
+            except (RequestException, OSError) as e:
+                return 'Replicas of chunk {} not written: {}'.format(chunk_name, e), 503
+        else:
+            threading.Thread(target=pub.sendMessage, args=('replicas',), kwargs=message).start()
         return
         
     def delete(self):
@@ -78,18 +293,9 @@ class ChunksHandler(Resource):
         -------
         None
         """
-        chunks = json.loads(request.form['chunks_prefix'])
-        chunks_lst = []
-        #delete all the chunks which have a prefix present into "chunks"
-        #the chunks with the same prefix belong to the same file
-        for pref in chunks:
-            chunks_lst.extend(glob.glob(s['storage']+pref+'*'))
-        for cp in chunks_lst:
-            try:
-                logging.info('Delete chunk {}'.format(cp))
-                os.remove(cp) #remove the chunks which start with the current prefix
-            except Exception as e:
-                logging.error(str(e))
+        #delete all the chunks which have a prefix present into "chunks_prefix"
+        #the chunks are removed by the pools of their disks, the disks in parallel
+        delete_files(json.loads(request.form['chunks_prefix']))
         return
     
     def post(self):
@@ -106,12 +312,16 @@ class ChunksHandler(Resource):
         old_prefix = request.form['old_prefix']
         new_prefix = request.form['new_prefix']
         #for each chunk whom name starts with the old prefix, copy the content into the new chunk
-        for c in glob.glob(s['storage']+old_prefix+'*'):
+        for src in chunks_index.find(old_prefix):
             try:
-                src = os.path.basename(os.path.normpath(c)) #content of the chunk
-                #copy the content into the new chunk
-                copyfile(c, os.path.join(s['storage'], new_prefix + '_' + src.split('_')[1]))
-                logging.info('Copy chunk {} into chunk {}'.format(c, os.path.join(s['storage'], new_prefix + '_' + src.split('_')[1])))
+                dst = new_prefix + '_' + src.split('_')[1]
+                #copy the content into the new chunk, it's written as an uploaded one (packed or into its disk and subdirectory, with the configured durability)
+                (stream, size) = read_chunk(src)
+                with stream:
+                    write_chunk(dst, stream, size)
+                hot_chunks.invalidate([dst])
+                mapped_chunks.invalidate([dst])
+                logging.info('Copy chunk {} into chunk {}'.format(src, dst))
             except Exception as e:
                 logging.error(str(e))
         return
@@ -131,11 +341,16 @@ class MkfsHandler(Resource):
         -------
         None
         """
-        #flush the content of the storage directory of the datanode
-        #empty the directory
-        for r, d, f in os.walk(s['storage']):
-            for file in f:
-                os.remove(os.path.join(r, file))
+        #flush the content of the storage directories of the datanode
+        #empty the directories, the containers included
+        containers.clear()
+        for storage in disks.get_good():
+            for r, d, f in os.walk(storage):
+                for file in f:
+                    os.remove(os.path.join(r, file))
+        chunks_index.clear()
+        hot_chunks.clear()
+        mapped_chunks.clear()
         return
     
     
@@ -155,16 +370,23 @@ class DisasterRecoveryHandler(Resource):
         """
         to_recover = json.loads(request.form['to_recover'])
         for c in to_recover:
-            try:
-                #read the content of the current chunk
-                with open(s['storage']+c['chunk'], 'rb') as f:
-                    content = f.read()
-                    logging.info('Get chunk {}'.format(c['chunk']))
-            except Exception as e:
-                logging.error(str(e))
-                return
-            #publish a message in the channel "replicas" with the chunk to replicate, the content/payload and the datanode which must handle the replicas for that chunk
-            pub.sendMessage('replicas', chunk_name=c['chunk'], chunk_payload=content, chunk_replicas=json.dumps([c['new_replica']]))
+            #the current chunk must be stored for being replicated, it's streamed from the disk by write_replica
+            storage = chunks_index.locate(c['chunk'])
+            if storage is None:
+                logging.error('Chunk {} not found'.format(c['chunk']))
+                continue
+            #a packed chunk is read from its container
+            chunk_content = None
+            if containers.locate(c['chunk']) is not None:
+                try:
+                    chunk_content = disks.run(storage, containers.read, c['chunk'])
+                except OSError as e:
+                    logging.error('Chunk {} not read: {}'.format(c['chunk'], e))
+                    continue
+            logging.info('Get chunk {}'.format(c['chunk']))
+            #publish a message in the channel "replicas" with the chunk to replicate, where it's stored and the datanode which must handle the replicas for that chunk
+            #a replica not written is logged by write_replica, the other chunks are recovered anyway
+            pub.sendMessage('replicas', chunk_name=c['chunk'], chunk_path=chunk_path(storage, c['chunk']), chunk_replicas=json.dumps([c['new_replica']]), acks=0, chunk_content=chunk_content)
         return
     
     def delete(self):
@@ -179,16 +401,48 @@ class DisasterRecoveryHandler(Resource):
         None
         """
         chunks = json.loads(request.form['chunks'])
-        for c in chunks:
-            try:
-                #remove the current chunk from the datanode which previously handled a replica of that one
-                os.remove(s['storage']+c) 
-                logging.info('Flush chunk {} after recovery'.format(c))
-            except Exception as e:
-                logging.error(str(e))
+        #remove the chunks from the datanode which previously handled a replica of them
+        remove_chunks(chunks)
+        logging.info('Flush {} chunks after recovery'.format(len(chunks)))
         return
 
 
+class CacheHandler(Resource):
+    """REST web service class for monitoring the hot chunks cache of the datanode."""
+    
+    def get(self):
+        """get request --> used for getting the statistics of the cache (hits, misses, evictions, invalidations, chunks cached, bytes used) and of the memory mapped chunks.
+        
+        Parameters
+        ----------
+        self --> CacheHandler class, self reference to the object instance
+        
+        Returns
+        -------
+        stats --> dict, the statistics of the cache, with the ones of the mappings
+        """
+        stats = hot_chunks.get_stats()
+        stats['mappings'] = mapped_chunks.get_stats()
+        return stats
+
+
+class DisksHandler(Resource):
+    """REST web service class for monitoring the disks (storage directories) of the datanode."""
+    
+    def get(self):
+        """get request --> used for getting the status of each disk (I/O in flight, bad), the lost chunks not reported to the namenode yet and the statistics of the containers of the small chunks.
+        
+        Parameters
+        ----------
+        self --> DisksHandler class, self reference to the object instance
+        
+        Returns
+        -------
+        status --> dict, the status of the disks
+        """
+        return {'disks': disks.get_stats(), 'lost_chunks': len(disks.get_lost()), 'containers': containers.get_stats()}
+
+
 def main():
     """Main function, the entry point."""
     logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
@@ -196,6 +450,20 @@ def main():
     if get_replica_set() > len(get_datanodes_list()):
         logging.critical('Impossible to start! Not enough datanodes to handle the replica set')
         return
+    #the index is built before serving the requests, the chunks must be where the layout expects them
+    if chunks_index.load(disks.get_storages()) > 0:
+        logging.critical('Impossible to start! Some chunks are not stored with the {} layout, migrate them with migrate_storage.py'.format(get_storage_layout()))
+        return
+    #the small chunks packed into the containers are indexed too, the ones of the corrupted records are reported as lost
+    for storage in disks.get_storages():
+        try:
+            disks.add_lost(containers.load(storage, chunks_index))
+        except OSError as e:
+            disks.mark_bad(storage, e)
+    #the disks are checked only now that the index is built, so the chunks of a disk which does not work are reported as lost
+    if not disks.probe():
+        logging.critical('Impossible to start! No disk works')
+        return
     logging.info('Datanode started')
     #create the server which exposes the REST services
     app = Flask(__name__)
@@ -203,15 +471,21 @@ def main():
     api.add_resource(ChunksHandler, '/chunks')
     api.add_resource(MkfsHandler, '/mkfs')
     api.add_resource(DisasterRecoveryHandler, '/recovery')
+    api.add_resource(CacheHandler, '/cache')
+    api.add_resource(DisksHandler, '/disks')
     #start the thread which runs the server for the REST services
     server_thread = ServerThread(app, s['host'], s['port'])
+    group_commit.start()
+    #the chunks of the files removed are deleted in background, in batches taken from the deletion queue of the master namenode
+    deletion_thread = DeletionThread(delete_files)
+    deletion_thread.start()
     server_thread.start()
     #create a publish/subscribe channel for handling the replicas writing process
     #when an event is present into the channel, the "write_replica" function will start  
     pub.subscribe(write_replica, 'replicas')
     new_loop = asyncio.new_event_loop()
     #start the thread which handles the heartbeat process
-    heartbeat_thread = HeartbeatThread(new_loop, heartbeat_to, host_master, port_master, s['host']+':'+str(s['port']))
+    heartbeat_thread = HeartbeatThread(new_loop, heartbeat_to, host_master, port_master, s['host']+':'+str(s['port']), disks, deletion_thread)
     heartbeat_thread.start() 
     #start the thread for the general communications
     gencom_thread = GeneralCommunicationsThread(s['host'], s['port_gencom'], heartbeat_thread)
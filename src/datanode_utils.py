@@ -1,14 +1,35 @@
 import threading
 import time
+import os
+import uuid
+import hashlib
+import errno
+import mmap
+import struct
+import zlib
+import shutil
+import queue
+import random
 import datetime
 import websockets
 from requests.exceptions import RequestException
 from requests import put, get, delete, post
 import json
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from xmlrpc.server import SimpleXMLRPCServer
 import logging
-from utils import get_namenodes
+from utils import get_namenodes, get_storage_layout
 
+#the errors which mean a disk does not work anymore
+disk_errors = {errno.EIO, errno.EROFS, errno.ENODEV, errno.ENXIO}
+#how many lost chunks are reported with a heartbeat at most, so the message stays below the 1 MiB accepted by the web socket of the namenode (about 350 KB with the 64 characters names of the deduplicated chunks)
+lost_chunks_batch = 5000
+#the subdirectory of each storage directory into which the small chunks are packed
+containers_directory = 'containers'
+#the header of a record of a container: when the chunk has been written, the length of its name, the length of its content and if the record is a deletion
+record_header = struct.Struct('>dHIB')
 #get the namenodes settings and mark them as active
 namenodes = get_namenodes()
 for n in namenodes:
@@ -64,65 +85,1875 @@ def take_best_active_nn():
     return (str(best['host']+':'+str(best['port_heartbeat'])), best['host'], best['port'])
 
 
-def write_replica(chunk_name, chunk_payload, chunk_replicas):
-    """Function for generating a replica for a chunk; this function starts when a message it's found in the dedicated channel (publisher/subscriber).
+def chunk_path(storage, chunk_name, layout=None):
+    """Function for getting the path of a chunk into the storage directory of the datanode; with the hashed layout the chunks are spread into two levels of 256 subdirectories by the hash of their names, so no directory holds too many chunks.
+    
+    Parameters
+    ----------
+    storage --> str, the storage directory of the datanode
+    chunk_name --> str, the name of the chunk
+    layout --> str, either flat or hashed, if None the one of the configuration file (see utils.get_storage_layout)
+    
+    Returns
+    -------
+    path --> str, the path of the chunk into the local file system
+    """
+    if (layout or get_storage_layout()) == 'flat':
+        return os.path.join(storage, chunk_name)
+    h = hashlib.md5(chunk_name.encode()).hexdigest()
+    return os.path.join(storage, h[0:2], h[2:4], chunk_name)
+
+
+def walk_chunks(storage):
+    """Function for walking the chunks stored into the storage directory of the datanode, with any layout; the partial writes (.part files) and the containers of the small chunks are skipped.
+    
+    Parameters
+    ----------
+    storage --> str, the storage directory of the datanode
+    
+    Returns
+    -------
+    (chunk_name, path) --> generator of tuple(str, str), the name and the path of each chunk
+    """
+    for (r, d, f) in os.walk(storage):
+        if os.path.normpath(r) == os.path.normpath(storage) and containers_directory in d:
+            d.remove(containers_directory)
+        for name in f:
+            if not name.endswith('.part'):
+                yield (name, os.path.join(r, name))
+
+
+def sync_directory(directory):
+    """Function for syncing a directory to the disk, so the chunks renamed into it are durable.
+    
+    Parameters
+    ----------
+    directory --> str, the path of the directory into the local file system
+    
+    Returns
+    -------
+    None
+    """
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def unpack_record(data):
+    """Function for parsing the record of a container at the beginning of some bytes; a record is valid only if it's complete and its checksum matches, so neither a write interrupted by a crash nor a record corrupted by the disk is taken.
+    
+    Parameters
+    ----------
+    data --> bytes, the bytes read from the container at the offset of the record
+    
+    Returns
+    -------
+    record --> tuple, the time of the write, the name of the chunk, if the record is a deletion and the size of the record; None if the record is not valid
+    """
+    if len(data) < record_header.size:
+        return None
+    (written, name_length, length, deleted) = record_header.unpack_from(data)
+    size = record_header.size + name_length + length + 4
+    if deleted > 1 or len(data) < size or zlib.crc32(data[:size-4]) != struct.unpack_from('>I', data, size-4)[0]:
+        return None
+    return (written, bytes(data[record_header.size:record_header.size+name_length]).decode(), bool(deleted), size)
+
+
+def store_chunk(path, stream, durability, expected=None, group_commit=None):
+    """Function for storing a chunk into the local file system from a stream; the stream is copied in fixed size blocks into a temporary file, which is renamed as the chunk only when it's complete, so the memory used does not depend on the chunk size and a half written chunk is never read.
+    
+    Parameters
+    ----------
+    path --> str, the path of the chunk into the local file system
+    stream --> file-like object, the content of the chunk (e.g. the body of the request)
+    durability --> str, either none, chunk or group, if chunk the chunk is synced to the disk before returning, if group it's synced together with the chunks written concurrently (see utils.get_durability)
+    expected --> int, the size the chunk must have (e.g. the content length of the request), None if it's not known
+    group_commit --> GroupCommitThread class, the thread which syncs the chunks with the group durability
+    
+    Returns
+    -------
+    size --> int, the size of the chunk, in bytes
+    """
+    #the subdirectories of the hashed layout are created by the first chunk written into them
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+        if durability != 'none':
+            sync_directory(os.path.dirname(directory))
+            sync_directory(os.path.dirname(os.path.dirname(directory)))
+    #each upload has its own temporary file, so concurrent writes of the same chunk don't mix
+    tmp = '{}.{}.part'.format(path, uuid.uuid4().hex)
+    size = 0
+    try:
+        with open(tmp, 'wb') as fb:
+            while True:
+                block = stream.read(1048576)
+                if not block:
+                    break
+                fb.write(block)
+                size += len(block)
+            #the upload has been interrupted, the old content of the chunk (if any) is kept
+            if expected is not None and size != expected:
+                raise IOError('Chunk {} truncated: {} bytes of {}'.format(os.path.basename(path), size, expected))
+            #each writer syncs its own chunk, so the chunks are synced in parallel and an error of the writeback is raised to the writer
+            if durability != 'none':
+                fb.flush()
+                os.fsync(fb.fileno())
+        #the group commit thread renames the chunk and syncs the directory once for the whole group
+        if durability == 'group':
+            group_commit.commit(None, tmp, path)
+        else:
+            os.replace(tmp, path)
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise e
+    #the rename is durable only when the directory is synced too
+    if durability == 'chunk':
+        sync_directory(os.path.dirname(path))
+    return size
+
+
+def write_replica(chunk_name, chunk_path, chunk_replicas, acks, chunk_content=None):
+    """Function for generating a replica for a chunk; this function starts when a message it's found in the dedicated channel (publisher/subscriber); the chunk is streamed from the local file system, the next datanode forwards it to the other replicas.
     
     Parameters
     ----------
     chunk_name --> str, the of the chunk for which it's necessary to write a replica
-    chunk_payload --> str, the content of the chunk 
+    chunk_path --> str, the path of the chunk into the local file system (its content is as stored, so possibly compressed), None if the chunk is packed into a container
     chunk_replicas --> str, the string representation of the datanodes list choosen for being replica nodes for the chunk in input
+    acks --> int, the replicas which must be written before returning, if the write of one of them fails the error is raised (0 for writing them in background)
+    chunk_content --> bytes, the content of a chunk packed into a container, None if the chunk is stored into a file of its own
+    
+    Returns
+    -------
+    None
+    """
+    chunk_replicas = json.loads(chunk_replicas)
+    try:
+        #take the first datanode to which write the new replica
+        host = chunk_replicas.pop(0)
+    except: #there isn't any datanode to write the new replica, then exit
+        return
+    #start the write process for the new datanode, which answers only when the replicas required have been written
+    try:
+        params = {'chunk_replicas': json.dumps(chunk_replicas), 'chunk_name': chunk_name, 'acks': acks}
+        #a small chunk is sent from memory, as it has been read from its container
+        if chunk_content is not None:
+            resp = put('http://{}/chunks'.format(host), params=params, data=chunk_content, headers={'Content-Type': 'application/octet-stream'})
+        else:
+            with open(chunk_path, 'rb') as fb:
+                resp = put('http://{}/chunks'.format(host), params=params, data=fb, headers={'Content-Type': 'application/octet-stream'})
+        resp.raise_for_status()
+        logging.info('Write chunk {} replica to {}'.format(chunk_name, 'http://{}/chunks'.format(host)))
+    except (RequestException, OSError) as e:
+        logging.error('Chunk {} replica not written to {}: {}'.format(chunk_name, host, e))
+        #the write can not be acknowledged without this replica
+        if acks > 0:
+            raise e
+
+
+class GroupCommitThread(threading.Thread):
+    """Thread Class for syncing to the disk the chunks written concurrently together (group commit); the first chunk committed opens a time window, the chunks committed within it are renamed and each directory (or each file written in place, e.g. a container) is synced once for the whole group, then all their writes are acknowledged."""
+    
+    def __init__(self, window):
+        threading.Thread.__init__(self, daemon=True)
+        self.window = window
+        #the chunks waiting for the next sync: tuple(file descriptor, temporary path, path, dict with the event set when the chunk is durable and the error if any)
+        self.pending = queue.Queue()
+        self.stats = {'commits': 0, 'chunks': 0}
+
+    def get_window(self):
+        """Method for getting the 'window' object attribute.
+        
+        Parameters
+        ----------
+        self --> GroupCommitThread class, self reference to the object instance
+        
+        Returns
+        -------
+        self.window --> float, the time window of a group commit, in seconds
+        """
+        return self.window
+
+    def set_window(self, window):
+        """Method for setting the 'window' object attribute.
+        
+        Parameters
+        ----------
+        self --> GroupCommitThread class, self reference to the object instance
+        window --> float, the time window of a group commit, in seconds
+        
+        Returns
+        -------
+        None
+        """
+        self.window = window
+
+    def get_stats(self):
+        """Method for getting the statistics of the group commits.
+        
+        Parameters
+        ----------
+        self --> GroupCommitThread class, self reference to the object instance
+        
+        Returns
+        -------
+        stats --> dict, the syncs done and the chunks synced by them
+        """
+        return dict(self.stats)
+
+    def commit(self, fd, tmp, path):
+        """Method for committing a chunk written into a temporary file, it returns when the chunk has been synced and renamed; an error of the sync (e.g. of the writeback of the file) is raised to the writer.
+        
+        Parameters
+        ----------
+        self --> GroupCommitThread class, self reference to the object instance
+        fd --> int, the file descriptor of a file written in place which must be synced, it must stay open until the method returns; None if the chunk has already been synced by the writer
+        tmp --> str, the path of the temporary file into the local file system, None if the chunk has been written in place (e.g. appended to a container) and it must only be synced
+        path --> str, the path of the chunk into the local file system, None if the chunk has been written in place
+        
+        Returns
+        -------
+        None
+        """
+        done = {'event': threading.Event(), 'error': None}
+        self.pending.put((fd, tmp, path, done))
+        done['event'].wait()
+        if done['error'] is not None:
+            raise done['error']
+
+    def run(self):
+        """Method for syncing the chunks committed, a group every time window."""
+        while True:
+            group = [self.pending.get()]
+            #the chunks committed within the window are synced together
+            deadline = time.monotonic()+self.window
+            while True:
+                try:
+                    group.append(self.pending.get(timeout=max(deadline-time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            #each file is synced once, even if many chunks of the group have been written into it (e.g. appended to a container)
+            files = {}
+            for (fd, tmp, path, done) in group:
+                if fd is not None:
+                    files.setdefault(fd, []).append(done)
+            for fd in files:
+                try:
+                    os.fsync(fd)
+                except OSError as e:
+                    logging.error('Group commit failed: {}'.format(e))
+                    for done in files[fd]:
+                        done['error'] = e
+            directories = {}
+            for (fd, tmp, path, done) in group:
+                if tmp is None or done['error'] is not None:
+                    continue
+                try:
+                    os.replace(tmp, path)
+                    directories.setdefault(os.path.dirname(path), []).append(done)
+                except OSError as e:
+                    done['error'] = e
+            #the renames are durable only when the directories are synced too
+            for directory in directories:
+                try:
+                    sync_directory(directory)
+                except OSError as e:
+                    logging.error('Group commit failed: {}'.format(e))
+                    for done in directories[directory]:
+                        done['error'] = e
+            self.stats['commits'] += 1
+            self.stats['chunks'] += len(group)
+            for (fd, tmp, path, done) in group:
+                done['event'].set()
+
+
+class HotChunksCache():
+    """Class for keeping in memory the content of the chunks read more often by the clients, so a hot chunk is not read from the disk at every request; the cache is bounded in bytes and evicts either the least recently used (lru) or the least frequently used (lfu) chunk."""
+    
+    def __init__(self, size, policy='lru'):
+        self.size = size
+        self.policy = policy
+        #key: chunk name, value: content of the chunk, from the least to the most recently used
+        self.chunks = OrderedDict()
+        #key: chunk name, value: how many times the chunk has been read since it has been cached
+        self.frequencies = {}
+        #the names of the chunks read once from the disk and not cached yet, the oldest first
+        self.seen = OrderedDict()
+        #key: name of a chunk being read from the disk, value: [readers, generation], the generation changes when the chunk is invalidated during the read
+        self.loading = {}
+        self.used = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+        
+    def get_size(self):
+        """Method for getting the 'size' object attribute.
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        
+        Returns
+        -------
+        self.size --> int, the maximum size of the chunks cached, in bytes
+        """
+        return self.size
+      
+    def set_size(self, size):
+        """Method for setting the 'size' object attribute.
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        size --> int, the maximum size of the chunks cached, in bytes
+        
+        Returns
+        -------
+        None
+        """
+        self.size = size
+        
+    def get_policy(self):
+        """Method for getting the 'policy' object attribute.
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        
+        Returns
+        -------
+        self.policy --> str, the eviction policy, either lru or lfu
+        """
+        return self.policy
+      
+    def set_policy(self, policy):
+        """Method for setting the 'policy' object attribute.
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        policy --> str, the eviction policy, either lru or lfu
+        
+        Returns
+        -------
+        None
+        """
+        self.policy = policy
+        
+    def get_stats(self):
+        """Method for getting the statistics of the cache.
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        
+        Returns
+        -------
+        stats --> dict, the hits, the misses, the evictions, the invalidations, the chunks cached and the bytes used
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['chunks'] = len(self.chunks)
+            stats['used'] = self.used
+        return stats
+        
+    def read(self, path, chunk_name):
+        """Method for reading a chunk, from the cache if it's there, otherwise from the disk (and then it's cached).
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        path --> str, the path of the chunk into the local file system
+        chunk_name --> str, the chunk name
+        
+        Returns
+        -------
+        content --> bytes, the content of the chunk
+        """
+        with self.lock:
+            if chunk_name in self.chunks:
+                self.chunks.move_to_end(chunk_name)
+                self.frequencies[chunk_name] += 1
+                self.stats['hits'] += 1
+                return self.chunks[chunk_name]
+            self.stats['misses'] += 1
+            loading = self.loading.setdefault(chunk_name, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+        content = None
+        try:
+            with open(path, 'rb') as fb:
+                content = fb.read()
+        finally:
+            with self.lock:
+                loading[0] -= 1
+                if loading[0] == 0:
+                    del self.loading[chunk_name]
+                #a chunk overwritten or deleted while it was read could have a stale content, a chunk bigger than the cache is not cached
+                if content is not None and len(content) <= self.size and chunk_name not in self.chunks and loading[1] == generation:
+                    self.chunks[chunk_name] = content
+                    self.frequencies[chunk_name] = 1
+                    self.used += len(content)
+                    self.evict()
+        return content
+        
+    def lookup(self, path, chunk_name):
+        """Method for getting a chunk only if it's hot: from the cache if it's there, otherwise from the disk if it has already been required since it has not been cached (and then it's cached); a chunk read only once is never loaded in memory, so it can be streamed from the disk.
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        path --> str, the path of the chunk into the local file system
+        chunk_name --> str, the chunk name
+        
+        Returns
+        -------
+        content --> bytes, the content of the chunk, None if the chunk is not hot
+        """
+        with self.lock:
+            hot = chunk_name in self.chunks or chunk_name in self.seen
+            if not hot:
+                self.stats['misses'] += 1
+                self.seen[chunk_name] = True
+                #only the names of the chunks read recently are remembered
+                if len(self.seen) > 4096:
+                    self.seen.popitem(last=False)
+                return None
+            self.seen.pop(chunk_name, None)
+            cached = chunk_name in self.chunks
+        #a chunk bigger than the cache is always streamed from the disk
+        if not cached and os.path.getsize(path) > self.size:
+            return None
+        return self.read(path, chunk_name)
+        
+    def evict(self):
+        """Method for evicting chunks until the cache fits its size, the lock must be held.
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        
+        Returns
+        -------
+        None
+        """
+        while self.used > self.size:
+            if self.policy == 'lfu':
+                #the least recently used chunk among the least frequently used ones
+                victim = min(self.chunks, key=lambda c: self.frequencies[c])
+            else:
+                victim = next(iter(self.chunks))
+            self.used -= len(self.chunks.pop(victim))
+            del self.frequencies[victim]
+            self.stats['evictions'] += 1
+            
+    def invalidate(self, chunk_names):
+        """Method for removing from the cache the chunks overwritten or deleted.
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        chunk_names --> list, the names of the chunks
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            for c in chunk_names:
+                self.seen.pop(c, None)
+                #the reads in progress must not cache what they have read
+                if c in self.loading:
+                    self.loading[c][1] += 1
+                if c in self.chunks:
+                    self.used -= len(self.chunks.pop(c))
+                    del self.frequencies[c]
+                    self.stats['invalidations'] += 1
+                    
+    def clear(self):
+        """Method for removing all the chunks from the cache (e.g. after mkfs).
+        
+        Parameters
+        ----------
+        self --> HotChunksCache class, self reference to the object instance
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            self.stats['invalidations'] += len(self.chunks)
+            self.chunks.clear()
+            self.frequencies.clear()
+            self.seen.clear()
+            for loading in self.loading.values():
+                loading[1] += 1
+            self.used = 0
+
+
+class MappedChunks():
+    """Class for keeping memory mapped the chunks read by ranges, so a read at any offset of a chunk is a slice of its mapping, without opening, seeking and reading the file and without copying the content into a new buffer; the mappings are bounded in number and the least recently used one is closed when a new chunk is mapped. A chunk is never modified in place (it's written into a temporary file and renamed), so a mapping shows a complete content until it's invalidated by the write or the delete of its chunk. A read of a mapping which fails for an I/O error of the disk raises a SIGBUS signal instead of an OSError, which kills the whole process (see view_blocks)."""
+    
+    def __init__(self, size):
+        self.size = size
+        #key: chunk name, value: mmap.mmap class, the mapping of the chunk, from the least recently used
+        self.mappings = OrderedDict()
+        #key: chunk name, value: list with the reads mapping the chunk and its generation, bumped when the chunk is invalidated
+        self.loading = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def get_size(self):
+        """Method for getting the 'size' object attribute.
+        
+        Parameters
+        ----------
+        self --> MappedChunks class, self reference to the object instance
+        
+        Returns
+        -------
+        self.size --> int, the maximum number of chunks mapped at the same time, 0 if the chunks are never mapped
+        """
+        return self.size
+
+    def set_size(self, size):
+        """Method for setting the 'size' object attribute.
+        
+        Parameters
+        ----------
+        self --> MappedChunks class, self reference to the object instance
+        size --> int, the maximum number of chunks mapped at the same time, 0 if the chunks are never mapped
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            self.size = size
+            self.evict()
+
+    def get_stats(self):
+        """Method for getting the statistics of the mappings.
+        
+        Parameters
+        ----------
+        self --> MappedChunks class, self reference to the object instance
+        
+        Returns
+        -------
+        stats --> dict, the hits, the misses, the evictions, the invalidations, the chunks mapped and the bytes mapped
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['chunks'] = len(self.mappings)
+            stats['mapped'] = sum(len(m) for m in self.mappings.values())
+        return stats
+
+    def view(self, path, chunk_name):
+        """Method for getting the content of a chunk as a view of its mapping, which is created if the chunk is not mapped yet.
+        
+        Parameters
+        ----------
+        self --> MappedChunks class, self reference to the object instance
+        path --> str, the path of the chunk into the local file system
+        chunk_name --> str, the chunk name
+        
+        Returns
+        -------
+        content --> memoryview, the content of the chunk, its slices are not copied
+        """
+        with self.lock:
+            if chunk_name in self.mappings:
+                self.mappings.move_to_end(chunk_name)
+                self.stats['hits'] += 1
+                return memoryview(self.mappings[chunk_name])
+            self.stats['misses'] += 1
+            loading = self.loading.setdefault(chunk_name, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+        mapping = None
+        try:
+            with open(path, 'rb') as fb:
+                #an empty file can not be mapped
+                if os.fstat(fb.fileno()).st_size == 0:
+                    return memoryview(b'')
+                mapping = mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            with self.lock:
+                loading[0] -= 1
+                if loading[0] == 0:
+                    del self.loading[chunk_name]
+                #a chunk mapped meanwhile by another read, or overwritten or deleted while it was mapped, is not kept: its mapping is closed by the garbage collector when the view is released
+                if mapping is not None and chunk_name not in self.mappings and loading[1] == generation:
+                    self.mappings[chunk_name] = mapping
+                    self.evict()
+        return memoryview(mapping)
+
+    def close(self, mapping):
+        #a mapping with views still in use (e.g. a response being sent) is closed by the garbage collector when they are released
+        try:
+            mapping.close()
+        except BufferError:
+            pass
+
+    def evict(self):
+        """Method for closing the least recently used mappings until they fit the size, the lock must be held.
+        
+        Parameters
+        ----------
+        self --> MappedChunks class, self reference to the object instance
+        
+        Returns
+        -------
+        None
+        """
+        while len(self.mappings) > self.size:
+            self.close(self.mappings.popitem(last=False)[1])
+            self.stats['evictions'] += 1
+
+    def invalidate(self, chunk_names):
+        """Method for closing the mappings of the chunks overwritten or deleted.
+        
+        Parameters
+        ----------
+        self --> MappedChunks class, self reference to the object instance
+        chunk_names --> list, the names of the chunks
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            for c in chunk_names:
+                if c in self.loading:
+                    self.loading[c][1] += 1
+                if c in self.mappings:
+                    self.close(self.mappings.pop(c))
+                    self.stats['invalidations'] += 1
+
+    def clear(self):
+        """Method for closing all the mappings (e.g. after mkfs).
+        
+        Parameters
+        ----------
+        self --> MappedChunks class, self reference to the object instance
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            self.stats['invalidations'] += len(self.mappings)
+            for loading in self.loading.values():
+                loading[1] += 1
+            for mapping in self.mappings.values():
+                self.close(mapping)
+            self.mappings.clear()
+
+
+def view_blocks(view, start, stop, disks, storage, block=1048576):
+    """Function for sending a range of a memory mapped chunk in fixed size blocks, each one copied from the mapping only when it's sent (the web server writes bytes). The copies run in the pool of I/O threads of the disk, as the reads of the files: a page of the mapping not in memory yet is read from the disk by the copy. An I/O error of the disk while copying is not raised as an OSError but as a SIGBUS signal, which kills the datanode, so only the chunks of the disks which work are mapped.
+    
+    Parameters
+    ----------
+    view --> memoryview, the content of the chunk
+    start --> int, the first byte of the range
+    stop --> int, the byte after the last one of the range
+    disks --> StorageDisks class, the disks of the datanode
+    storage --> str, the storage directory of the chunk
+    block --> int, the size of each block, in bytes
+    
+    Returns
+    -------
+    blocks --> generator of bytes, the blocks of the range
+    """
+    for offset in range(start, stop, block):
+        yield disks.run(storage, view[offset:min(offset+block, stop)].tobytes)
+
+
+def file_blocks(fd, start, stop, disks, storage, block=1048576):
+    """Function for sending a range of a chunk stored into a file in fixed size blocks, each one read when it's sent; the reads run in the pool of I/O threads of the disk, so a slow disk does not hold the threads of the web server and a disk error marks the disk as bad.
+    
+    Parameters
+    ----------
+    fd --> int, the file descriptor of the chunk, closed by the caller when the response is closed
+    start --> int, the first byte of the range
+    stop --> int, the byte after the last one of the range
+    disks --> StorageDisks class, the disks of the datanode
+    storage --> str, the storage directory of the chunk
+    block --> int, the size of each block, in bytes
+    
+    Returns
+    -------
+    blocks --> generator of bytes, the blocks of the range
+    """
+    for offset in range(start, stop, block):
+        yield disks.run(storage, os.pread, fd, min(block, stop-offset), offset)
+
+
+class ChunksIndex():
+    """Class for indexing in memory the chunks stored by the datanode and the storage directory (disk) of each one, grouped by the file to which they belong (the prefix of their names before the sequence number); the chunks of a file are found without scanning the storage directories, which can hold millions of chunks. The index is built once at startup and updated at every write, copy and delete."""
+    
+    def __init__(self):
+        #key: file prefix, value: dict with key the name of a chunk stored for the file and value its storage directory
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def file_prefix(self, chunk_name):
+        #the chunks of a file are named file id_sequence number, the content addressed ones only by their hash
+        return chunk_name.split('_')[0]
+
+    def load(self, storages):
+        """Method for building the index from the chunks into the storage directories, the partial writes (.part files) and the chunks out of their place into the layout (e.g. not migrated yet) are not indexed.
+        
+        Parameters
+        ----------
+        self --> ChunksIndex class, self reference to the object instance
+        storages --> list, the storage directories to index
+        
+        Returns
+        -------
+        misplaced --> int, the number of chunks out of their place into the layout
+        """
+        files = {}
+        chunks = 0
+        misplaced = 0
+        for storage in storages:
+            for (name, path) in walk_chunks(storage):
+                if path != chunk_path(storage, name):
+                    misplaced += 1
+                    continue
+                files.setdefault(self.file_prefix(name), {})[name] = storage
+                chunks += 1
+        with self.lock:
+            self.files = files
+        logging.info('Indexed {} chunks of {} files'.format(chunks, len(files)))
+        return misplaced
+
+    def add(self, chunk_name, storage):
+        """Method for adding a chunk written to the index.
+        
+        Parameters
+        ----------
+        self --> ChunksIndex class, self reference to the object instance
+        chunk_name --> str, the name of the chunk
+        storage --> str, the storage directory in which the chunk has been written
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            self.files.setdefault(self.file_prefix(chunk_name), {})[chunk_name] = storage
+
+    def remove(self, chunk_names):
+        """Method for removing the chunks deleted from the index.
+        
+        Parameters
+        ----------
+        self --> ChunksIndex class, self reference to the object instance
+        chunk_names --> list, the names of the chunks
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            for c in chunk_names:
+                chunks = self.files.get(self.file_prefix(c))
+                if chunks is not None:
+                    chunks.pop(c, None)
+                    if not chunks:
+                        del self.files[self.file_prefix(c)]
+
+    def remove_storage(self, storage):
+        """Method for removing from the index all the chunks of a storage directory (e.g. of a failed disk).
+        
+        Parameters
+        ----------
+        self --> ChunksIndex class, self reference to the object instance
+        storage --> str, the storage directory
+        
+        Returns
+        -------
+        chunks --> list, the names of the chunks removed
+        """
+        with self.lock:
+            chunks = [c for f in self.files.values() for c in f if f[c] == storage]
+        self.remove(chunks)
+        return chunks
+
+    def locate(self, chunk_name):
+        """Method for getting the storage directory of a chunk.
+        
+        Parameters
+        ----------
+        self --> ChunksIndex class, self reference to the object instance
+        chunk_name --> str, the name of the chunk
+        
+        Returns
+        -------
+        storage --> str, the storage directory of the chunk, None if the chunk is not stored
+        """
+        with self.lock:
+            return self.files.get(self.file_prefix(chunk_name), {}).get(chunk_name)
+
+    def find(self, prefix):
+        """Method for finding the chunks whose names start with a prefix (as a glob of prefix* into the storage directories); a file prefix costs only the chunks of the file, any other prefix a scan of the files indexed, never of the disks.
+        
+        Parameters
+        ----------
+        self --> ChunksIndex class, self reference to the object instance
+        prefix --> str, the prefix of the names of the chunks (e.g. the id of a file)
+        
+        Returns
+        -------
+        chunks --> list, the names of the chunks found
+        """
+        with self.lock:
+            #the file ids and the hashes have a fixed length, so a file prefix is not the prefix of other files
+            if prefix in self.files:
+                return list(self.files[prefix])
+            if '_' in prefix:
+                return [c for c in self.files.get(self.file_prefix(prefix), ()) if c.startswith(prefix)]
+            return [c for f in self.files if f.startswith(prefix) for c in self.files[f]]
+
+    def clear(self):
+        """Method for removing all the chunks from the index (e.g. after mkfs).
+        
+        Parameters
+        ----------
+        self --> ChunksIndex class, self reference to the object instance
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            self.files = {}
+
+
+class ContainerStore():
+    """Class for packing the small chunks of a datanode into big append-only files (containers), one being written for each storage directory at a time; each chunk is a record of a container, located in memory by its offset and length, so a small chunk costs neither an inode nor an open and a close of its own. A deletion appends a record which masks the chunk, and the containers with too much garbage (deleted or overwritten chunks) are compacted, copying their live chunks into the container being written."""
+    
+    def __init__(self, small_size, container_size, ratio):
+        self.small_size = small_size
+        self.container_size = container_size
+        self.ratio = ratio
+        #key: chunk name, value: tuple(storage directory, container id, offset of the record, size of the record, time of the write)
+        self.chunks = {}
+        #key: tuple(storage directory, container id), value: dict with the file descriptor, the size, the bytes of garbage, the chunks deleted by its records, the reads in progress and if it has been removed
+        self.containers = {}
+        #key: storage directory, value: the id of the container being written
+        self.active = {}
+        self.compacting = set()
+        #key: storage directory, value: the lock held while appending a record to its containers, so the writes of the other storage directories and the reads go on meanwhile
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get_small_size(self):
+        """Method for getting the 'small_size' object attribute.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        
+        Returns
+        -------
+        self.small_size --> int, the size of the biggest chunk packed, in bytes
+        """
+        return self.small_size
+
+    def set_small_size(self, small_size):
+        """Method for setting the 'small_size' object attribute.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        small_size --> int, the size of the biggest chunk packed, in bytes
+        
+        Returns
+        -------
+        None
+        """
+        self.small_size = small_size
+
+    def get_container_size(self):
+        """Method for getting the 'container_size' object attribute.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        
+        Returns
+        -------
+        self.container_size --> int, the size at which a container is closed and a new one is opened, in bytes
+        """
+        return self.container_size
+
+    def set_container_size(self, container_size):
+        """Method for setting the 'container_size' object attribute.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        container_size --> int, the size at which a container is closed and a new one is opened, in bytes
+        
+        Returns
+        -------
+        None
+        """
+        self.container_size = container_size
+
+    def get_ratio(self):
+        """Method for getting the 'ratio' object attribute.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        
+        Returns
+        -------
+        self.ratio --> float, the fraction of garbage at which a container is compacted
+        """
+        return self.ratio
+
+    def set_ratio(self, ratio):
+        """Method for setting the 'ratio' object attribute.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        ratio --> float, the fraction of garbage at which a container is compacted
+        
+        Returns
+        -------
+        None
+        """
+        self.ratio = ratio
+
+    def fits(self, size):
+        """Method for checking if a chunk is small enough for being packed.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        size --> int, the size of the chunk, in bytes, None if it's not known
+        
+        Returns
+        -------
+        small --> bool, True if the chunk must be packed
+        """
+        return self.small_size > 0 and size is not None and size <= self.small_size
+
+    def container_path(self, storage, container_id):
+        """Method for getting the path of a container; the containers are named by an increasing id, so the older ones come first.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        container_id --> int, the id of the container
+        
+        Returns
+        -------
+        path --> str, the path of the container
+        """
+        return os.path.join(storage, containers_directory, 'container.{:08d}'.format(container_id))
+
+    def storage_lock(self, storage):
+        """Method for getting the lock of a storage directory, held while appending a record to its containers, so the records of a storage directory are appended one at a time.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        
+        Returns
+        -------
+        lock --> threading.Lock class, the lock of the storage directory, created the first time
+        """
+        with self.lock:
+            return self.locks.setdefault(storage, threading.Lock())
+
+    def open(self, storage, container_id, durability='none'):
+        """Method for opening a container of a storage directory, creating it (and the directory of the containers) if it does not exist; the lock of the storage directory must be held (see storage_lock), or the store must not be used yet (e.g. while loading).
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        container_id --> int, the id of the container
+        durability --> str, either none, chunk or group (see utils.get_durability), if not none the directory of a new container is synced
+        
+        Returns
+        -------
+        container --> dict, the file descriptor (key: fd), the size (key: size), the bytes of garbage (key: garbage), the chunks deleted (key: deleted), the reads in progress (key: readers) and if it has been removed (key: removed)
+        """
+        directory = os.path.join(storage, containers_directory)
+        created = not os.path.isdir(directory)
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.container_path(storage, container_id), os.O_RDWR | os.O_CREAT, 0o644)
+        container = {'fd': fd, 'size': os.fstat(fd).st_size, 'garbage': 0, 'deleted': set(), 'readers': 0, 'removed': False}
+        #a new container is durable only when its directory is synced too
+        if durability != 'none':
+            sync_directory(directory)
+            if created:
+                sync_directory(storage)
+        with self.lock:
+            self.containers[(storage, container_id)] = container
+        return container
+
+    def load(self, storage, index):
+        """Method for loading the containers of a storage directory and adding their chunks to the index of the datanode. The records after the last complete one of the newest container (e.g. a write interrupted by a crash) are truncated; a corrupted record of an older container (e.g. by the disk) is skipped up to the next valid one and becomes garbage, its chunk is lost. A chunk stored both into a container and into a file of its own (e.g. a crash while overwriting it) is taken from the newest one and the other is dropped.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        index --> ChunksIndex class, the index of the chunks stored by the datanode, already loaded with the chunks stored into files
+        
+        Returns
+        -------
+        lost --> list, the names of the chunks whose last record is corrupted, which must be replicated again
+        """
+        directory = os.path.join(storage, containers_directory)
+        if not os.path.isdir(directory):
+            return []
+        ids = sorted(int(name.split('.')[1]) for name in os.listdir(directory) if name.startswith('container.') and not name.endswith('.part'))
+        corrupted = []
+        for container_id in ids:
+            container = self.open(storage, container_id)
+            offset = 0
+            while offset < container['size']:
+                record = None
+                header = os.pread(container['fd'], record_header.size, offset)
+                if len(header) == record_header.size:
+                    (written, name_length, length, deleted) = record_header.unpack(header)
+                    size = record_header.size + name_length + length + 4
+                    #a corrupted length is not read
+                    if offset + size <= container['size']:
+                        record = unpack_record(os.pread(container['fd'], size, offset))
+                if record is None:
+                    (skipped, chunk_name) = self.skip(container, offset)
+                    if container_id == ids[-1] and offset + skipped == container['size']:
+                        logging.warning('Container {} truncated from {} to {} bytes, its last record is not complete'.format(self.container_path(storage, container_id), container['size'], offset))
+                        os.ftruncate(container['fd'], offset)
+                        container['size'] = offset
+                        break
+                    logging.error('Container {} corrupted: {} bytes skipped at offset {}, chunk {} lost'.format(self.container_path(storage, container_id), skipped, offset, chunk_name))
+                    container['garbage'] += skipped
+                    if chunk_name is not None:
+                        self.supersede(chunk_name)
+                        corrupted.append(chunk_name)
+                    offset += skipped
+                    continue
+                (written, chunk_name, deleted, size) = record
+                self.supersede(chunk_name)
+                if deleted:
+                    container['deleted'].add(chunk_name)
+                    container['garbage'] += size
+                else:
+                    self.chunks[chunk_name] = (storage, container_id, offset, size, written)
+                offset += size
+            self.active[storage] = container_id
+        packed = [c for c in self.chunks if self.chunks[c][0] == storage]
+        for c in packed:
+            if index.locate(c) == storage:
+                path = chunk_path(storage, c)
+                if os.path.getmtime(path) > self.chunks[c][4]:
+                    self.supersede(c)
+                    continue
+                os.remove(path)
+            index.add(c, storage)
+        #a chunk written again after its corrupted record is not lost
+        lost = [c for c in set(corrupted) if c not in self.chunks]
+        chunks = len([c for c in self.chunks if self.chunks[c][0] == storage])
+        logging.info('Loaded {} containers with {} chunks from {}'.format(len(ids), chunks, storage))
+        if lost:
+            logging.critical('{} chunks lost with the corrupted records of the containers of {}, they will be replicated again'.format(len(lost), storage))
+        return lost
+        
+    def skip(self, container, offset):
+        """Method for skipping a corrupted record of a container: the next valid record is searched byte by byte, a corrupted one matching its checksum being unlikely; the name of the chunk of the corrupted record is taken if it's still readable.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        container --> dict, the container (see open)
+        offset --> int, the offset of the corrupted record
+        
+        Returns
+        -------
+        (skipped, chunk_name) --> tuple(int, str), the bytes to skip up to the next valid record (or the end of the container), the name of the chunk of the corrupted record, None if it's not readable
+        """
+        rest = memoryview(os.pread(container['fd'], container['size']-offset, offset))
+        chunk_name = None
+        if len(rest) >= record_header.size:
+            name_length = record_header.unpack_from(rest)[1]
+            try:
+                chunk_name = bytes(rest[record_header.size:record_header.size+name_length]).decode('ascii')
+            except UnicodeDecodeError:
+                pass
+            if not chunk_name or not chunk_name.isprintable() or len(chunk_name) != name_length:
+                chunk_name = None
+        for skipped in range(1, len(rest)):
+            if unpack_record(rest[skipped:]) is not None:
+                return (skipped, chunk_name)
+        return (len(rest), chunk_name)
+        
+    def supersede(self, chunk_name):
+        """Method for dropping a chunk from the index of the packed chunks, its record becomes garbage of its container (e.g. the chunk has been overwritten or deleted); the lock of the store must be held, or the store must not be used yet (e.g. while loading).
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        chunk_name --> str, the name of the chunk
+        
+        Returns
+        -------
+        None
+        """
+        location = self.chunks.pop(chunk_name, None)
+        if location is not None:
+            self.containers[location[:2]]['garbage'] += location[3]
+        
+    def write(self, storage, chunk_name, content, deleted=False, written=None, expected=None):
+        """Method for appending the record of a chunk to the container being written of a storage directory, a new one is opened when it's full; the lock of the storage directory must be held (see storage_lock). The container written is returned with a read in progress, so it stays open until it's synced and released (see sync).
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        chunk_name --> str, the name of the chunk
+        content --> bytes, the content of the chunk, empty for a deletion record
+        deleted --> bool, if True the record deletes the chunk
+        written --> float, the time at which the chunk has been written, if None the current one (a compaction keeps the one of the moved record)
+        expected --> tuple, the location of the chunk being moved by a compaction, the record becomes garbage if the chunk has been overwritten or deleted meanwhile; None if the chunk is not moved
+        
+        Returns
+        -------
+        container --> dict, the container written (see open)
+        """
+        name = chunk_name.encode()
+        record = record_header.pack(written or time.time(), len(name), len(content), deleted) + name + content
+        record += struct.pack('>I', zlib.crc32(record))
+        with self.lock:
+            container_id = self.active.get(storage)
+            container = self.containers.get((storage, container_id))
+            full = container is None or (container['size'] > 0 and container['size'] + len(record) > self.container_size)
+            if not full:
+                container['readers'] += 1
+        if full:
+            container_id = 1 if container_id is None else container_id+1
+            container = self.open(storage, container_id, 'chunk')
+            with self.lock:
+                self.active[storage] = container_id
+                container['readers'] += 1
+        offset = container['size']
+        try:
+            #a record not written completely is overwritten by the next one
+            if os.pwrite(container['fd'], record, offset) != len(record):
+                raise IOError('Chunk {} not packed: short write into the container'.format(chunk_name))
+        except OSError:
+            self.release(container)
+            raise
+        with self.lock:
+            container['size'] += len(record)
+            #a chunk moved by a compaction is garbage if it has been overwritten or deleted meanwhile
+            if expected is not None and self.chunks.get(chunk_name) != expected:
+                container['garbage'] += len(record)
+                return container
+            self.supersede(chunk_name)
+            if deleted:
+                container['deleted'].add(chunk_name)
+                container['garbage'] += len(record)
+            else:
+                self.chunks[chunk_name] = (storage, container_id, offset, len(record), written or record_header.unpack(record[:record_header.size])[0])
+        return container
+        
+    def sync(self, containers, durability, group_commit=None):
+        """Method for syncing to the disk the records appended to some containers (e.g. both the full one and the new one when a record opens the next container), then they are released.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        containers --> list, the containers returned by the writes of the records
+        durability --> str, either none, chunk or group (see utils.get_durability)
+        group_commit --> GroupCommitThread class, the thread which syncs the chunks with the group durability
+        
+        Returns
+        -------
+        None
+        """
+        try:
+            #each container is synced once, even if many records have been written into it
+            for container in {id(c): c for c in containers}.values():
+                if durability == 'chunk':
+                    os.fsync(container['fd'])
+                elif durability == 'group':
+                    group_commit.commit(container['fd'], None, None)
+        finally:
+            for container in containers:
+                self.release(container)
+        
+    def append(self, storage, chunk_name, content, durability, group_commit=None):
+        """Method for packing a chunk into the container being written of a storage directory; an overwritten chunk becomes garbage of its old container.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        chunk_name --> str, the name of the chunk
+        content --> bytes, the content of the chunk
+        durability --> str, either none, chunk or group (see utils.get_durability)
+        group_commit --> GroupCommitThread class, the thread which syncs the chunks with the group durability
+        
+        Returns
+        -------
+        size --> int, the size of the chunk, in bytes
+        """
+        with self.storage_lock(storage):
+            container = self.write(storage, chunk_name, content)
+        self.sync([container], durability, group_commit)
+        return len(content)
+        
+    def remove(self, storage, chunk_names, durability, group_commit=None):
+        """Method for deleting chunks packed into the containers of a storage directory, appending a deletion record for each one; the records are synced together.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        chunk_names --> list, the names of the chunks
+        durability --> str, either none, chunk or group (see utils.get_durability)
+        group_commit --> GroupCommitThread class, the thread which syncs the chunks with the group durability
+        
+        Returns
+        -------
+        removed --> list, the names of the chunks deleted
+        """
+        removed = []
+        written = []
+        try:
+            with self.storage_lock(storage):
+                for c in chunk_names:
+                    with self.lock:
+                        packed = c in self.chunks and self.chunks[c][0] == storage
+                    if packed:
+                        written.append(self.write(storage, c, b'', True))
+                        removed.append(c)
+        finally:
+            self.sync(written, durability, group_commit)
+        return removed
+        
+    def locate(self, chunk_name):
+        """Method for getting the storage directory of a packed chunk.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        chunk_name --> str, the name of the chunk
+        
+        Returns
+        -------
+        storage --> str, the storage directory of the chunk, None if the chunk is not packed
+        """
+        with self.lock:
+            location = self.chunks.get(chunk_name)
+        return location[0] if location is not None else None
+
+    def read(self, chunk_name):
+        """Method for reading a packed chunk, with a single read at its offset into the container, which is kept open.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        chunk_name --> str, the name of the chunk
+        
+        Returns
+        -------
+        content --> bytes, the content of the chunk
+        """
+        with self.lock:
+            location = self.chunks.get(chunk_name)
+            if location is None:
+                raise FileNotFoundError(errno.ENOENT, 'Chunk not packed', chunk_name)
+            container = self.containers[location[:2]]
+            #a container compacted meanwhile is closed only after the reads in progress
+            container['readers'] += 1
+        try:
+            skip = record_header.size + len(chunk_name.encode())
+            return os.pread(container['fd'], location[3]-skip-4, location[2]+skip)
+        finally:
+            self.release(container)
+
+    def release(self, container):
+        """Method for ending a read (or a write, see write) of a container; the file descriptor of a removed container is closed by the last one.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        container --> dict, the container (see open)
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            container['readers'] -= 1
+            close = container['removed'] and container['readers'] == 0
+        if close:
+            os.close(container['fd'])
+
+    def needs_compaction(self, storage):
+        """Method for checking if some containers of a storage directory have enough garbage for being compacted; the container being written is never compacted.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        
+        Returns
+        -------
+        containers --> list, the ids of the containers to compact
+        """
+        with self.lock:
+            return sorted(i for (s, i) in self.containers if s == storage and i != self.active.get(storage) and self.containers[(s, i)]['garbage'] >= self.ratio*max(self.containers[(s, i)]['size'], 1))
+
+    def compact(self, storage):
+        """Method for compacting the containers of a storage directory with too much garbage: their live chunks are appended to the containers being written, which are all synced, then they are removed. The deletion records are kept only if an older container can still hold the chunks they delete.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        storage --> str, the storage directory
+        
+        Returns
+        -------
+        moved --> int, the number of chunks moved
+        """
+        with self.lock:
+            if storage in self.compacting:
+                return 0
+            self.compacting.add(storage)
+        moved = 0
+        try:
+            for container_id in self.needs_compaction(storage):
+                with self.lock:
+                    container = self.containers[(storage, container_id)]
+                    live = [c for c in self.chunks if self.chunks[c][:2] == (storage, container_id)]
+                    older = any(s == storage and i < container_id for (s, i) in self.containers)
+                copied = 0
+                written = []
+                try:
+                    for c in live:
+                        #a chunk overwritten or deleted meanwhile is not moved
+                        with self.lock:
+                            location = self.chunks.get(c)
+                            if location is None or location[:2] != (storage, container_id):
+                                continue
+                            container['readers'] += 1
+                        try:
+                            skip = record_header.size + len(c.encode())
+                            content = os.pread(container['fd'], location[3]-skip-4, location[2]+skip)
+                        finally:
+                            self.release(container)
+                        with self.storage_lock(storage):
+                            written.append(self.write(storage, c, content, False, location[4], location))
+                        copied += 1
+                    with self.lock:
+                        deleted = [c for c in container['deleted'] if older and c not in self.chunks]
+                    with self.storage_lock(storage):
+                        for c in deleted:
+                            written.append(self.write(storage, c, b'', True))
+                finally:
+                    #the chunks moved must be durable before their old container is removed, in whichever containers they have been written
+                    self.sync(written, 'chunk')
+                with self.lock:
+                    del self.containers[(storage, container_id)]
+                    container['removed'] = True
+                    container['readers'] += 1
+                self.release(container)
+                os.remove(self.container_path(storage, container_id))
+                sync_directory(os.path.join(storage, containers_directory))
+                moved += copied
+                logging.info('Container {} compacted: {} chunks moved'.format(self.container_path(storage, container_id), copied))
+        except OSError as e:
+            logging.error('Containers of {} not compacted: {}'.format(storage, e))
+        finally:
+            with self.lock:
+                self.compacting.discard(storage)
+        return moved
+
+    def clear(self):
+        """Method for forgetting all the containers (e.g. after mkfs), which are closed.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            containers = list(self.containers.values())
+            self.containers = {}
+            self.chunks = {}
+            self.active = {}
+        for container in containers:
+            container['removed'] = True
+            container['readers'] += 1
+            self.release(container)
+
+    def get_stats(self):
+        """Method for getting the statistics of the containers.
+        
+        Parameters
+        ----------
+        self --> ContainerStore class, self reference to the object instance
+        
+        Returns
+        -------
+        stats --> dict, the containers, the chunks packed, the bytes used and the bytes of garbage
+        """
+        with self.lock:
+            return {'containers': len(self.containers), 'chunks': len(self.chunks), 'size': sum(c['size'] for c in self.containers.values()), 'garbage': sum(c['garbage'] for c in self.containers.values())}
+
+
+class StorageDisks():
+    """Class for handling the storage directories of a datanode, one for each of its disks (JBOD); each disk has its own pool of I/O threads, so a slow disk does not block the others, and the new chunks are written into the disk with the most free space for each I/O in flight. A disk which fails is marked as bad and not used anymore, the chunks stored into it are lost and reported to the namenode for being replicated again, while the datanode keeps working with the other disks."""
     
-    Returns
-    -------
-    None
-    """
-    chunk_replicas = json.loads(chunk_replicas)
-    try:
-        #take the first datanode to which write the new replica
-        host = chunk_replicas.pop(0)
-    except: #there isn't any datanode to write the new replica, then exit
-        return
-    #start the write process for the new datanode
-    try:
-        put('http://{}/chunks'.format(host), data={'chunk_replicas': json.dumps(chunk_replicas), 'chunk_name': chunk_name, 'chunk_payload': chunk_payload})
-        logging.info('Write chunk {} replica to {}'.format(chunk_name, 'http://{}/chunks'.format(host)))
-    except RequestException as e:
-        raise SystemExit(e)
-        logging.error(str(e))
+    def __init__(self, storages, workers, index):
+        #key: storage directory, value: dict with the pool of I/O threads, the I/O in flight and if the disk is bad
+        self.disks = OrderedDict()
+        for storage in storages:
+            self.disks[storage] = {'executor': ThreadPoolExecutor(max_workers=workers, thread_name_prefix='disk'), 'in_flight': 0, 'bad': False}
+        self.index = index
+        #the chunks lost by the failed disks, not reported to the namenode yet
+        self.lost = []
+        self.lock = threading.Lock()
+
+    def get_index(self):
+        """Method for getting the 'index' object attribute.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        
+        Returns
+        -------
+        self.index --> ChunksIndex class, the index of the chunks stored into the disks
+        """
+        return self.index
+
+    def set_index(self, index):
+        """Method for setting the 'index' object attribute.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        index --> ChunksIndex class, the index of the chunks stored into the disks
+        
+        Returns
+        -------
+        None
+        """
+        self.index = index
+
+    def get_storages(self):
+        """Method for getting all the storage directories, bad ones included (e.g. for mkfs).
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        
+        Returns
+        -------
+        storages --> list, the storage directories
+        """
+        return list(self.disks)
+
+    def get_good(self):
+        """Method for getting the storage directories of the disks which work.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        
+        Returns
+        -------
+        storages --> list, the storage directories not marked as bad
+        """
+        with self.lock:
+            return [storage for storage in self.disks if not self.disks[storage]['bad']]
+
+    def probe(self):
+        """Method for checking that all the disks work (e.g. at startup); it must be called once the index has been built, so the chunks of a disk which does not work are reported as lost.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        
+        Returns
+        -------
+        good --> list, the storage directories of the disks which work
+        """
+        for storage in self.get_storages():
+            self.check(storage)
+        return self.get_good()
+
+    def check(self, storage):
+        """Method for checking that a disk works, writing and removing a small file into its storage directory; a disk which does not work is marked as bad.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        storage --> str, the storage directory
+        
+        Returns
+        -------
+        good --> bool, True if the disk works
+        """
+        probe = os.path.join(storage, '.probe.{}.part'.format(uuid.uuid4().hex))
+        try:
+            os.makedirs(storage, exist_ok=True)
+            with open(probe, 'wb') as fb:
+                fb.write(b'probe')
+            os.remove(probe)
+            return True
+        except OSError as e:
+            self.mark_bad(storage, e)
+            return False
+
+    def mark_bad(self, storage, error):
+        """Method for marking a disk as bad; its chunks are removed from the index and recorded as lost.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        storage --> str, the storage directory of the disk
+        error --> OSError class, the error which has made the disk bad
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            if self.disks[storage]['bad']:
+                return
+            self.disks[storage]['bad'] = True
+        logging.critical('Disk {} marked as bad: {}'.format(storage, error))
+        lost = self.index.remove_storage(storage)
+        self.add_lost(lost)
+        logging.critical('{} chunks lost with disk {}, they will be replicated again'.format(len(lost), storage))
+
+    def add_lost(self, chunks):
+        """Method for recording chunks as lost, so they are reported to the namenode (e.g. the chunks of a failed disk or of the corrupted records of a container).
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        chunks --> list, the names of the chunks lost
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            self.lost.extend(chunks)
+
+    def get_lost(self, limit=None):
+        """Method for getting the chunks lost by the failed disks and not reported to the namenode yet.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        limit --> int, the maximum number of chunks returned, the ones lost first; None for all of them
+        
+        Returns
+        -------
+        lost --> list, the names of the chunks lost
+        """
+        with self.lock:
+            return self.lost[:limit]
+
+    def reported(self, chunks):
+        """Method for forgetting the lost chunks reported to the namenode.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        chunks --> list, the names of the chunks reported
+        
+        Returns
+        -------
+        None
+        """
+        reported = set(chunks)
+        with self.lock:
+            self.lost = [c for c in self.lost if c not in reported]
+
+    def choose(self):
+        """Method for choosing the disk into which a new chunk is written, at random with a weight equal to its free space for each I/O in flight, so the disks fill up evenly and a busy disk gets less writes.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        
+        Returns
+        -------
+        storage --> str, the storage directory of the disk
+        """
+        scores = {}
+        for storage in self.get_good():
+            try:
+                scores[storage] = shutil.disk_usage(storage).free/(1+self.disks[storage]['in_flight'])
+            except OSError as e:
+                self.mark_bad(storage, e)
+        if not scores:
+            raise IOError('No disk available')
+        return random.choices(list(scores), weights=[max(w, 1) for w in scores.values()])[0]
+
+    def submit(self, storage, func, *args):
+        """Method for submitting an I/O operation to the pool of a disk; if the disk fails, it's marked as bad.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        storage --> str, the storage directory of the disk
+        func --> function, the I/O operation
+        args --> the arguments of the operation
+        
+        Returns
+        -------
+        future --> concurrent.futures.Future class, the future of the result of the operation
+        """
+        with self.lock:
+            self.disks[storage]['in_flight'] += 1
+        future = self.disks[storage]['executor'].submit(func, *args)
+        future.add_done_callback(functools.partial(self.done, storage))
+        return future
+
+    def done(self, storage, future):
+        """Method called when an I/O operation of a disk ends, the disk is marked as bad if the operation has failed for a device error.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        storage --> str, the storage directory of the disk
+        future --> concurrent.futures.Future class, the future of the operation
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            self.disks[storage]['in_flight'] -= 1
+        e = future.exception()
+        #the errors of the device, not the ones of the single chunk (e.g. not found)
+        if isinstance(e, OSError) and e.errno in disk_errors:
+            self.mark_bad(storage, e)
+
+    def run(self, storage, func, *args):
+        """Method for running an I/O operation into the pool of a disk, waiting for its result; the errors of the operation are raised.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        storage --> str, the storage directory of the disk
+        func --> function, the I/O operation
+        args --> the arguments of the operation
+        
+        Returns
+        -------
+        result --> the result of the operation
+        """
+        return self.submit(storage, func, *args).result()
+
+    def get_stats(self):
+        """Method for getting the status of the disks.
+        
+        Parameters
+        ----------
+        self --> StorageDisks class, self reference to the object instance
+        
+        Returns
+        -------
+        stats --> dict, key: storage directory, value: dict with the I/O in flight and if the disk is bad
+        """
+        with self.lock:
+            return {storage: {'in_flight': self.disks[storage]['in_flight'], 'bad': self.disks[storage]['bad']} for storage in self.disks}
+
+
+class DeletionThread(threading.Thread):
+    """Thread Class for deleting in background the chunks of the files removed, in batches taken from the deletion queue of the master namenode with the answers to the heartbeats; a batch done is acknowledged with the next heartbeat, then the namenode removes it from the queue. A batch can be received again (e.g. after a restart of the datanode, before it has been acknowledged), deleting its chunks again does nothing."""
+    
+    def __init__(self, delete):
+        threading.Thread.__init__(self, daemon=True)
+        self.delete = delete
+        #key: id of a batch received and not done yet, value: the prefixes of the files to delete
+        self.pending = OrderedDict()
+        #the ids of the batches done and not acknowledged yet
+        self.done = []
+        self.batches = queue.Queue()
+        self.lock = threading.Lock()
+
+    def get_delete(self):
+        """Method for getting the 'delete' object attribute.
+        
+        Parameters
+        ----------
+        self --> DeletionThread class, self reference to the object instance
+        
+        Returns
+        -------
+        self.delete --> function, the function which deletes the chunks of some files, given their prefixes
+        """
+        return self.delete
+
+    def set_delete(self, delete):
+        """Method for setting the 'delete' object attribute.
+        
+        Parameters
+        ----------
+        self --> DeletionThread class, self reference to the object instance
+        delete --> function, the function which deletes the chunks of some files, given their prefixes
+        
+        Returns
+        -------
+        None
+        """
+        self.delete = delete
+
+    def get_pending(self):
+        """Method for getting the batches received and not done yet.
+        
+        Parameters
+        ----------
+        self --> DeletionThread class, self reference to the object instance
+        
+        Returns
+        -------
+        pending --> list, the ids of the batches
+        """
+        with self.lock:
+            return list(self.pending)
+
+    def get_done(self):
+        """Method for getting the batches done and not acknowledged yet.
+        
+        Parameters
+        ----------
+        self --> DeletionThread class, self reference to the object instance
+        
+        Returns
+        -------
+        done --> list, the ids of the batches
+        """
+        with self.lock:
+            return list(self.done)
+
+    def schedule(self, batches):
+        """Method for scheduling the batches received from the namenode, the ones already received are skipped.
+        
+        Parameters
+        ----------
+        self --> DeletionThread class, self reference to the object instance
+        batches --> list, the batches, each one a dict with its id and the prefixes of the files to delete
+        
+        Returns
+        -------
+        None
+        """
+        with self.lock:
+            for b in batches:
+                if b['id'] in self.pending or b['id'] in self.done:
+                    continue
+                self.pending[b['id']] = b['prefixes']
+                self.batches.put(b['id'])
+
+    def acknowledged(self, ids):
+        """Method for forgetting the batches acknowledged to the namenode.
+        
+        Parameters
+        ----------
+        self --> DeletionThread class, self reference to the object instance
+        ids --> list, the ids of the batches
+        
+        Returns
+        -------
+        None
+        """
+        acknowledged = set(ids)
+        with self.lock:
+            self.done = [i for i in self.done if i not in acknowledged]
+
+    def run(self):
+        """Method for deleting the chunks of the batches scheduled, a batch at a time."""
+        while True:
+            batch_id = self.batches.get()
+            with self.lock:
+                prefixes = self.pending[batch_id]
+            try:
+                self.delete(prefixes)
+                logging.info('Deleted the chunks of {} files'.format(len(prefixes)))
+            except Exception as e:
+                #the chunks not deleted (e.g. on a failed disk) remain as garbage
+                logging.error('Chunks of {} files not deleted: {}'.format(len(prefixes), e))
+            with self.lock:
+                del self.pending[batch_id]
+                self.done.append(batch_id)
 
 
-async def send_heartbeat(heartbeat_to, datanode):
+async def send_heartbeat(heartbeat_to, datanode, lost_chunks=None, deleted=None, pending=None):
     """Function for sending a heartbeat to the namenode in order to report all works well; the heartbeat is sent using a web socket.
     
     Parameters
     ----------
     heartbeat_to --> str, the identity of the namenode to which the datanode sends a heartbeat
     datanode --> str, the identity of the datanode which sends a heartbeat
+    lost_chunks --> list, the chunks lost by the failed disks of the datanode, which the namenode must replicate again
+    deleted --> list, the ids of the batches of the deletion queue done, which the namenode must remove from the queue
+    pending --> list, the ids of the batches of the deletion queue in progress, which the namenode must not send again
     
     Returns
     -------
-    None
+    deletions --> list, the batches of the deletion queue sent by the namenode with the answer, each one a dict with its id and the prefixes of the files to delete
     """
     uri = 'ws://{}'.format(heartbeat_to)
     async with websockets.connect(uri) as websocket:
-        #send the heartbeat to the master namenode
-        await websocket.send(datanode)
+        #send the heartbeat to the master namenode, with the lost chunks and the deletions if any
+        if lost_chunks or deleted or pending:
+            await websocket.send(json.dumps({'datanode': datanode, 'lost_chunks': lost_chunks or [], 'deleted': deleted or [], 'pending': pending or []}))
+        else:
+            await websocket.send(datanode)
         #wait for the answer from the master namenode
         answer = await websocket.recv()
+        if answer.startswith('{'):
+            answer = json.loads(answer)
+            logging.info(answer['answer'])
+            return answer['deletions']
         logging.info(answer)
+        return []
         
 
 class HeartbeatThread(threading.Thread):
     """Thread Class for sending at regular time intervals a heartbeat to the namenode in order to report all works well; the heartbeat is sent every 2 seconds."""
     
-    def __init__(self, loop, heartbeat_to, host_master, port_master, datanode):
+    def __init__(self, loop, heartbeat_to, host_master, port_master, datanode, disks=None, deletions=None):
         threading.Thread.__init__(self)
         self.loop = loop
         self.heartbeat_to = heartbeat_to
         self.host_master = host_master
         self.port_master = port_master
         self.datanode = datanode
+        self.disks = disks
+        self.deletions = deletions
         self.down_count = 0
 
     def get_loop(self):
@@ -260,6 +2091,60 @@ class HeartbeatThread(threading.Thread):
         """
         self.datanode = datanode  
 
+    def get_disks(self):
+        """Method for getting the 'disks' object attribute.
+        
+        Parameters
+        ----------
+        self --> HeartbeatThread class, self reference to the object instance
+        
+        Returns
+        -------
+        self.disks --> StorageDisks class, the disks of this datanode, whose lost chunks are reported with the heartbeats
+        """
+        return self.disks
+
+    def set_disks(self, disks):
+        """Method for setting the 'disks' object attribute.
+        
+        Parameters
+        ----------
+        self --> HeartbeatThread class, self reference to the object instance
+        disks --> StorageDisks class, the disks of this datanode, whose lost chunks are reported with the heartbeats
+        
+        Returns
+        -------
+        None
+        """
+        self.disks = disks
+
+    def get_deletions(self):
+        """Method for getting the 'deletions' object attribute.
+        
+        Parameters
+        ----------
+        self --> HeartbeatThread class, self reference to the object instance
+        
+        Returns
+        -------
+        self.deletions --> DeletionThread class, the thread which deletes the chunks of the batches of the deletion queue
+        """
+        return self.deletions
+        
+    def set_deletions(self, deletions):
+        """Method for setting the 'deletions' object attribute.
+        
+        Parameters
+        ----------
+        self --> HeartbeatThread class, self reference to the object instance
+        deletions --> DeletionThread class, the thread which deletes the chunks of the batches of the deletion queue
+        
+        Returns
+        -------
+        None
+        """
+        self.deletions = deletions
+        
     def get_down_count(self):
         """Method for getting the 'down_count' object attribute.
         
@@ -302,8 +2187,16 @@ class HeartbeatThread(threading.Thread):
             try:
                 if self.get_heartbeat_to():
                     logging.info('Send heartbeat to {}'.format(self.get_heartbeat_to()))
-                    #send a heartbeat
-                    self.get_loop().run_until_complete(send_heartbeat(self.get_heartbeat_to(), self.get_datanode()))
+                    #send a heartbeat, the lost chunks are reported until the namenode gets them, a batch for each heartbeat
+                    lost_chunks = self.get_disks().get_lost(lost_chunks_batch) if self.get_disks() is not None else []
+                    #the batches of the deletion queue done are acknowledged, the ones in progress are not sent again
+                    (deleted, pending) = (self.get_deletions().get_done(), self.get_deletions().get_pending()) if self.get_deletions() is not None else ([], [])
+                    batches = self.get_loop().run_until_complete(send_heartbeat(self.get_heartbeat_to(), self.get_datanode(), lost_chunks, deleted, pending))
+                    if lost_chunks:
+                        self.get_disks().reported(lost_chunks)
+                    if self.get_deletions() is not None:
+                        self.get_deletions().acknowledged(deleted)
+                        self.get_deletions().schedule(batches)
                     #wait for 2 second before the next heartbeat
                     time.sleep(2)
                 else: 
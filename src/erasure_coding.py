@@ -0,0 +1,248 @@
+import struct
+from exceptions import NotEnoughCellsException
+
+#arithmetic over GF(2^8) with the primitive polynomial x^8+x^4+x^3+x^2+1 (0x11d), the same one used by most Reed-Solomon implementations
+gf_exp = [0]*512
+gf_log = [0]*256
+for power in range(255):
+    gf_exp[power] = (gf_exp[power-1] << 1) ^ (0x11d if gf_exp[power-1] & 0x80 else 0) if power else 1
+    gf_log[gf_exp[power]] = power
+for power in range(255, 512):
+    gf_exp[power] = gf_exp[power-255]
+mul_tables = [bytes(256)] + [bytes([0] + [gf_exp[gf_log[c] + gf_log[v]] for v in range(1, 256)]) for c in range(1, 256)]
+
+
+def gf_mul(a, b):
+    """Function for multiplying two elements of GF(2^8).
+
+    Parameters
+    ----------
+    a --> int, the first element
+    b --> int, the second element
+
+    Returns
+    -------
+    gf_exp[gf_log[a] + gf_log[b]] --> int, the product
+    """
+    if a == 0 or b == 0:
+        return 0
+    return gf_exp[gf_log[a] + gf_log[b]]
+
+
+def gf_inv(a):
+    """Function for getting the multiplicative inverse of an element of GF(2^8).
+
+    Parameters
+    ----------
+    a --> int, the element (not 0)
+
+    Returns
+    -------
+    gf_exp[255 - gf_log[a]] --> int, the inverse
+    """
+    return gf_exp[255 - gf_log[a]]
+
+
+def combine_blocks(coefficients, blocks, length):
+    """Function for computing a linear combination of blocks over GF(2^8).
+
+    Parameters
+    ----------
+    coefficients --> list, the coefficient of each block
+    blocks --> list, the blocks, all of them with the same length
+    length --> int, the length of the blocks
+
+    Returns
+    -------
+    result --> bytes, the linear combination of the blocks
+    """
+    result = 0
+    for (c, b) in zip(coefficients, blocks):
+        if c == 0:
+            continue
+        #multiply the whole block by the coefficient with a lookup table and sum it
+        result ^= int.from_bytes(b if c == 1 else b.translate(mul_tables[c]), 'big')
+    return result.to_bytes(length, 'big')
+
+
+def cauchy_row(j, data_chunks):
+    """Function for getting the coding coefficients of a parity cell; the coding matrix is a Cauchy matrix, so every square submatrix of the systematic generator matrix is invertible and any data_chunks cells of a stripe are enough for decoding it.
+
+    Parameters
+    ----------
+    j --> int, the index of the parity cell into the stripe (starting from 0)
+    data_chunks --> int, the number of data cells of a stripe
+
+    Returns
+    -------
+    [gf_inv((data_chunks + j) ^ i) for i in range(data_chunks)] --> list, the coefficients which multiply the data cells
+    """
+    return [gf_inv((data_chunks + j) ^ i) for i in range(data_chunks)]
+
+
+def generator_row(index, data_chunks):
+    """Function for getting the row of the systematic generator matrix which produces the cell in input.
+
+    Parameters
+    ----------
+    index --> int, the index of the cell into the stripe, data cells first and parity cells after them
+    data_chunks --> int, the number of data cells of a stripe
+
+    Returns
+    -------
+    row --> list, the coefficients which multiply the data cells
+    """
+    if index < data_chunks:
+        row = [0]*data_chunks
+        row[index] = 1
+        return row
+    return cauchy_row(index - data_chunks, data_chunks)
+
+
+def invert_matrix(matrix):
+    """Function for inverting a square matrix over GF(2^8) with the Gauss-Jordan elimination.
+
+    Parameters
+    ----------
+    matrix --> list, the rows of the matrix
+
+    Returns
+    -------
+    inverse --> list, the rows of the inverse matrix
+    """
+    n = len(matrix)
+    work = [list(row) + [1 if i == j else 0 for j in range(n)] for (i, row) in enumerate(matrix)]
+    for col in range(n):
+        #find a row with a non zero pivot and move it in position
+        pivot = next(r for r in range(col, n) if work[r][col] != 0)
+        work[col], work[pivot] = work[pivot], work[col]
+        inv = gf_inv(work[col][col])
+        work[col] = [gf_mul(inv, v) for v in work[col]]
+        #eliminate the column from all the other rows
+        for r in range(n):
+            if r != col and work[r][col] != 0:
+                factor = work[r][col]
+                work[r] = [v ^ gf_mul(factor, p) for (v, p) in zip(work[r], work[col])]
+    return [row[n:] for row in work]
+
+
+def encode_stripe(cells, data_chunks, parity_chunks):
+    """Function for computing the parity cells of a stripe; each parity cell starts with a header containing the length of every data cell, so the padding can be removed after a reconstruction.
+
+    Parameters
+    ----------
+    cells --> list, the payloads of the data cells of the stripe (the missing cells of the last stripe of a file are empty bytes)
+    data_chunks --> int, the number of data cells of a stripe
+    parity_chunks --> int, the number of parity cells of a stripe
+
+    Returns
+    -------
+    parity --> list, the payloads of the parity cells
+    """
+    cells = list(cells) + [b'']*(data_chunks-len(cells))
+    length = max(len(c) for c in cells)
+    header = struct.pack('>{}I'.format(data_chunks), *[len(c) for c in cells])
+    #all the cells of a stripe are padded with zeros to the length of the longest one
+    blocks = [bytes(c) + bytes(length-len(c)) for c in cells]
+    parity = []
+    for j in range(parity_chunks):
+        parity.append(header + combine_blocks(cauchy_row(j, data_chunks), blocks, length))
+    return parity
+
+
+def decode_stripe(cells, data_chunks, parity_chunks):
+    """Function for reconstructing the data cells of a stripe from any data_chunks of its cells.
+
+    Parameters
+    ----------
+    cells --> dict, key: index of the cell into the stripe (data cells first, parity cells after them), value: payload of the cell; the missing cells are not present or None
+    data_chunks --> int, the number of data cells of a stripe
+    parity_chunks --> int, the number of parity cells of a stripe
+
+    Returns
+    -------
+    data --> list, the payloads of the data cells of the stripe
+    """
+    available = sorted(i for i in cells if cells[i] is not None and i < data_chunks+parity_chunks)
+    #all the data cells are available, nothing to reconstruct
+    if all(i in available for i in range(data_chunks)):
+        return [bytes(cells[i]) for i in range(data_chunks)]
+    if len(available) < data_chunks:
+        raise NotEnoughCellsException(len(available), data_chunks)
+    header_size = 4*data_chunks
+    #a parity cell is available for sure, otherwise all the data cells would be available
+    parity = next(cells[i] for i in available if i >= data_chunks)
+    lengths = struct.unpack('>{}I'.format(data_chunks), bytes(parity[:header_size]))
+    length = len(parity) - header_size
+    #take the first data_chunks cells available, preferring the data ones, and pad them as they were during the encoding
+    chosen = available[:data_chunks]
+    blocks = []
+    for i in chosen:
+        if i < data_chunks:
+            blocks.append(bytes(cells[i]) + bytes(length-len(cells[i])))
+        else:
+            blocks.append(bytes(cells[i][header_size:]))
+    decoding = invert_matrix([generator_row(i, data_chunks) for i in chosen])
+    data = []
+    for i in range(data_chunks):
+        if i in cells and cells[i] is not None:
+            data.append(bytes(cells[i]))
+        else:
+            data.append(combine_blocks(decoding[i], blocks, length)[:lengths[i]])
+    return data
+
+
+def rebuild_stripe(cells, data_chunks, parity_chunks):
+    """Function for rebuilding all the cells of a stripe (data and parity) from any data_chunks of them, used for recovering the cells lost after a datanode failure.
+
+    Parameters
+    ----------
+    cells --> dict, key: index of the cell into the stripe (data cells first, parity cells after them), value: payload of the cell; the missing cells are not present or None
+    data_chunks --> int, the number of data cells of a stripe
+    parity_chunks --> int, the number of parity cells of a stripe
+
+    Returns
+    -------
+    data + parity --> list, the payloads of all the cells of the stripe
+    """
+    data = decode_stripe(cells, data_chunks, parity_chunks)
+    parity = encode_stripe(data, data_chunks, parity_chunks)
+    return data + parity
+
+
+def stripe_layout(seq, data_cells, data_chunks, parity_chunks):
+    """Function for getting the sequence numbers of the cells which belong to the same stripe of a cell; the data cells of a file have the sequence numbers from 0 to data_cells-1, the parity cells follow them.
+
+    Parameters
+    ----------
+    seq --> int, the sequence number of the cell
+    data_cells --> int, the number of data cells of the file
+    data_chunks --> int, the number of data cells of a stripe
+    parity_chunks --> int, the number of parity cells of a stripe
+
+    Returns
+    -------
+    (stripe, layout) --> tuple(int, list), the index of the stripe and the sequence number of each cell of the stripe (None for the data cells beyond the end of the file)
+    """
+    if seq < data_cells:
+        stripe = seq // data_chunks
+    else:
+        stripe = (seq - data_cells) // parity_chunks
+    layout = [s if s < data_cells else None for s in range(stripe*data_chunks, (stripe+1)*data_chunks)]
+    layout += [data_cells + stripe*parity_chunks + j for j in range(parity_chunks)]
+    return (stripe, layout)
+
+
+def stripes_number(data_cells, data_chunks):
+    """Function for getting the number of stripes of a file.
+
+    Parameters
+    ----------
+    data_cells --> int, the number of data cells of the file
+    data_chunks --> int, the number of data cells of a stripe
+
+    Returns
+    -------
+    -(-data_cells // data_chunks) --> int, the number of stripes
+    """
+    return -(-data_cells // data_chunks)
@@ -658,5 +658,234 @@ class GetFileException(Exception):
         None
         """
         self.message = message
+
+
+class CodecNotFoundException(Exception):
+    """Exception raised when the codec used for compressing the chunks of a file is not available."""
+    def __init__(self, codec):
+        self.message = 'Codec not found: the codec {} is not available'.format(codec)
+        
+    def get_message(self):
+        """Method for getting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> CodecNotFoundException class, self reference to the object instance
+        
+        Returns
+        -------
+        self.message --> str, the message of the exception
+        """
+        return self.message
+    
+    def set_message(self, message):
+        """Method for setting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> CodecNotFoundException class, self reference to the object instance
+        message --> str, the message of the exception
+        
+        Returns
+        -------
+        None
+        """
+        self.message = message
+
+
+class NotEnoughCellsException(Exception):
+    """Exception raised when the cells of an erasure coded stripe still available are not enough for reconstructing it."""
+    def __init__(self, available, needed):
+        self.message = 'Not enough cells: {} cells available, at least {} are needed for reconstructing the stripe'.format(available, needed)
+        
+    def get_message(self):
+        """Method for getting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> NotEnoughCellsException class, self reference to the object instance
+        
+        Returns
+        -------
+        self.message --> str, the message of the exception
+        """
+        return self.message
+    
+    def set_message(self, message):
+        """Method for setting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> NotEnoughCellsException class, self reference to the object instance
+        message --> str, the message of the exception
         
-        
\ No newline at end of file
+        Returns
+        -------
+        None
+        """
+        self.message = message
+
+
+class InvalidPolicyException(Exception):
+    """Exception raised when the storage policy required is not valid."""
+    def __init__(self, policy):
+        self.message = 'Invalid storage policy: {} is not valid, use replication or RS-<DATA_CHUNKS>-<PARITY_CHUNKS>'.format(policy)
+        
+    def get_message(self):
+        """Method for getting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> InvalidPolicyException class, self reference to the object instance
+        
+        Returns
+        -------
+        self.message --> str, the message of the exception
+        """
+        return self.message
+    
+    def set_message(self, message):
+        """Method for setting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> InvalidPolicyException class, self reference to the object instance
+        message --> str, the message of the exception
+        
+        Returns
+        -------
+        None
+        """
+        self.message = message
+
+
+class PutFileException(Exception):
+    """Exception raised when some chunks of a file can not be written into the datanodes."""
+    def __init__(self, chunks):
+        self.message = 'Unable to put the file: {} chunks not written'.format(len(chunks))
+        
+    def get_message(self):
+        """Method for getting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> PutFileException class, self reference to the object instance
+        
+        Returns
+        -------
+        self.message --> str, the message of the exception
+        """
+        return self.message
+    
+    def set_message(self, message):
+        """Method for setting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> PutFileException class, self reference to the object instance
+        message --> str, the message of the exception
+        
+        Returns
+        -------
+        None
+        """
+        self.message = message
+
+
+class NotMasterException(Exception):
+    """Exception raised when a command is sent to a namenode which is not the master one."""
+    def __init__(self, namenode):
+        self.message = 'Not master: {} is not the master namenode'.format(namenode)
+        
+    def get_message(self):
+        """Method for getting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> NotMasterException class, self reference to the object instance
+        
+        Returns
+        -------
+        self.message --> str, the message of the exception
+        """
+        return self.message
+    
+    def set_message(self, message):
+        """Method for setting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> NotMasterException class, self reference to the object instance
+        message --> str, the message of the exception
+        
+        Returns
+        -------
+        None
+        """
+        self.message = message
+
+
+class InvalidSessionException(Exception):
+    """Exception raised when a command is sent with a session token which is not valid or has expired."""
+    def __init__(self, username):
+        self.message = 'Invalid session: the session of {} is not valid or has expired, login again'.format(username)
+        
+    def get_message(self):
+        """Method for getting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> InvalidSessionException class, self reference to the object instance
+        
+        Returns
+        -------
+        self.message --> str, the message of the exception
+        """
+        return self.message
+    
+    def set_message(self, message):
+        """Method for setting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> InvalidSessionException class, self reference to the object instance
+        message --> str, the message of the exception
+        
+        Returns
+        -------
+        None
+        """
+        self.message = message
+
+
+class ChunksCollectingException(Exception):
+    """Exception raised when a file is put with some deduplicated chunks which the garbage collector is deleting from the datanodes; the put can be retried once the collection is done."""
+    def __init__(self, path):
+        self.message = 'Chunks being collected: some chunks of {} are being deleted by the garbage collector, retry later'.format(path)
+        
+    def get_message(self):
+        """Method for getting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> ChunksCollectingException class, self reference to the object instance
+        
+        Returns
+        -------
+        self.message --> str, the message of the exception
+        """
+        return self.message
+    
+    def set_message(self, message):
+        """Method for setting the 'message' of the exception.
+        
+        Parameters
+        ----------
+        self --> ChunksCollectingException class, self reference to the object instance
+        message --> str, the message of the exception
+        
+        Returns
+        -------
+        None
+        """
+        self.message = message
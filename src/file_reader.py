@@ -0,0 +1,211 @@
+import io
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import chunks_handler as ch
+from exceptions import GetFileException
+from utils import get_chunk_size, get_data_chunks, get_read_ahead, get_max_concurrency
+
+logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+
+#the chunks are read ahead by a pool of their own, they wait for the transfers of the transfer engine
+read_ahead_executor = None
+read_ahead_executor_lock = threading.Lock()
+
+
+def get_read_ahead_executor():
+    """Function for getting the pool of threads which read the chunks ahead for the file readers of the client, it's created at the first read.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    read_ahead_executor --> concurrent.futures.ThreadPoolExecutor class, the pool shared by all the file readers
+    """
+    global read_ahead_executor
+    with read_ahead_executor_lock:
+        if read_ahead_executor is None:
+            read_ahead_executor = ThreadPoolExecutor(max_workers=get_max_concurrency(), thread_name_prefix='read_ahead')
+    return read_ahead_executor
+
+
+class HMDFSFile(io.RawIOBase):
+    """Class for reading a file of the H(M)DFS as a local binary file; every read gets only the chunks which contain the bytes required (range read), so the file can be read from any offset without getting its whole content. While a chunk is read, the next ones are got in background (read-ahead), so a sequential read does not wait for the datanodes at every chunk."""
+
+    def __init__(self, file, read_ahead=None):
+        io.RawIOBase.__init__(self)
+        self.file = file
+        self.chunks = get_data_chunks(file)
+        self.chunk_size = get_chunk_size()
+        self.read_ahead = get_read_ahead() if read_ahead is None else read_ahead
+        self.position = 0
+        #key: sequence number, value: future of the content of the chunk, the one being read and the ones read ahead
+        self.window = {}
+
+    def get_file(self):
+        """Method for getting the 'file' object attribute.
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+
+        Returns
+        -------
+        self.file --> dict, the object which represents the file, as returned by get_file
+        """
+        return self.file
+
+    def set_file(self, file):
+        """Method for setting the 'file' object attribute; the chunks read ahead for the old one are discarded.
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+        file --> dict, the object which represents the file, as returned by get_file
+
+        Returns
+        -------
+        None
+        """
+        self.file = file
+        self.chunks = get_data_chunks(file)
+        self.discard(0, -1)
+
+    def get_read_ahead(self):
+        """Method for getting the 'read_ahead' object attribute.
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+
+        Returns
+        -------
+        self.read_ahead --> int, how many chunks are read ahead of the one being read
+        """
+        return self.read_ahead
+
+    def set_read_ahead(self, read_ahead):
+        """Method for setting the 'read_ahead' object attribute.
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+        read_ahead --> int, how many chunks are read ahead of the one being read
+
+        Returns
+        -------
+        None
+        """
+        self.read_ahead = read_ahead
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Method for moving the position of the file, as io.RawIOBase.seek; no chunk is read until the next read, so a position past the end of the file is allowed (the reads from there return no bytes).
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+        offset --> int, the offset, relative to the position given by whence
+        whence --> int, either io.SEEK_SET (the start of the file), io.SEEK_CUR (the current position) or io.SEEK_END (the end of the file)
+
+        Returns
+        -------
+        self.position --> int, the new position
+        """
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.file['size'] + offset
+        else:
+            raise ValueError('invalid whence ({})'.format(whence))
+        if position < 0:
+            raise ValueError('negative seek position {}'.format(position))
+        self.position = position
+        return self.position
+
+    def discard(self, first, last):
+        """Method for discarding the chunks of the window out of a range of sequence numbers, the ones not started yet are not read at all.
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+        first --> int, the first sequence number kept
+        last --> int, the last sequence number kept
+
+        Returns
+        -------
+        None
+        """
+        for sn in [sn for sn in self.window if sn < first or sn > last]:
+            self.window.pop(sn).cancel()
+
+    def read_chunk(self, sn):
+        """Method for getting the content of a chunk of the file; the next read_ahead chunks are requested in background, the ones behind (e.g. after a seek) are discarded.
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+        sn --> int, the sequence number of the chunk
+
+        Returns
+        -------
+        content --> bytes, the content of the chunk
+        """
+        last = min(sn+self.read_ahead, len(self.chunks)-1)
+        self.discard(sn, last)
+        for n in range(sn, last+1):
+            if n not in self.window:
+                self.window[n] = get_read_ahead_executor().submit(ch.get_file_chunks, self.file, [self.chunks[n]])
+        try:
+            return self.window[sn].result()[sn]
+        except GetFileException as e:
+            raise IOError(e.message)
+
+    def readinto(self, b):
+        """Method for reading the bytes from the current position into a buffer, as io.RawIOBase.readinto; a read never crosses the end of the chunk of the position, so only that chunk is required (and the next ones read ahead).
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+        b --> bytearray or memoryview, the buffer into which the bytes are read
+
+        Returns
+        -------
+        n --> int, the number of bytes read, 0 at the end of the file
+        """
+        if self.position >= self.file['size']:
+            return 0
+        #the chunks of a file contain chunk_size bytes each, except the last one
+        sn = self.position // self.chunk_size
+        offset = self.position % self.chunk_size
+        content = self.read_chunk(sn)
+        n = min(len(b), len(content)-offset)
+        b[:n] = content[offset:offset+n]
+        self.position += n
+        return n
+
+    def close(self):
+        """Method for closing the file; the chunks read ahead and never read are not needed anymore, the ones not started yet are not read at all.
+
+        Parameters
+        ----------
+        self --> HMDFSFile class, self reference to the object instance
+
+        Returns
+        -------
+        None
+        """
+        self.discard(0, -1)
+        io.RawIOBase.close(self)
@@ -19,12 +19,16 @@ fs = db['fs']
 groups = db['groups']
 users = db['users']
 trash = db['trash']
+deletions = db['deletions']
 
 #clear the metadata and the namespace
 fs.delete_many({})
 groups.delete_many({})
 users.delete_many({})
 trash.delete_many({})
+deletions.delete_many({})
+#the datanodes take the oldest batches of the deletion queue which are theirs with every heartbeat
+deletions.create_index([('datanode', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)])
 
 #create the "root" user object
 root_usr = { "_id" : ObjectId("111111111111111111111111"), "name" : "root", "password" : "root1.", "creation" : "1970-01-01 00:00:00", "groups" : [ "root" ] }
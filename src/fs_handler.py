@@ -1,8 +1,10 @@
 import datetime
 from pathlib import Path
-from exceptions import AccessDeniedException, NotFoundException, RootNecessaryException, NotDirectoryException, NotParentException, AlreadyExistsException, NotEmptyException, AccessDeniedAtLeastOneException, InvalidModException, AlreadyExistsDirectoryException, UserNotFoundException, GroupNotFoundException, RootDirectoryException, ItselfSubdirException
-from collections_handler import get_fs, get_users, get_groups
-from utils import create_file_node, create_directory_node, decode_mode, is_allowed, check_permissions, navigate_through, parse_mode, get_chunk_size, choose_replicas
+from bson.objectid import ObjectId
+from exceptions import AccessDeniedException, NotFoundException, InvalidPolicyException, RootNecessaryException, NotDirectoryException, NotParentException, AlreadyExistsException, NotEmptyException, AccessDeniedAtLeastOneException, InvalidModException, AlreadyExistsDirectoryException, UserNotFoundException, GroupNotFoundException, RootDirectoryException, ItselfSubdirException
+from collections_handler import get_fs, get_users, get_groups, get_chunks_store
+from utils import create_file_node, create_directory_node, create_chunk_node, decode_mode, is_allowed, check_permissions, navigate_through, parse_mode, get_chunk_size, choose_replicas, parse_policy, get_storage_policy, get_copy_on_write
+from erasure_coding import stripe_layout, stripes_number
 from math import ceil
 from itertools import chain
 import logging
@@ -345,7 +347,7 @@ def rm(client, path, required_by, grp):
             raise AccessDeniedException(resource['name'])
         #register where are the primary and secondary chunks to delete from the datanodes
         chunks = resource['chunks']
-        for c in chunks.keys():
+        for c in list(chunks.keys()):
             tmp_c = chunks[c]
             del chunks[c]
             chunks[c.replace('[dot]', '.').replace('[colon]', ':')] = tmp_c    
@@ -362,6 +364,12 @@ def rm(client, path, required_by, grp):
         deleted = fs.delete_one({'parent': curr_dir['_id'], 'type': 'f', 'name': path.name})
         #insert into the list needed for aligning the other namenodes
         deletedone_documents.append(({'parent': curr_dir['_id'], 'type': 'f', 'name': path.name}, 'fs'))
+        #the deduplicated chunks can be shared with other files, so only the references are released
+        #the garbage collector will delete the chunks not referenced anymore
+        if resource.get('sequence') is not None:
+            release_chunks_references(client, resource['sequence'], updatedone_documents)
+            logging.info('Removed {}'.format(path))
+            return (None,None, updatedone_documents, deletedone_documents)
         hs = list(set(chain(*list(replicas.values()))))
         hm = list(chunks.keys())
         h = list(set(hm + hs))
@@ -465,9 +473,12 @@ def rmr(client, path, required_by, grp):
         deleted_tot = []
         for elem in to_remove:
             #if the element is a file, register also the chunks to delete from the datanodes which handle either a primary or a secondary replica
-            if elem['type'] == 'f':
+            #the deduplicated chunks can be shared with other files, so only the references are released
+            if elem['type'] == 'f' and elem.get('sequence') is not None:
+                release_chunks_references(client, elem['sequence'], updatedone_documents)
+            elif elem['type'] == 'f':
                 chunks = elem['chunks']
-                for c in chunks.keys():
+                for c in list(chunks.keys()):
                     tmp_c = chunks[c]
                     del chunks[c]
                     chunks[c.replace('[dot]', '.').replace('[colon]', ':')] = tmp_c
@@ -485,7 +496,7 @@ def rmr(client, path, required_by, grp):
             deleted = fs.delete_one({'_id': elem['_id']})
             #insert into the list needed for aligning the other namenodes
             deletedone_documents.append(({'_id': elem['_id']}, 'fs'))
-            if elem['type'] == 'f':
+            if elem['type'] == 'f' and elem.get('sequence') is None:
                 deleted_tot.append(str(elem['_id']))
         #update the fs collection
         fs.update_one({ '_id': parent_dir['_id'] }, {'$pull': { 'directories': path.name}})
@@ -510,7 +521,7 @@ def rmr(client, path, required_by, grp):
             logging.warning('Access denied: the operation required is not allowed on {}'.format(resource['name']))
             raise AccessDeniedException(resource['name'])
         chunks = resource['chunks']
-        for c in chunks.keys():
+        for c in list(chunks.keys()):
             tmp_c = chunks[c]
             del chunks[c]
             chunks[c.replace('[dot]', '.').replace('[colon]', ':')] = tmp_c
@@ -528,6 +539,12 @@ def rmr(client, path, required_by, grp):
         deleted = fs.delete_one({'parent': curr_dir['_id'], 'type': 'f', 'name': path.name})
         #insert into the list needed for aligning the other namenodes
         deletedone_documents.append(({'parent': curr_dir['_id'], 'type': 'f', 'name': path.name}, 'fs'))
+        #the deduplicated chunks can be shared with other files, so only the references are released
+        #the garbage collector will delete the chunks not referenced anymore
+        if resource.get('sequence') is not None:
+            release_chunks_references(client, resource['sequence'], updatedone_documents)
+            logging.info('Removed {}'.format(path))
+            return (None,None, updatedone_documents, deletedone_documents)
         hs = list(set(chain(*list(replicas.values()))))
         hm = list(chunks.keys())
         h = list(set(hm + hs))
@@ -542,6 +559,146 @@ def rmr(client, path, required_by, grp):
         raise NotFoundException(path.name)
 
 
+def add_chunks_references(client, sequence, updatedone_documents):
+    """Function for adding the references of a file to the content addressed chunks which compose it.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    sequence --> list, the hashes of the chunks of the file, in order (the same chunk can appear more times)
+    updatedone_documents --> list, the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update, updated in place
+    
+    Returns
+    -------
+    missing --> list, the hashes of the chunks not present into the chunks collection
+    """
+    #get the chunks MongoDB collection
+    chunks_store = get_chunks_store(client)
+    refs = {}
+    for h in sequence:
+        refs[h] = refs.get(h, 0) + 1
+    missing = []
+    for h in refs:
+        #the update fails if the chunk has been just reclaimed by the garbage collector
+        if chunks_store.update_one({'_id': h}, {'$inc': {'refs': refs[h]}}).matched_count == 0:
+            missing.append(h)
+            continue
+        #insert into the list needed for aligning the other namenodes
+        updatedone_documents.append(({'_id': h}, {'$inc': {'refs': refs[h]}}, 'chunks'))
+    return missing
+
+
+def release_chunks_references(client, sequence, updatedone_documents):
+    """Function for releasing the references of a removed file to the content addressed chunks which compose it; the chunks not referenced anymore will be deleted by the garbage collector.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    sequence --> list, the hashes of the chunks of the file, in order (the same chunk can appear more times)
+    updatedone_documents --> list, the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update, updated in place
+    
+    Returns
+    -------
+    None
+    """
+    #get the chunks MongoDB collection
+    chunks_store = get_chunks_store(client)
+    refs = {}
+    for h in sequence:
+        refs[h] = refs.get(h, 0) + 1
+    for h in refs:
+        chunks_store.update_one({'_id': h}, {'$inc': {'refs': -refs[h]}})
+        #insert into the list needed for aligning the other namenodes
+        updatedone_documents.append(({'_id': h}, {'$inc': {'refs': -refs[h]}}, 'chunks'))
+    return
+
+
+def fill_chunks_placement(client, file):
+    """Function for filling the placement of the chunks (chunks, chunks_bkp and replicas) of a file with deduplicated chunks, taking it from the chunks collection.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    file --> dict, the MongoDB object which represents the file, updated in place
+    
+    Returns
+    -------
+    None
+    """
+    #get the chunks MongoDB collection
+    chunks_store = get_chunks_store(client)
+    file['chunks'] = {}
+    file['chunks_bkp'] = {}
+    file['replicas'] = {}
+    for c in chunks_store.find({'_id': {'$in': list(set(file['sequence']))}}):
+        try:
+            file['chunks'][c['master']].append(c['_id'])
+        except:
+            file['chunks'][c['master']] = [c['_id']]
+        file['chunks_bkp'][c['_id']] = c['master']
+        file['replicas'][c['_id']] = c['replicas']
+    return
+
+
+def resolve_placement(client, file):
+    """Function for getting the placement of the chunks of a file as the clients use it, with the datanodes not escaped.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    file --> dict, the MongoDB object which represents the file, updated in place
+    
+    Returns
+    -------
+    None
+    """
+    #the placement of the deduplicated chunks is handled by the chunks collection
+    if file.get('sequence') is not None:
+        fill_chunks_placement(client, file)
+    for c in list(file['chunks'].keys()):
+        tmp_c = file['chunks'][c]
+        del file['chunks'][c]
+        file['chunks'][c.replace('[dot]', '.').replace('[colon]', ':')] = tmp_c
+    for r in file['replicas'].keys():
+        tmp_dn = []
+        for dn in file['replicas'][r]:
+            tmp_dn.append(dn.replace('[dot]', '.').replace('[colon]', ':'))
+        file['replicas'][r] = tmp_dn
+    return
+
+
+def share_chunks(client, file, inserted_documents, updatedone_documents):
+    """Function for moving the chunks of a replicated file into the chunks collection, so that they can be shared with other files (copy on write); only the metadata change, the chunks keep their names into the datanodes.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    file --> dict, the MongoDB object which represents the file, with the datanodes escaped, updated in place
+    inserted_documents --> list, the list of the documents to insert and the collections in which they must be inserted, updated in place
+    updatedone_documents --> list, the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update, updated in place
+    
+    Returns
+    -------
+    None
+    """
+    #get fs (filesystem) and chunks MongoDB collections
+    fs = get_fs(client)
+    chunks_store = get_chunks_store(client)
+    sequence = sorted(file['chunks_bkp'], key=lambda c: int(c.split('_')[1]))
+    #each chunk is referenced only by the file itself for now
+    new_chunks = [create_chunk_node(c, file['chunks_bkp'][c], file['replicas'].get(c, []), 1) for c in sequence]
+    if len(new_chunks) > 0:
+        chunks_store.insert_many(new_chunks)
+    for c in new_chunks:
+        #insert into the list needed for aligning the other namenodes
+        inserted_documents.append((c, 'chunks'))
+    fs.update_one({'_id': file['_id']}, {'$set': {'sequence': sequence, 'chunks': {}, 'chunks_bkp': {}, 'replicas': {}, 'replicas_bkp': {}}})
+    #insert into the list needed for aligning the other namenodes
+    updatedone_documents.append(({'_id': file['_id']}, {'$set': {'sequence': sequence, 'chunks': {}, 'chunks_bkp': {}, 'replicas': {}, 'replicas_bkp': {}}}, 'fs'))
+    file['sequence'] = sequence
+    return
+
+
 def get_file(client, file_path, required_by, grp):
     """Return file object (used for cat, get, head, tail...).
     
@@ -578,15 +735,7 @@ def get_file(client, file_path, required_by, grp):
         if not check_permissions(file, 'resource', required_by, grp, 'get_file'):
             logging.warning('Access denied: the operation required is not allowed on {}'.format(file['name']))
             raise AccessDeniedException(file['name'])
-        for c in file['chunks'].keys():
-            tmp_c = file['chunks'][c]
-            del file['chunks'][c]
-            file['chunks'][c.replace('[dot]', '.').replace('[colon]', ':')] = tmp_c
-        for r in file['replicas'].keys():
-            tmp_dn = []
-            for dn in file['replicas'][r]:
-                tmp_dn.append(dn.replace('[dot]', '.').replace('[colon]', ':'))
-            file['replicas'][r] = tmp_dn
+        resolve_placement(client, file)
         logging.info('Get file {}'.format(file_path))
         return file
     #the path to the file does not exist
@@ -643,6 +792,90 @@ def get_directory(client, orig_path, required_by, grp):
         raise NotFoundException(orig_path.name)
     
     
+def tree_recursive(client, curr_dir, curr_path, dir_lst, file_lst):
+    """Function which gets all the directories and the files into a directory recursively.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    curr_dir --> dict, the MongoDB object which represents the current directory
+    curr_path --> str, the current path, relative to the directory from which the recursion has started
+    dir_lst --> list, the current list of directories, tuples which contains (relative path, MongoDB object)
+    file_lst --> list, the current list of files, tuples which contains (relative path, MongoDB object)
+    
+    Returns
+    -------
+    (dir_lst, file_lst) --> tuple(list, list), the updated list of directories and the updated list of files
+    """
+    fs = get_fs(client)
+    dir_lst.append((curr_path, curr_dir))
+    for f in fs.find({'parent': curr_dir['_id'], 'type': 'f'}):
+        file_lst.append((str(Path(curr_path, f['name'])), f))
+    directories = list(fs.find({'parent': curr_dir['_id'], 'type': 'd'}))
+    #there is at least one subdirectory in the current directory: recursive case 
+    for dire in directories:
+        (dir_lst, file_lst) = tree_recursive(client, dire, str(Path(curr_path, dire['name'])), dir_lst, file_lst)
+    return (dir_lst, file_lst)
+
+
+def get_tree(client, path, required_by, grp):
+    """Return all the directories and the files into a directory recursively, with the placement of the chunks of every file (used for get_dir).
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    path --> pathlib.PosixPath class, path to the directory you want to get
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    (directories, files) --> tuple(list, list), the paths of the directories relative to the one required (. for itself), parents first, the objects which represent the files, each one with its relative path into the path field
+    """
+    #get fs (filesystem) MongoDB collection
+    fs = get_fs(client)
+    #navigate in the file system until the parent directory
+    try:
+        curr_dir = navigate_through(path, fs, required_by, grp, 'get_directory')
+    except AccessDeniedException as e:
+        logging.warning(e.message)
+        raise e
+    except NotFoundException as e:
+        logging.warning(e.message)
+        raise e
+    #check the permissions with parent role for the current directory
+    if not check_permissions(curr_dir, 'parent', required_by, grp, 'get_directory'):
+        logging.warning('Access denied: the operation required is not allowed on {}'.format(curr_dir['name']))
+        raise AccessDeniedException(curr_dir['name'])
+    #the last part of the path is a directory
+    if path.name in curr_dir['directories']:
+        curr_dir = fs.find_one({'parent': curr_dir['_id'], 'type': 'd', 'name': path.name})
+    #the last part of the path is a file
+    elif path.name in curr_dir['files']:
+        logging.warning('"{}" is not a directory'.format(path.name))
+        raise NotDirectoryException(path.name)
+    #the path does not exist, unless it is the root directory
+    elif path.name != '':
+        logging.warning('The path does not exist: "{}" not found'.format(path.name))
+        raise NotFoundException(path.name)
+    (dir_lst, file_lst) = tree_recursive(client, curr_dir, '.', [], [])
+    #check the permissions for each nested element
+    for (p, d) in dir_lst:
+        if not check_permissions(d, 'resource', required_by, grp, 'get_directory'):
+            logging.warning('Access denied at least on one resource: "{}"'.format(path.joinpath(p)))
+            raise AccessDeniedAtLeastOneException(str(path.joinpath(p)))
+    files = []
+    for (p, f) in file_lst:
+        if not check_permissions(f, 'resource', required_by, grp, 'get_file'):
+            logging.warning('Access denied at least on one resource: "{}"'.format(path.joinpath(p)))
+            raise AccessDeniedAtLeastOneException(str(path.joinpath(p)))
+        resolve_placement(client, f)
+        f['path'] = p
+        files.append(f)
+    logging.info('Get tree of {}'.format(path))
+    return ([p for (p, d) in dir_lst], files)
+    
+    
 def cp(client, orig_file, dest_path, required_by, grp):
     """Copy a source file into a destination path.
     
@@ -671,7 +904,7 @@ def cp(client, orig_file, dest_path, required_by, grp):
     except NotFoundException as e:
         logging.warning(e.message)
         raise e
-    for c in file['chunks'].keys():
+    for c in list(file['chunks'].keys()):
         tmp_c = file['chunks'][c]
         del file['chunks'][c]
         file['chunks'][c.replace('.', '[dot]').replace(':', '[colon]')] = tmp_c
@@ -711,12 +944,20 @@ def cp(client, orig_file, dest_path, required_by, grp):
         fs.update_one({ '_id': curr_dir['_id'] }, {'$push': { 'files': file['name']}})
         #insert into the list needed for aligning the other namenodes
         updatedone_documents.append(({ '_id': curr_dir['_id'] }, {'$push': { 'files': file['name']}}, 'fs'))
+        #copy on write: the chunks of a replicated file are shared with the new file instead of being copied, the chunks are never modified after they are written
+        if file.get('sequence') is None and parse_policy(file.get('policy')) is None and get_copy_on_write():
+            share_chunks(client, file, inserted_documents, updatedone_documents)
         #create the file node and insert it into fs collection
-        new_file = create_file_node(file['name'], curr_dir['_id'], required_by, required_by, size=file['size'])
+        new_file = create_file_node(file['name'], curr_dir['_id'], required_by, required_by, size=file['size'], codec=file.get('codec', 'none'), stored_size=file.get('stored_size', file['size']), policy=file.get('policy', 'replication'), data_cells=file.get('data_cells', 0), sequence=file.get('sequence'))
         file_id = fs.insert_one(new_file).inserted_id
         curr_file = fs.find_one({'_id': file_id})
         #insert into the list needed for aligning the other namenodes
         inserted_documents.append((curr_file, 'fs'))
+        #the shared chunks are referenced by all the files with the same content, so the copy is only a new reference to them, no datanode is involved
+        if file.get('sequence') is not None:
+            add_chunks_references(client, file['sequence'], updatedone_documents)
+            logging.info('Copied {} content into {}'.format(orig_file, dest_path))
+            return (file['_id'], file_id, [], inserted_documents, updatedone_documents, deletedone_documents)
         dest_chunks = {}
         dest_replicas = {}
         dest_chunks_bkp = {}
@@ -747,7 +988,7 @@ def cp(client, orig_file, dest_path, required_by, grp):
         fs.update_one({ '_id': file_id }, {'$set': {'chunks': dest_chunks, 'chunks_bkp': dest_chunks_bkp, 'replicas': dest_replicas, 'replicas_bkp': dest_replicas_bkp}})
         #insert into the list needed for aligning the other namenodes
         updatedone_documents.append(({ '_id': file_id }, {'$set': {'chunks': dest_chunks, 'chunks_bkp': dest_chunks_bkp, 'replicas': dest_replicas, 'replicas_bkp': dest_replicas_bkp}}, 'fs'))
-        for c in orig_chunks.keys():
+        for c in list(orig_chunks.keys()):
             tmp_c = orig_chunks[c]
             del orig_chunks[c]
             orig_chunks[c.replace('[dot]', '.').replace('[colon]', ':')] = tmp_c
@@ -782,12 +1023,20 @@ def cp(client, orig_file, dest_path, required_by, grp):
         fs.update_one({ '_id': curr_dir['_id'] }, {'$push': { 'files': dest_path.name}})
         #insert into the list needed for aligning the other namenodes
         updatedone_documents.append(({ '_id': curr_dir['_id'] }, {'$push': { 'files': dest_path.name}}, 'fs'))
+        #copy on write: the chunks of a replicated file are shared with the new file instead of being copied, the chunks are never modified after they are written
+        if file.get('sequence') is None and parse_policy(file.get('policy')) is None and get_copy_on_write():
+            share_chunks(client, file, inserted_documents, updatedone_documents)
         #create the file node and update the fs collection
-        new_file = create_file_node(dest_path.name, curr_dir['_id'], required_by, required_by, size=file['size'])
+        new_file = create_file_node(dest_path.name, curr_dir['_id'], required_by, required_by, size=file['size'], codec=file.get('codec', 'none'), stored_size=file.get('stored_size', file['size']), policy=file.get('policy', 'replication'), data_cells=file.get('data_cells', 0), sequence=file.get('sequence'))
         file_id = fs.insert_one(new_file).inserted_id
         curr_file = fs.find_one({'_id': file_id})
         #insert into the list needed for aligning the other namenodes
         inserted_documents.append((curr_file, 'fs'))
+        #the shared chunks are referenced by all the files with the same content, so the copy is only a new reference to them, no datanode is involved
+        if file.get('sequence') is not None:
+            add_chunks_references(client, file['sequence'], updatedone_documents)
+            logging.info('Copied {} content into {}'.format(orig_file, dest_path))
+            return (file['_id'], file_id, [], inserted_documents, updatedone_documents, deletedone_documents)
         dest_chunks = {}
         dest_replicas = {}
         dest_chunks_bkp = {}
@@ -818,7 +1067,7 @@ def cp(client, orig_file, dest_path, required_by, grp):
         fs.update_one({ '_id': file_id }, {'$set': {'chunks': dest_chunks, 'chunks_bkp': dest_chunks_bkp, 'replicas': dest_replicas, 'replicas_bkp': dest_replicas_bkp}})
         #insert into the list needed for aligning the other namenodes
         updatedone_documents.append(({ '_id': file_id }, {'$set': {'chunks': dest_chunks, 'chunks_bkp': dest_chunks_bkp, 'replicas': dest_replicas, 'replicas_bkp': dest_replicas_bkp}}, 'fs'))
-        for c in orig_chunks.keys():
+        for c in list(orig_chunks.keys()):
             tmp_c = orig_chunks[c]
             del orig_chunks[c] 
             orig_chunks[c.replace('[dot]', '.').replace('[colon]', ':')] = tmp_c
@@ -1157,7 +1406,7 @@ def countr(client, dir_path, required_by, grp):
         raise NotFoundException(dir_path.name)
 
 
-def du_recursive(client, curr_dir, curr_path, tot_size, dir_lst):
+def du_recursive(client, curr_dir, curr_path, tot_size, dir_lst, stored=False):
     """Function which gets total disk usage of files into a directory recursively.
     
     Parameters
@@ -1167,6 +1416,7 @@ def du_recursive(client, curr_dir, curr_path, tot_size, dir_lst):
     curr_path --> str, the current path
     tot_size --> int, the current total size of the resources
     dir_lst --> list, the current list of directories
+    stored --> bool, if True the size of the chunks stored into the datanodes (compressed) is considered instead of the logical size of the files
     
     Returns
     -------
@@ -1176,16 +1426,16 @@ def du_recursive(client, curr_dir, curr_path, tot_size, dir_lst):
     files = list(fs.find({'parent': curr_dir['_id'], 'type': 'f'}))
     #update the total size for disk usage
     for f in files:
-        tot_size += f['size']
+        tot_size += f.get('stored_size', f['size']) if stored else f['size']
     dir_lst.append(curr_path)
     directories = list(fs.find({'parent': curr_dir['_id'], 'type': 'd'}))
     #there is at least one subdirectory in the current directory: recursive case 
     for dire in directories:
-        (tot_size, dir_lst) = du_recursive(client, dire, curr_path + '/' + dire['name'], tot_size, dir_lst)
+        (tot_size, dir_lst) = du_recursive(client, dire, curr_path + '/' + dire['name'], tot_size, dir_lst, stored)
     return (tot_size, dir_lst)
     
 
-def du(client, path, required_by, grp):
+def du(client, path, required_by, grp, stored=False):
     """Allow to get the total disk usage of a file or a directory recursively.
     
     Parameters
@@ -1194,6 +1444,7 @@ def du(client, path, required_by, grp):
     path --> pathlib.PosixPath class, path to the resource you want to discover the disk usage, either a file or a directory, recursively
     required_by --> str, user who required the operation
     grp --> list, groups to which the user belogns
+    stored --> bool, if True the size of the chunks stored into the datanodes (compressed) is returned instead of the logical size
     
     Returns
     -------
@@ -1218,7 +1469,7 @@ def du(client, path, required_by, grp):
     if path.name in curr_dir['directories']:
         curr_dir = fs.find_one({'parent': curr_dir['_id'], 'type': 'd', 'name': path.name})
         #get the total size for all the nested elements inside the parent directory
-        (tot_size, dir_lst) = du_recursive(client, curr_dir, str(path), 0, [])
+        (tot_size, dir_lst) = du_recursive(client, curr_dir, str(path), 0, [], stored)
         #check the permissions for each nested element
         for elem in dir_lst:
             if not is_allowed_recursive(Path(elem), fs, required_by, grp, 'du'):
@@ -1230,11 +1481,13 @@ def du(client, path, required_by, grp):
     elif path.name in curr_dir['files']:
         file = fs.find_one({'parent': curr_dir['_id'], 'type': 'f', 'name': path.name})
         logging.info('Get disk usage of {}'.format(path))
+        if stored:
+            return file.get('stored_size', file['size'])
         return file['size']
     #the path is the root directory
     elif path.name == '':
         #get the total size for all the nested elements inside the parent directory
-        (tot_size, dir_lst) = du_recursive(client, curr_dir, '', 0, [])
+        (tot_size, dir_lst) = du_recursive(client, curr_dir, '', 0, [], stored)
         #check the permissions for each nested element
         for elem in dir_lst:
             if elem == '':
@@ -1509,7 +1762,7 @@ def chmod(client, path, new_mode, required_by, grp):
         raise NotFoundException(path.name)
 
     
-def put_file(client, file_path, file_size, required_by, grp, nodes):
+def put_file(client, file_path, file_size, required_by, grp, nodes, codec='none', stored_size=None, policy=None, hashes=None):
     """Allow to put a file into the dfs from the current file system.
     
     Parameters
@@ -1520,6 +1773,10 @@ def put_file(client, file_path, file_size, required_by, grp, nodes):
     required_by --> str, user who required the operation
     grp --> list, groups to which the user belogns
     nodes --> list, the list of datanodes which are up at the moment of the file creation
+    codec --> str, the codec used by the client for compressing the chunks of the file
+    stored_size --> int, the total size of the compressed chunks of the file
+    policy --> str, the storage policy of the file, if None the one of the nearest directory with a policy is inherited
+    hashes --> list, the hashes of the chunks payloads of the file, in order; if given the chunks of a replicated file are deduplicated, so only the chunks not already stored must be written
     
     Returns
     -------
@@ -1553,25 +1810,102 @@ def put_file(client, file_path, file_size, required_by, grp, nodes):
         raise AlreadyExistsDirectoryException()
     #create the file
     else:
+        #the storage policy not given explicitly is inherited by the parent directories
+        if policy is None:
+            policy = resolve_policy(fs, curr_dir)
+        try:
+            ec = parse_policy(policy)
+        except InvalidPolicyException as e:
+            logging.warning(e.message)
+            raise e
+        max_chunk_size = get_chunk_size()
+        #e.g. file size = 75 bytes, chunk size = 10 bytes --> number of chunks = 8 **(ceil(75/10))**
+        c_number = ceil(file_size/max_chunk_size)
         #update the fs collection
         fs.update_one({ '_id': curr_dir['_id'] }, {'$push': { 'files': file_path.name}})
         #insert into the list needed for aligning the other namenodes
         updatedone_documents.append(({ '_id': curr_dir['_id'] }, {'$push': { 'files': file_path.name}}, 'fs'))
+        #the deduplication is available only for the replicated files, the cells of a stripe can't be shared
+        dedup = ec is None and hashes is not None
         #create the file node and insert it into MongoDB
-        new_file = create_file_node(file_path.name, curr_dir['_id'], required_by, required_by, file_size)
+        new_file = create_file_node(file_path.name, curr_dir['_id'], required_by, required_by, file_size, codec, stored_size, policy, c_number, hashes if dedup else None)
         file_id = fs.insert_one(new_file).inserted_id
         curr_file = fs.find_one({'_id': file_id})
         #insert into the list needed for aligning the other namenodes
         inserted_documents.append((curr_file, 'fs'))
-        max_chunk_size = get_chunk_size()
-        #e.g. file size = 75 bytes, chunk size = 10 bytes --> number of chunks = 8 **(ceil(75/10))**
-        c_number = ceil(file_size/max_chunk_size)
         chunks = {}
         replicas = {}
         chunks_bkp = {}
         replicas_bkp = {}
+        #erasure coded file: each stripe has data_chunks data cells and parity_chunks parity cells, every cell is stored only once
+        if ec is not None:
+            (data_chunks, parity_chunks) = ec
+            if len(nodes) < data_chunks+parity_chunks:
+                logging.warning('Not enough datanodes for placing the {} cells of a stripe on different datanodes'.format(data_chunks+parity_chunks))
+            for stripe in range(stripes_number(c_number, data_chunks)):
+                layout = stripe_layout(c_number+stripe*parity_chunks, c_number, data_chunks, parity_chunks)[1]
+                for (i, c) in enumerate(layout):
+                    #the last stripe of the file could have less data cells
+                    if c is None:
+                        continue
+                    #the cells of a stripe are placed on different datanodes, rotating the first datanode at every stripe
+                    dn = nodes[(stripe*(data_chunks+parity_chunks)+i)%len(nodes)]
+                    try:
+                        chunks[dn].append('{}_{}'.format(str(file_id), str(c)))
+                    except:
+                        chunks[dn] = ['{}_{}'.format(str(file_id), str(c))]
+                    chunks_bkp['{}_{}'.format(str(file_id), str(c))] = dn.replace('.', '[dot]').replace(':', '[colon]')
+                    replicas['{}_{}'.format(str(file_id), str(c))] = []
+        #deduplicated file: the chunks are named by their hash and shared between all the files with the same content
+        if dedup:
+            #get the chunks MongoDB collection
+            chunks_store = get_chunks_store(client)
+            refs = {}
+            for h in hashes:
+                refs[h] = refs.get(h, 0) + 1
+            for (i, h) in enumerate(refs):
+                #the chunk is already known, only a new reference is needed (a tombstoned chunk is being deleted by the garbage collector)
+                chunk = chunks_store.find_one_and_update({'_id': h, 'tombstone': {'$ne': True}}, {'$inc': {'refs': refs[h]}})
+                if chunk is not None:
+                    #insert into the list needed for aligning the other namenodes
+                    updatedone_documents.append(({'_id': h}, {'$inc': {'refs': refs[h]}}, 'chunks'))
+                    #the chunk has not been acknowledged yet and its write could fail, so the file writes it too instead of relying on it
+                    if chunk.get('pending'):
+                        chunks_store.update_one({'_id': h}, {'$push': {'pending': str(file_id)}})
+                        #insert into the list needed for aligning the other namenodes
+                        updatedone_documents.append(({'_id': h}, {'$push': {'pending': str(file_id)}}, 'chunks'))
+                        master = chunk['master'].replace('[dot]', '.').replace('[colon]', ':')
+                        try:
+                            chunks[master].append(h)
+                        except:
+                            chunks[master] = [h]
+                        replicas[h] = [dn.replace('[dot]', '.').replace('[colon]', ':') for dn in chunk['replicas']]
+                    continue
+                #new chunk, decide the datanodes which handle the primary and secondary replicas
+                try:
+                    chunks[nodes[i%len(nodes)]].append(h)
+                except:
+                    chunks[nodes[i%len(nodes)]] = [h]
+                tmpn = nodes[:]
+                tmpn.remove(nodes[i%len(nodes)])
+                dn_replica = choose_replicas(tmpn)
+                replicas[h] = dn_replica
+                #the chunk is pending until the datanodes acknowledge the write of the file (see commit_chunks)
+                new_chunk = create_chunk_node(h, nodes[i%len(nodes)].replace('.', '[dot]').replace(':', '[colon]'), [dn.replace('.', '[dot]').replace(':', '[colon]') for dn in dn_replica], refs[h], [str(file_id)])
+                #a chunk still tombstoned here has been left by a garbage collection interrupted (e.g. by a crash of the master namenode), it's written again
+                update = {'$set': {k: new_chunk[k] for k in new_chunk if k != '_id'}, '$unset': {'tombstone': ''}}
+                if chunks_store.update_one({'_id': h, 'tombstone': True}, update).matched_count > 0:
+                    #insert into the list needed for aligning the other namenodes
+                    updatedone_documents.append(({'_id': h}, update, 'chunks'))
+                    continue
+                chunks_store.insert_one(new_chunk)
+                #insert into the list needed for aligning the other namenodes
+                inserted_documents.append((new_chunk, 'chunks'))
+            logging.info('File {} put, {} chunks to write out of {}'.format(file_path, len(replicas), len(hashes)))
+            #the placement of the chunks is recorded only into the chunks collection
+            return (file_id, chunks, replicas, inserted_documents, updatedone_documents)
         #decide how many chunks and which are the datanodes which handle the primary and seconday replicas for the current file just created
-        for c in range(c_number): 
+        for c in range(c_number if ec is None else 0): 
             #decide the namenode which handles the primary replica for the current chunk 
             try:
                 chunks[nodes[c%len(nodes)]].append('{}_{}'.format(str(file_id), str(c)))
@@ -1604,3 +1938,161 @@ def put_file(client, file_path, file_size, required_by, grp, nodes):
         logging.info('File {} put'.format(file_path))
         #return the list of the chunks to create and the list of the namenodes which must handle the replicas
         return (file_id, chunks, replicas, inserted_documents, updatedone_documents)
+
+
+def commit_chunks(client, file_ids, required_by):
+    """Function for marking as stored the deduplicated chunks written for some files, once the datanodes have acknowledged the writes; until then the other files put with the same chunks write them too, since the writes could fail.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    file_ids --> list, the MongoDB object ids (as strings) of the files put
+    required_by --> str, user who required the operation
+    
+    Returns
+    -------
+    updatedmany_documents --> list, the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
+    """
+    updatedmany_documents = []
+    #get fs (filesystem) and chunks MongoDB collections
+    fs = get_fs(client)
+    chunks_store = get_chunks_store(client)
+    for file_id in file_ids:
+        file = fs.find_one({'_id': ObjectId(file_id)})
+        #the file could have been removed in the meantime, its chunks will be reclaimed by the garbage collector
+        if file is None:
+            logging.warning('The file {} does not exist anymore'.format(file_id))
+            continue
+        #only who put the file knows if its chunks have been written
+        if file['own'] != required_by:
+            logging.warning('Access denied: the operation required is not allowed on {}'.format(file['name']))
+            raise AccessDeniedException(file['name'])
+        chunks_store.update_many({'pending': file_id}, {'$set': {'pending': []}})
+        #insert into the list needed for aligning the other namenodes
+        updatedmany_documents.append(({'pending': file_id}, {'$set': {'pending': []}}, 'chunks'))
+    return updatedmany_documents
+
+
+def resolve_policy(fs, directory):
+    """Function for getting the storage policy inherited by a directory, the policy of the nearest directory (starting from the directory itself and going up to the root) which has a policy.
+    
+    Parameters
+    ----------
+    fs --> pymongo.collection.Collection class, MongoDb collection which handles fs metadata
+    directory --> dict, the MongoDB object which represents the directory
+    
+    Returns
+    -------
+    policy --> str, the storage policy, the default one of the configuration file if no directory has a policy
+    """
+    while directory is not None:
+        if directory.get('policy'):
+            return directory['policy']
+        #the root directory has not a parent
+        if directory['parent'] is None:
+            break
+        directory = fs.find_one({'_id': directory['parent']})
+    return get_storage_policy()
+
+
+def get_policy(client, path, required_by, grp):
+    """Allow to get the storage policy of a resource; for a file not existing yet, it's the policy which the file would inherit if created.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    path --> pathlib.PosixPath class, path to the resource
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    policy --> str, the storage policy, either replication or RS-<DATA_CHUNKS>-<PARITY_CHUNKS>
+    """
+    #get fs (filesystem) MongoDB collection
+    fs = get_fs(client)
+    #navigate in the file system until the parent directory
+    try:
+        curr_dir = navigate_through(path, fs, required_by, grp, 'get_policy')
+    except AccessDeniedException as e:
+        logging.warning(e.message)
+        raise e
+    except NotFoundException as e:
+        logging.warning(e.message)
+        raise e
+    #check the permissions with parent role for the parent directory 
+    if not check_permissions(curr_dir, 'parent', required_by, grp, 'get_policy'):
+        logging.warning('Access denied: the operation required is not allowed on {}'.format(curr_dir['name']))
+        raise AccessDeniedException(curr_dir['name'])
+    #the last part of the path is an existing file, its policy has been decided when it has been put
+    if path.name in curr_dir['files']:
+        file = fs.find_one({'parent': curr_dir['_id'], 'type': 'f', 'name': path.name})
+        return file.get('policy', 'replication')
+    #the last part of the path is a directory
+    if path.name in curr_dir['directories']:
+        curr_dir = fs.find_one({'parent': curr_dir['_id'], 'type': 'd', 'name': path.name})
+    return resolve_policy(fs, curr_dir)
+
+
+def setpolicy(client, path, policy, required_by, grp):
+    """Allow to set the storage policy of a directory; the files put after into the directory, or into its subdirectories without a policy, will be stored with this policy.
+    
+    Parameters
+    ----------
+    client --> pymoMongoClient class, MongoDB client
+    path --> pathlib.PosixPath class, path to the directory
+    policy --> str, the new storage policy, either replication or RS-<DATA_CHUNKS>-<PARITY_CHUNKS>
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    updatedone_documents --> list, the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
+    """
+    #for master namenode
+    updatedone_documents = []
+    #get fs (filesystem) MongoDB collection
+    fs = get_fs(client)
+    #verify that the policy is valid
+    try:
+        parse_policy(policy)
+    except InvalidPolicyException as e:
+        logging.warning(e.message)
+        raise e
+    #navigate in the file system until the parent directory
+    try:
+        curr_dir = navigate_through(path, fs, required_by, grp, 'setpolicy')
+    except AccessDeniedException as e:
+        logging.warning(e.message)
+        raise e
+    except NotFoundException as e:
+        logging.warning(e.message)
+        raise e
+    #check the permissions with parent role for the parent directory 
+    if not check_permissions(curr_dir, 'parent', required_by, grp, 'setpolicy'):
+        logging.warning('Access denied: the operation required is not allowed on {}'.format(curr_dir['name']))
+        raise AccessDeniedException(curr_dir['name'])
+    #the last part of the path is a directory
+    if path.name in curr_dir['directories']:
+        directory = fs.find_one({'parent': curr_dir['_id'], 'type': 'd', 'name': path.name})
+    #the path is the root directory
+    elif path.name == '':
+        directory = curr_dir
+    #the policy of a file is decided when it's put and cannot be changed
+    elif path.name in curr_dir['files']:
+        logging.warning('The resource is not a directory: {}'.format(path.name))
+        raise NotDirectoryException(path.name)
+    #the path does not exist
+    else:
+        logging.warning('The path does not exist: "{}" not found'.format(path.name))
+        raise NotFoundException(path.name)
+    #only the root and the owner of the directory can change the policy
+    if required_by != directory['own'] and required_by != 'root':
+        logging.warning('Access denied: the operation required is not allowed on {}'.format(directory['name']))
+        raise AccessDeniedException(directory['name'])
+    #update the fs collection
+    fs.update_one({ '_id': directory['_id'] }, {'$set': {'policy': policy}})
+    #insert into the list needed for aligning the other namenodes
+    updatedone_documents.append(({ '_id': directory['_id'] }, {'$set': {'policy': policy}}, 'fs'))
+    logging.info('The storage policy of {} has changed: now is {}'.format(path, policy))
+    return updatedone_documents
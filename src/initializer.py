@@ -1,6 +1,7 @@
-from collections_handler import get_fs, get_users, get_groups, get_trash
+from collections_handler import get_fs, get_users, get_groups, get_trash, get_chunks_store, get_deletions
 from utils import create_user_node, create_group_node, create_directory_node, get_datanodes_list
 from requests import delete
+from pymongo import ASCENDING
 import logging
 
 logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
@@ -31,11 +32,17 @@ def mkfs(client, required_by):
     users = get_users(client)
     groups = get_groups(client)
     trash = get_trash(client)
+    chunks_store = get_chunks_store(client)
+    deletions = get_deletions(client)
     #clean all the MongoDB metadata collections 
     res1 = fs.delete_many({})
     res2 = users.delete_many({})
     res3 = groups.delete_many({})
     res4 = trash.delete_many({})
+    res5 = chunks_store.delete_many({})
+    res6 = deletions.delete_many({})
+    #the datanodes take the oldest batches of the deletion queue which are theirs with every heartbeat
+    deletions.create_index([('datanode', ASCENDING), ('_id', ASCENDING)])
     logging.info('Metadata DB cleaned')
     #create the root user
     root_usr = create_user_node('root', 'root1.', ['root'])
@@ -0,0 +1,66 @@
+###example --> python3 migrate_storage.py datanode1 hashed
+
+import sys
+import os
+import logging
+from utils import get_datanode_setting, get_datanode_storages, get_storage_layout
+from datanode_utils import chunk_path, walk_chunks, sync_directory
+
+logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def migrate_storage(storage, layout):
+    """Function for moving the chunks of a storage directory to where a layout expects them (e.g. from the flat layout to the hashed one); each chunk is renamed, so the migration does not copy any content and it can be stopped and run again. The datanode must not be running.
+
+    Parameters
+    ----------
+    storage --> str, the storage directory of the datanode
+    layout --> str, either flat or hashed
+
+    Returns
+    -------
+    (moved, removed) --> tuple(int, int), the number of chunks moved and the number of partial writes (.part files) removed
+    """
+    moved = 0
+    removed = 0
+    directories = set()
+    #the partial writes have been interrupted by a stop of the datanode, they will never be completed
+    for (r, d, f) in os.walk(storage):
+        for name in f:
+            if name.endswith('.part'):
+                os.remove(os.path.join(r, name))
+                removed += 1
+    for (name, path) in list(walk_chunks(storage)):
+        new_path = chunk_path(storage, name, layout)
+        if path != new_path:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(path, new_path)
+            directories.update([os.path.dirname(path), os.path.dirname(new_path)])
+            moved += 1
+            if moved % 100000 == 0:
+                logging.info('Moved {} chunks'.format(moved))
+    #the renames are durable only when the directories are synced too
+    for directory in directories:
+        sync_directory(directory)
+    #the subdirectories left empty (e.g. from the hashed layout to the flat one) are removed
+    for (r, d, f) in os.walk(storage, topdown=False):
+        if os.path.normpath(r) != os.path.normpath(storage) and not os.listdir(r):
+            os.rmdir(r)
+    return (moved, removed)
+
+
+def main():
+    """Main function, the entry point."""
+    s = get_datanode_setting(sys.argv[1])
+    layout = sys.argv[2] if len(sys.argv) > 2 else get_storage_layout()
+    if layout not in ['flat', 'hashed']:
+        logging.error('Unknown layout {}'.format(layout))
+        return
+    #each disk of the datanode is migrated on its own
+    for storage in get_datanode_storages(s):
+        (moved, removed) = migrate_storage(storage, layout)
+        logging.info('Storage directory {} migrated to the {} layout: {} chunks moved, {} partial writes removed'.format(storage, layout, moved, removed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,8 @@
 #example --> python3 namenode.py namenode1
 
 import sys
-from xmlrpc.server import SimpleXMLRPCServer
-from pymongo import MongoClient
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from pymongo import MongoClient, ASCENDING
 import threading
 import time
 import asyncio
@@ -11,14 +11,24 @@ import functools
 from pathlib import Path
 import xmlrpc.client
 import logging
+import random
+import os
+import hmac
+import hashlib
+import base64
+import inspect
+import json
+from bson.objectid import ObjectId
 
 import fs_handler as fsh
 import initializer as ini
 import users_groups_handler as ugh
-from collections_handler import get_fs, get_trash, get_users, get_groups
-from utils import get_namenode_setting, get_datanodes_list, get_datanodes, choose_recovery_replica, get_namenodes, get_replica_set, decode_mongodoc, encode_mongodoc
-from chunks_handler import start_recovery, start_flush
-from exceptions import InvalidSyntaxException, CommandNotFoundException, UserNotFoundException, AccessDeniedException, NotFoundException, RootNecessaryException, NotDirectoryException, NotParentException, AlreadyExistsException, NotEmptyException, AccessDeniedAtLeastOneException, InvalidModException, GroupAlreadyExistsException, UserAlreadyExistsException, GroupNotFoundException, MainUserGroupException
+from collections_handler import get_fs, get_trash, get_users, get_groups, get_chunks_store, get_deletions, JournaledClient
+from utils import get_namenode_setting, get_datanodes_list, get_datanodes, choose_recovery_replica, get_namenodes, get_replica_set, decode_mongodoc, encode_mongodoc, parse_policy, get_gc_interval, get_session_ttl, get_session_secret, get_deletion_batch_size, get_deletion_window, get_gc_timeout, TimeoutTransport
+from chunks_handler import start_recovery, start_flush, start_ec_recovery
+from erasure_coding import stripe_layout
+from compression_utils import get_codec
+from exceptions import InvalidSyntaxException, CommandNotFoundException, UserNotFoundException, AccessDeniedException, NotFoundException, RootNecessaryException, NotDirectoryException, NotParentException, AlreadyExistsException, NotEmptyException, AccessDeniedAtLeastOneException, InvalidModException, GroupAlreadyExistsException, UserAlreadyExistsException, GroupNotFoundException, MainUserGroupException, NotMasterException, InvalidSessionException, ChunksCollectingException
 
 namenode = get_namenode_setting(sys.argv[1])
 #MongoDb client, to interact with the metadata database
@@ -27,7 +37,9 @@ collections = {
     'fs': get_fs(client),
     'users': get_users(client),
     'groups': get_groups(client),
-    'trash': get_trash(client)
+    'trash': get_trash(client),
+    'chunks': get_chunks_store(client),
+    'deletions': get_deletions(client)
 }
 #get the list of datanodes setting
 datanodes = get_datanodes()
@@ -44,6 +56,17 @@ you_the_master = False
 namenodes = get_namenodes()
 del namenodes[sys.argv[1]]
 namenodes = [nn for nn in namenodes.values()]
+#the secret for signing the session tokens, a namenode without it starts only if it's the only one (see main)
+session_secret = get_session_secret() or os.urandom(32)
+#the sessions validated recently, key: token, value: user and groups of the session, until when they are used without reading the user again
+sessions = {}
+#when the expired sessions have been evicted the last time
+sessions_swept = time.monotonic()
+#the credentials (username and token) sent with the rpc call being executed
+credentials = threading.local()
+#the deduplicated chunks being deleted from the datanodes by the garbage collector, the files with the same chunks are refused until the deletion is done
+collecting = set()
+collection = threading.Lock()
 
     
 def mkdir(path, required_by, grp, parent):
@@ -69,7 +92,7 @@ def mkdir(path, required_by, grp, parent):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.mkdir_s(inserted_documents, updatedone_documents) #xml rpc call
             except Exception as e:
@@ -100,7 +123,7 @@ def touch(path, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.touch_s(inserted_documents, updatedone_documents) #xml rpc call
             except Exception as e:
@@ -141,10 +164,12 @@ def rm(path, required_by, grp):
     
     Returns
     -------
-    (deleted, hosts) --> tuple(list, list), the list containing the object id you want to remove and the list of the datanodes which handle a replica of some chunk of the resource
+    (deleted, hosts) --> tuple(list, list), the list containing the object id you want to remove and the list of the datanodes which handle a replica of some chunk of the resource; the chunks have already been queued for being deleted by the datanodes
     """
     #execute rm command for metadata
     (deleted, hosts, updatedone_documents, deletedone_documents) = fsh.rm(client, Path(path), required_by, grp)
+    #the chunks of the files removed are deleted in background by the datanodes, which take them from the deletion queue
+    inserted_documents = queue_deletions(deleted, hosts)
     #decode for aligning the other slave datanodes metadata database
     #cast the MongoDB ObjectIds to strings
     updatedone_documents = decode_mongodoc(updatedone_documents, 'updatedone_documents')
@@ -152,9 +177,9 @@ def rm(path, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
-                proxy.rm_s(updatedone_documents, deletedone_documents) #xml rpc call
+                proxy.rm_s(updatedone_documents, deletedone_documents, inserted_documents) #xml rpc call
             except Exception as e:
                 #the namenode is not reachable
                 logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
@@ -172,10 +197,12 @@ def rmr(path, required_by, grp):
     
     Returns
     -------
-    (deleted, hosts) --> tuple(list, list), the list containing the objects ids you want to remove and the list of the datanodes which handle a replica of some chunk of the resources 
+    (deleted, hosts) --> tuple(list, list), the list containing the objects ids you want to remove and the list of the datanodes which handle a replica of some chunk of the resources; the chunks have already been queued for being deleted by the datanodes
     """
     #execute rmr command for metadata
     (deleted,hosts, updatedone_documents, deletedone_documents) = fsh.rmr(client, Path(path), required_by, grp)
+    #the chunks of the files removed are deleted in background by the datanodes, which take them from the deletion queue
+    inserted_documents = queue_deletions(deleted, hosts)
     #decode for aligning the other slave datanodes metadata database
     #cast the MongoDB ObjectIds to strings
     updatedone_documents = decode_mongodoc(updatedone_documents, 'updatedone_documents')
@@ -183,9 +210,9 @@ def rmr(path, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
-                proxy.rmr_s(updatedone_documents, deletedone_documents) #xml rpc call
+                proxy.rmr_s(updatedone_documents, deletedone_documents, inserted_documents) #xml rpc call
             except Exception as e:
                 #the namenode is not reachable
                 logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
@@ -212,6 +239,27 @@ def get_file(path, required_by, grp):
     return file 
 
 
+def get_tree(path, required_by, grp):
+    """Allow to get all the directories and the files into a directory recursively (used for get_dir).
+    
+    Parameters
+    ----------
+    path --> str, path to the directory for which the operation is required
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    tree --> dict, the relative paths of the directories (key: directories) and the objects which represent the files (key: files)
+    """
+    #execute get_tree command for metadata
+    (directories, files) = fsh.get_tree(client, Path(path), required_by, grp)
+    for f in files:
+        f['_id'] = str(f['_id'])
+        f['parent'] = str(f['parent'])
+    return {'directories': directories, 'files': files}
+
+
 def cp(orig, dest, required_by, grp):
     """Allow to execute cp command.
     
@@ -236,7 +284,7 @@ def cp(orig, dest, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.cp_s(inserted_documents, updatedone_documents, deletedone_documents) #xml rpc call
             except Exception as e:
@@ -269,7 +317,7 @@ def mv(orig, dest, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.mv_s(updatedone_documents) #xml rpc call
             except Exception as e:
@@ -314,7 +362,7 @@ def countr(path, required_by, grp):
     return res
 
 
-def du(path, required_by, grp):
+def du(path, required_by, grp, stored=False):
     """Allow to execute du command.
     
     Parameters
@@ -322,13 +370,14 @@ def du(path, required_by, grp):
     path --> str, path to the resource for which the operation is required
     required_by --> str, user who required the operation
     grp --> list, groups to which the user belogns
+    stored --> bool, if True the size of the (compressed) chunks stored into the datanodes is returned instead of the logical size
     
     Returns
     -------
     size --> int, the total size of the disk usage for the input resource
     """
     #execute du command for metadata
-    size = fsh.du(client, Path(path), required_by, grp)
+    size = fsh.du(client, Path(path), required_by, grp, stored)
     return size
 
 
@@ -354,7 +403,7 @@ def chown(path, new_own, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.chown_s(updatedone_documents) #xml rpc call
             except Exception as e:
@@ -385,7 +434,7 @@ def chgrp(path, new_grp, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.chgrp_s(updatedone_documents) #xml rpc call
             except Exception as e:
@@ -416,7 +465,7 @@ def chmod(path, new_mod, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.chmod_s(updatedone_documents) #xml rpc call
             except Exception as e:
@@ -425,7 +474,56 @@ def chmod(path, new_mod, required_by, grp):
     return
 
 
-def put_file(file_path, size, required_by, grp):
+def setpolicy(path, policy, required_by, grp):
+    """Allow to execute setpolicy command.
+    
+    Parameters
+    ----------
+    path --> str, path to the directory for which the operation is required
+    policy --> str, the new storage policy of the directory
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    None
+    """
+    #execute setpolicy command for metadata
+    updatedone_documents = fsh.setpolicy(client, Path(path), policy, required_by, grp)
+    #decode for aligning the other slave datanodes metadata database
+    #cast the MongoDB ObjectIds to strings
+    updatedone_documents = decode_mongodoc(updatedone_documents, 'updatedone_documents')
+    #align the slave namenodes metadata database with a rpc call
+    for nn in namenodes:
+        loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+            try:
+                proxy.setpolicy_s(updatedone_documents) #xml rpc call
+            except Exception as e:
+                #the namenode is not reachable
+                logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
+    return
+
+
+def get_policy(path, required_by, grp):
+    """Allow to get the storage policy of a resource (used for getpolicy and put_file).
+    
+    Parameters
+    ----------
+    path --> str, path to the resource for which the operation is required
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    policy --> str, the storage policy of the resource
+    """
+    #execute get_policy command for metadata
+    policy = fsh.get_policy(client, Path(path), required_by, grp)
+    return policy
+
+
+def put_file(file_path, size, required_by, grp, codec='none', stored_size=None, policy=None, hashes=None):
     """Allow to execute put_file command.
     
     Parameters
@@ -434,6 +532,10 @@ def put_file(file_path, size, required_by, grp):
     size --> int, the file size it's required the put operation
     required_by --> str, user who required the operation
     grp --> list, groups to which the user belogns
+    codec --> str, the codec used by the client for compressing the chunks of the file
+    stored_size --> int, the total size of the compressed chunks of the file
+    policy --> str, the storage policy of the file, if None the one of the parent directories is inherited
+    hashes --> list, the hashes of the chunks payloads of the file, in order, given only if the chunks must be deduplicated
     
     Returns
     -------
@@ -441,8 +543,14 @@ def put_file(file_path, size, required_by, grp):
     """
     global start
     up_nodes = list(filter(lambda x: start[x]>0, start.keys()))
-    #execute put_file command for metadata
-    (fid,chunks_to_write, replicas, inserted_documents, updatedone_documents) = fsh.put_file(client, Path(file_path), size, required_by, grp, up_nodes)
+    #the codec must be known also by the namenode, otherwise the file could not be read back by the other clients
+    get_codec(codec)
+    #a chunk being deleted by the garbage collector can't be written again until the deletion is done, the client retries the put (the rpc server is not blocked meanwhile)
+    with collection:
+        if hashes is not None and not collecting.isdisjoint(hashes):
+            raise ChunksCollectingException(file_path)
+        #execute put_file command for metadata
+        (fid,chunks_to_write, replicas, inserted_documents, updatedone_documents) = fsh.put_file(client, Path(file_path), size, required_by, grp, up_nodes, codec, stored_size, policy, hashes)
     #decode for aligning the other slave datanodes metadata database
     #cast the MongoDB ObjectIds to strings
     inserted_documents = decode_mongodoc(inserted_documents, 'inserted_documents')
@@ -451,7 +559,7 @@ def put_file(file_path, size, required_by, grp):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.put_file_s(inserted_documents, updatedone_documents) #xml rpc call
             except Exception as e:
@@ -460,6 +568,236 @@ def put_file(file_path, size, required_by, grp):
     return (fid, chunks_to_write, replicas)
 
 
+def mkdirs(paths, required_by, grp):
+    """Allow to create many directories with a single call (used for put_dir); the directories which already exist are skipped and the slave namenodes are aligned once for all of them.
+    
+    Parameters
+    ----------
+    paths --> list, paths to the folders to create, each parent before its children
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    policies --> dict, key: path of the folder, value: the storage policy inherited by the files put into it
+    """
+    policies = {}
+    inserted_documents = []
+    updatedone_documents = []
+    try:
+        for path in paths:
+            #execute mkdir command for metadata, the missing parents are created too
+            try:
+                (directory_id, inserted, updatedone) = fsh.mkdir(client, Path(path), required_by, grp, True)
+                inserted_documents.extend(inserted)
+                updatedone_documents.extend(updatedone)
+            except AlreadyExistsException:
+                pass
+            policies[path] = fsh.get_policy(client, Path(path), required_by, grp)
+    finally:
+        #the directories created before an error are aligned anyway
+        #cast the MongoDB ObjectIds to strings
+        inserted_documents = decode_mongodoc(inserted_documents, 'inserted_documents')
+        updatedone_documents = decode_mongodoc(updatedone_documents, 'updatedone_documents')
+        #align the slave namenodes metadata database with a rpc call
+        for nn in namenodes:
+            loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
+            with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+                try:
+                    proxy.mkdir_s(inserted_documents, updatedone_documents) #xml rpc call
+                except Exception as e:
+                    #the namenode is not reachable
+                    logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
+    return policies
+
+
+def put_files(files, required_by, grp):
+    """Allow to put many files with a single call (used for put_dir); the chunks of all the files are allocated together and the slave namenodes are aligned once for all of them.
+    
+    Parameters
+    ----------
+    files --> list, dicts which contains the arguments of put_file for each file: path, size, codec, stored_size, policy and hashes
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    results --> list, for each file (in the same order) a dict which contains either fid, chunks and replicas as returned by put_file, or the error for which the file has not been put
+    """
+    global start
+    up_nodes = list(filter(lambda x: start[x]>0, start.keys()))
+    results = []
+    inserted_documents = []
+    updatedone_documents = []
+    for f in files:
+        #a file which can not be put does not stop the others
+        try:
+            #the codec must be known also by the namenode, otherwise the file could not be read back by the other clients
+            get_codec(f['codec'])
+            #a chunk being deleted by the garbage collector can't be written again until the deletion is done, the client retries the put
+            with collection:
+                if f['hashes'] is not None and not collecting.isdisjoint(f['hashes']):
+                    raise ChunksCollectingException(f['path'])
+                #execute put_file command for metadata
+                (fid, chunks_to_write, replicas, inserted, updatedone) = fsh.put_file(client, Path(f['path']), f['size'], required_by, grp, up_nodes, f['codec'], f['stored_size'], f['policy'], f['hashes'])
+            inserted_documents.extend(inserted)
+            updatedone_documents.extend(updatedone)
+            results.append({'fid': str(fid), 'chunks': chunks_to_write, 'replicas': replicas})
+        except Exception as e:
+            results.append({'error': '{}: {}'.format(type(e).__name__, getattr(e, 'message', e))})
+    #cast the MongoDB ObjectIds to strings
+    inserted_documents = decode_mongodoc(inserted_documents, 'inserted_documents')
+    updatedone_documents = decode_mongodoc(updatedone_documents, 'updatedone_documents')
+    #align the slave namenodes metadata database with a rpc call
+    for nn in namenodes:
+        loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+            try:
+                proxy.put_file_s(inserted_documents, updatedone_documents) #xml rpc call
+            except Exception as e:
+                #the namenode is not reachable
+                logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
+    return results
+
+
+def commit_chunks(fids, required_by, grp):
+    """Allow to mark as stored the deduplicated chunks of some files, once the client has written them into the datanodes; from then on the files put with the same chunks don't write them again.
+    
+    Parameters
+    ----------
+    fids --> list, the MongoDB object ids of the files put
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    None
+    """
+    #execute commit_chunks command for metadata
+    updatedmany_documents = fsh.commit_chunks(client, fids, required_by)
+    #align the slave namenodes metadata database with a rpc call
+    for nn in namenodes:
+        loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+            try:
+                proxy.commit_chunks_s(updatedmany_documents) #xml rpc call
+            except Exception as e:
+                #the namenode is not reachable
+                logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
+    return
+
+
+def execute_op(c, op, required_by, grp):
+    """Function for executing an operation of a batch on the metadata of the master namenode.
+    
+    Parameters
+    ----------
+    c --> collections_handler.JournaledClient class, MongoDB client which records the writes of the operation
+    op --> dict, the operation (key: op) and its arguments, named as the ones of the function which executes the operation alone (e.g. {'op': 'chmod', 'path': '/user/file.txt', 'new_mod': '750'})
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    (result, alignment) --> tuple(any, list), the result of the operation as the function which executes it alone returns it, the method and the arguments for aligning the slave namenodes (None for the operations which don't write)
+    """
+    name = op['op']
+    if name == 'mkdir':
+        (directory_id, inserted_documents, updatedone_documents) = fsh.mkdir(c, Path(op['path']), required_by, grp, op.get('parent', 'F') == 'T')
+        return (str(directory_id), ['mkdir_s', decode_mongodoc(inserted_documents, 'inserted_documents'), decode_mongodoc(updatedone_documents, 'updatedone_documents')])
+    elif name == 'touch':
+        (file_id, inserted_documents, updatedone_documents) = fsh.touch(c, Path(op['path']), required_by, grp)
+        return (str(file_id), ['touch_s', decode_mongodoc(inserted_documents, 'inserted_documents'), decode_mongodoc(updatedone_documents, 'updatedone_documents')])
+    elif name == 'mv':
+        updatedone_documents = fsh.mv(c, Path(op['orig']), Path(op['dest']), required_by, grp)
+        return (None, ['mv_s', decode_mongodoc(updatedone_documents, 'updatedone_documents')])
+    elif name == 'chown':
+        updatedone_documents = fsh.chown(c, Path(op['path']), op['new_own'], required_by, grp)
+        return (None, ['chown_s', decode_mongodoc(updatedone_documents, 'updatedone_documents')])
+    elif name == 'chgrp':
+        updatedone_documents = fsh.chgrp(c, Path(op['path']), op['new_grp'], required_by, grp)
+        return (None, ['chgrp_s', decode_mongodoc(updatedone_documents, 'updatedone_documents')])
+    elif name == 'chmod':
+        updatedone_documents = fsh.chmod(c, Path(op['path']), op['new_mod'], required_by, grp)
+        return (None, ['chmod_s', decode_mongodoc(updatedone_documents, 'updatedone_documents')])
+    elif name == 'setpolicy':
+        updatedone_documents = fsh.setpolicy(c, Path(op['path']), op['policy'], required_by, grp)
+        return (None, ['setpolicy_s', decode_mongodoc(updatedone_documents, 'updatedone_documents')])
+    elif name == 'ls':
+        res = fsh.ls(c, Path(op['path']), required_by, grp)
+        for elem in res:
+            elem['_id'] = str(elem['_id'])
+            elem['parent'] = str(elem['parent'])
+        return (res, None)
+    elif name == 'get_file':
+        file = fsh.get_file(c, Path(op['path']), required_by, grp)
+        file['_id'] = str(file['_id'])
+        file['parent'] = str(file['parent'])
+        return (file, None)
+    elif name == 'get_policy':
+        return (fsh.get_policy(c, Path(op['path']), required_by, grp), None)
+    elif name == 'count':
+        return (fsh.count(c, Path(op['path']), required_by, grp), None)
+    elif name == 'countr':
+        return (fsh.countr(c, Path(op['path']), required_by, grp), None)
+    elif name == 'du':
+        return (fsh.du(c, Path(op['path']), required_by, grp, op.get('stored', False)), None)
+    #the operations which need the datanodes too (e.g. rm, cp, put_file) can not be batched
+    raise CommandNotFoundException()
+
+
+def batch(ops, required_by, grp, atomic=False):
+    """Allow to execute many metadata operations with a single call, in order; each operation is either executed completely or not at all, in atomic mode the whole batch is.
+    
+    Parameters
+    ----------
+    ops --> list, the operations (see execute_op)
+    required_by --> str, user who required the operation
+    grp --> list, groups to which the user belogns
+    atomic --> bool, if True the first operation which fails undoes all the ones already executed and the following ones are not executed
+    
+    Returns
+    -------
+    (committed, results) --> tuple(bool, list), False if the batch has been undone, for each operation (in the same order) a dict which contains either its result or the error for which it has failed
+    """
+    c = JournaledClient(client)
+    results = []
+    alignments = []
+    committed = True
+    for op in ops:
+        #an operation already undone or not executed because of a previous failure
+        if not committed:
+            results.append({'error': 'Not executed, the batch has been undone'})
+            continue
+        since = len(c.get_journal())
+        try:
+            (result, alignment) = execute_op(c, op, required_by, grp)
+            results.append({'result': result})
+            if alignment is not None:
+                alignments.append(alignment)
+        except Exception as e:
+            #the writes done by the operation before failing are undone, or all the batch in atomic mode
+            c.rollback(0 if atomic else since)
+            results.append({'error': '{}: {}'.format(type(e).__name__, getattr(e, 'message', e))})
+            if atomic:
+                committed = False
+                alignments = []
+                for r in results[:-1]:
+                    r['error'] = 'Undone, the batch has failed'
+                    del r['result']
+    #align the slave namenodes metadata database with a single rpc call for the whole batch
+    if alignments:
+        for nn in namenodes:
+            loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
+            with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+                try:
+                    proxy.batch_s(alignments) #xml rpc call
+                except Exception as e:
+                    #the namenode is not reachable
+                    logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
+    return (committed, results)
+
+
 def mkfs(required_by):
     """Allow to execute mkfs command.
     
@@ -479,7 +817,7 @@ def mkfs(required_by):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.mkfs_s(inserted_documents) #xml rpc call
             except Exception as e:
@@ -514,7 +852,7 @@ def groupadd(required_by, group):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.groupadd_s(inserted_documents) #xml rpc call
             except Exception as e:
@@ -544,7 +882,7 @@ def groupdel(required_by, group):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.groupdel_s(updatedone_documents, updatedmany_documents, deletedone_documents) #xml rpc call
             except Exception as e:
@@ -575,7 +913,7 @@ def useradd(required_by, username, password):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.useradd_s(inserted_documents, updatedone_documents) #xml rpc call
             except Exception as e:
@@ -605,7 +943,7 @@ def userdel(required_by, username):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.userdel_s(updatedone_documents, updatedmany_documents, deletedone_documents, deletemany_documents) #xml rpc call
             except Exception as e:
@@ -635,7 +973,7 @@ def passwd(required_by, username, new_password):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.passwd_s(updatedone_documents) #xml rpc call
             except Exception as e:
@@ -666,7 +1004,7 @@ def usermod(required_by, username, groups, operation):
     #align the slave namenodes metadata database with a rpc call
     for nn in namenodes:
         loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-        with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
             try:
                 proxy.usermod_s(updatedone_documents) #xml rpc call
             except Exception as e:
@@ -723,13 +1061,14 @@ def touch_s(inserted_documents, updatedone_documents):
     logging.info('Align slave namenode to the master - touch')
     
     
-def rm_s(updatedone_documents, deletedone_documents):
+def rm_s(updatedone_documents, deletedone_documents, inserted_documents=None):
     """Function for updating filesystem metadata for the slave namenodes after rm command
     
     Parameters
     ----------
     updatedone_documents --> list(list), the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
     deletedone_documents --> list(list), the list of the conditions for deleting MongoDB documents and the collection in which perform the delete
+    inserted_documents --> list(list), the list of the batches inserted into the deletion queue and the collection in which they must be inserted
     
     Returns
     -------
@@ -744,16 +1083,20 @@ def rm_s(updatedone_documents, deletedone_documents):
     #align the matadata deleting the documents
     for (condition, col) in deletedone_documents:
         collections[col].delete_one(condition)
+    #align the deletion queue inserting the new batches
+    for (doc, col) in encode_mongodoc(inserted_documents or [], 'inserted_documents'):
+        collections[col].insert_one(doc)
     logging.info('Align slave namenode to the master - rm')
     
     
-def rmr_s(updatedone_documents, deletedone_documents):
+def rmr_s(updatedone_documents, deletedone_documents, inserted_documents=None):
     """Function for updating filesystem metadata for the slave namenodes after rmr command
     
     Parameters
     ----------
     updatedone_documents --> list(list), the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
     deletedone_documents --> list(list), the list of the conditions for deleting MongoDB documents and the collection in which perform the delete
+    inserted_documents --> list(list), the list of the batches inserted into the deletion queue and the collection in which they must be inserted
     
     Returns
     -------
@@ -768,6 +1111,9 @@ def rmr_s(updatedone_documents, deletedone_documents):
     #align the matadata deleting the documents
     for (condition, col) in deletedone_documents:
         collections[col].delete_one(condition)
+    #align the deletion queue inserting the new batches
+    for (doc, col) in encode_mongodoc(inserted_documents or [], 'inserted_documents'):
+        collections[col].insert_one(doc)
     logging.info('Align slave namenode to the master - rmr')
     
     
@@ -900,6 +1246,25 @@ def chmod_s(updatedone_documents):
     logging.info('Align slave namenode to the master - chmod')    
     
     
+def setpolicy_s(updatedone_documents):
+    """Function for updating filesystem metadata for the slave namenodes after setpolicy command
+    
+    Parameters
+    ----------
+    updatedone_documents --> list(list), the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
+    
+    Returns
+    -------
+    None
+    """
+    #encode the MongoDB document to be used, cast back the ids from strings to ObjectId 
+    updatedone_documents = encode_mongodoc(updatedone_documents, 'updatedone_documents')
+    #align the matadata updating the documents
+    for (condition, update, col) in updatedone_documents:
+        collections[col].update_one(condition, update)
+    logging.info('Align slave namenode to the master - setpolicy')    
+    
+    
 def groupadd_s(inserted_documents):
     """Function for updating filesystem metadata for the slave namenodes after groupadd command
     
@@ -1058,6 +1423,9 @@ def mkfs_s(inserted_documents):
     res2 = collections['users'].delete_many({})
     res3 = collections['groups'].delete_many({})
     res4 = collections['trash'].delete_many({})
+    res5 = collections['chunks'].delete_many({})
+    res6 = collections['deletions'].delete_many({})
+    collections['deletions'].create_index([('datanode', ASCENDING), ('_id', ASCENDING)])
     #align the matadata inserting the new documents
     for (doc, col) in inserted_documents:
         collections[col].insert_one(doc)
@@ -1119,6 +1487,80 @@ def recover_from_disaster_s(updatedone_documents):
     logging.info('Align slave namenode to the master - recovering from disaster')
 
 
+def commit_chunks_s(updatedmany_documents):
+    """Function for updating filesystem metadata for the slave namenodes after the deduplicated chunks of some files have been marked as stored.
+    
+    Parameters
+    ----------
+    updatedmany_documents --> list(list), the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
+    
+    Returns
+    -------
+    None
+    """
+    #align the matadata updating the documents
+    for (condition, update, col) in updatedmany_documents:
+        collections[col].update_many(condition, update)
+    logging.info('Align slave namenode to the master - commit_chunks')
+
+
+def gc_s(updatedone_documents, deletedone_documents):
+    """Function for updating filesystem metadata for the slave namenodes after the garbage collector has tombstoned or deleted the chunks not referenced anymore.
+    
+    Parameters
+    ----------
+    updatedone_documents --> list(list), the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
+    deletedone_documents --> list(list), the list of the conditions for deleting MongoDB documents and the collection in which perform the delete
+    
+    Returns
+    -------
+    None
+    """
+    #encode the MongoDB document to be used, cast back the ids from strings to ObjectId 
+    updatedone_documents = encode_mongodoc(updatedone_documents, 'updatedone_documents')
+    deletedone_documents = encode_mongodoc(deletedone_documents, 'deletedone_documents')
+    #align the matadata updating the documents
+    for (condition, update, col) in updatedone_documents:
+        collections[col].update_one(condition, update)
+    #align the matadata deleting the documents
+    for (condition, col) in deletedone_documents:
+        collections[col].delete_one(condition)
+    logging.info('Align slave namenode to the master - garbage collection')
+
+
+def dequeue_deletions_s(ids):
+    """Function for updating filesystem metadata for the slave namenodes after the datanodes have deleted the chunks of some batches of the deletion queue.
+    
+    Parameters
+    ----------
+    ids --> list, the ids of the batches done
+    
+    Returns
+    -------
+    None
+    """
+    #cast back the ids from strings to ObjectId
+    collections['deletions'].delete_many({'_id': {'$in': [ObjectId(i) for i in ids]}})
+    logging.info('Align slave namenode to the master - deletion queue')
+
+
+def batch_s(alignments):
+    """Function for updating filesystem metadata for the slave namenodes after a batch of operations
+    
+    Parameters
+    ----------
+    alignments --> list(list), for each operation of the batch which has written the metadata, the name of the function which aligns the slave namenodes and its arguments
+    
+    Returns
+    -------
+    None
+    """
+    functions = {'mkdir_s': mkdir_s, 'touch_s': touch_s, 'mv_s': mv_s, 'chown_s': chown_s, 'chgrp_s': chgrp_s, 'chmod_s': chmod_s, 'setpolicy_s': setpolicy_s}
+    for (method, *args) in alignments:
+        functions[method](*args)
+    logging.info('Align slave namenode to the master - batch')
+
+
 def get_user(username):
     """Function for getting a user information (username, groups to which it belogs, etc).
     
@@ -1137,10 +1579,120 @@ def get_user(username):
         logging.warning('The username "{}" does not exist'.format(username))
         return None #the username does not exist
     usr['_id'] = str(usr['_id'])
+    #the password never leaves the namenode
+    del usr['password']
     logging.info('Username "{}" found'.format(username))
     return usr
 
 
+def sign_session(username, expiration, password):
+    """Function for signing a session; the password is signed too, so changing it invalidates the sessions of the user.
+    
+    Parameters
+    ----------
+    username --> str, the user of the session
+    expiration --> int, the timestamp at which the session expires
+    password --> str, the password of the user
+    
+    Returns
+    -------
+    hmac.new(session_secret, ..., hashlib.sha256).hexdigest() --> str, the signature
+    """
+    return hmac.new(session_secret, '{}.{}.{}'.format(username, expiration, password).encode(), hashlib.sha256).hexdigest()
+
+
+def sweep_sessions(force=False):
+    """Function for evicting the expired sessions, so the sessions of the users who don't login again are not kept forever; they are swept at most once a minute, unless forced.
+    
+    Parameters
+    ----------
+    force --> bool, if True the sessions are swept even if they have been swept less than a minute ago
+    
+    Returns
+    -------
+    None
+    """
+    global sessions_swept
+    if not force and time.monotonic()-sessions_swept < 60:
+        return
+    sessions_swept = time.monotonic()
+    now = time.time()
+    #the token starts with its expiration, the tokens in the cache have been validated so it's an integer
+    for token in [t for t in list(sessions) if int(t.split('.')[0]) < now]:
+        sessions.pop(token, None)
+
+
+def login(username, password):
+    """Allow a user to open a session; the token returned is sent with all the following commands instead of the password.
+    
+    Parameters
+    ----------
+    username --> str, the name of the user
+    password --> str, the password of the user
+    
+    Returns
+    -------
+    session --> dict, the session token (key: token), the groups to which the user belongs (key: groups) and the timestamp at which the session expires (key: expiration)
+    """
+    users = get_users(client)
+    usr = users.find_one({'name': username})
+    if not usr or not hmac.compare_digest(usr['password'], password):
+        logging.warning('Login failed for "{}"'.format(username))
+        raise AccessDeniedException(username)
+    expiration = int(time.time()) + get_session_ttl()
+    token = '{}.{}'.format(expiration, sign_session(username, expiration, usr['password']))
+    sweep_sessions()
+    sessions[token] = {'username': username, 'groups': usr['groups'], 'checked': time.monotonic()}
+    logging.info('Login of "{}"'.format(username))
+    return {'token': token, 'groups': usr['groups'], 'expiration': expiration}
+
+
+def validate_session(username, token):
+    """Function for validating the session of a rpc call; the groups of the user are cached, the user is read again at most every 30 seconds (so the changes of groups and passwords are applied).
+    
+    Parameters
+    ----------
+    username --> str, the user of the session
+    token --> str, the session token
+    
+    Returns
+    -------
+    (username, groups) --> tuple(str, list), the user of the session and the groups to which the user belongs
+    """
+    try:
+        expiration = int(token.split('.')[0])
+    except:
+        raise InvalidSessionException(username)
+    sweep_sessions()
+    if expiration < time.time():
+        sessions.pop(token, None)
+        raise InvalidSessionException(username)
+    session = sessions.get(token)
+    if session is None or session['username'] != username or time.monotonic()-session['checked'] > 30:
+        usr = get_users(client).find_one({'name': username})
+        if not usr or not hmac.compare_digest(token, '{}.{}'.format(expiration, sign_session(username, expiration, usr['password']))):
+            sessions.pop(token, None)
+            raise InvalidSessionException(username)
+        session = {'username': username, 'groups': usr['groups'], 'checked': time.monotonic()}
+        sessions[token] = session
+    return (session['username'], session['groups'])
+
+
+def whoami(required_by=None, grp=None):
+    """Allow to get the user of a session and the groups to which the user belongs.
+    
+    Parameters
+    ----------
+    required_by --> str, user of the session
+    grp --> list, groups to which the user belogns
+    
+    Returns
+    -------
+    usr --> dict, the name of the user (key: name) and the groups (key: groups)
+    """
+    return {'name': required_by, 'groups': grp}
+
+
 def get_status():
     """Function for getting the status of the namenode.
     
@@ -1171,6 +1723,13 @@ async def listen_for_heartbeats(websocket, path, lock):
     """
     #the namenode listens for heartbeat from a particular datanode 
     datanode = await websocket.recv()
+    #the heartbeat of a datanode with failed disks carries the chunks lost with them, the one of a datanode which is deleting chunks the batches of the deletion queue done and the ones in progress
+    lost_chunks = []
+    (deleted, pending) = ([], [])
+    if datanode.startswith('{'):
+        heartbeat = json.loads(datanode)
+        (datanode, lost_chunks) = (heartbeat['datanode'], heartbeat.get('lost_chunks', []))
+        (deleted, pending) = (heartbeat.get('deleted', []), heartbeat.get('pending', []))
     logging.info('{} is alive!'.format(datanode))
     global start, you_the_master
     lock.acquire() 
@@ -1180,8 +1739,140 @@ async def listen_for_heartbeats(websocket, path, lock):
     #the datanode has 10 seconds to send a heartbeat before being considered as down 
     start[datanode] = 10
     lock.release()
-    #send an answer to the datanode
-    await websocket.send("OK! got it!")
+    #send an answer to the datanode, with the next batches of chunks to delete if any; the query runs in a thread, so the heartbeats of the other datanodes are not blocked
+    batches = await asyncio.get_running_loop().run_in_executor(None, next_deletions, datanode, deleted+pending, get_deletion_window()-len(pending))
+    if batches:
+        await websocket.send(json.dumps({'answer': 'OK! got it!', 'deletions': batches}))
+    else:
+        await websocket.send("OK! got it!")
+    if lost_chunks:
+        threading.Thread(target=recover_lost_chunks, args=(datanode, lost_chunks)).start()
+    if deleted:
+        threading.Thread(target=dequeue_deletions, args=(deleted,)).start()
+
+
+def queue_deletions(deleted, hosts):
+    """Function for recording into the deletion queue the chunks of the files removed, for each datanode which handles some of them, in batches of deletion_batch_size files; the datanodes take the batches with the answers to their heartbeats and delete the chunks in background.
+    
+    Parameters
+    ----------
+    deleted --> list, the prefixes of the files removed (their ids), None if no chunk must be deleted
+    hosts --> list, the datanodes which handle some chunk of the files
+    
+    Returns
+    -------
+    inserted_documents --> list(list), the list of the batches inserted and the collection in which they have been inserted, decoded for aligning the slave namenodes
+    """
+    if not deleted or not hosts:
+        return []
+    size = get_deletion_batch_size()
+    batches = [{'datanode': dn, 'prefixes': deleted[i:i+size]} for dn in hosts for i in range(0, len(deleted), size)]
+    collections['deletions'].insert_many(batches)
+    logging.info('Queued the deletion of {} files from {} datanodes'.format(len(deleted), len(hosts)))
+    #insert_many sets the ids of the batches
+    return decode_mongodoc([(b, 'deletions') for b in batches], 'inserted_documents')
+
+
+def next_deletions(datanode, excluded, limit):
+    """Function for taking from the deletion queue the oldest batches of a datanode, for sending them with the answer to its heartbeat.
+    
+    Parameters
+    ----------
+    datanode --> str, the datanode
+    excluded --> list, the ids of the batches the datanode already has (done or in progress)
+    limit --> int, the maximum number of batches
+    
+    Returns
+    -------
+    batches --> list, the batches, each one a dict with its id and the prefixes of the files to delete
+    """
+    if limit <= 0:
+        return []
+    batches = collections['deletions'].find({'datanode': datanode, '_id': {'$nin': [ObjectId(i) for i in excluded]}}).sort('_id', 1).limit(limit)
+    return [{'id': str(b['_id']), 'prefixes': b['prefixes']} for b in batches]
+
+
+def dequeue_deletions(ids):
+    """Function for removing from the deletion queue the batches whose chunks have been deleted by a datanode.
+    
+    Parameters
+    ----------
+    ids --> list, the ids of the batches done
+    
+    Returns
+    -------
+    None
+    """
+    collections['deletions'].delete_many({'_id': {'$in': [ObjectId(i) for i in ids]}})
+    logging.info('{} batches of the deletion queue done'.format(len(ids)))
+    #align the slave namenodes metadata database with a rpc call
+    for nn in namenodes:
+        loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
+        with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
+            try:
+                proxy.dequeue_deletions_s(ids) #xml rpc call
+            except Exception as e:
+                #the namenode is not reachable
+                logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
+        
+
+def recover_lost_chunks(datanode, lost_chunks):
+    """Function for replicating again into a datanode the chunks lost by one of its disks; each chunk is written again into the datanode by another datanode which handles a replica of it (a cell of an erasure coded file is rebuilt from the other cells of its stripe), so the datanode keeps handling the chunk and the metadata don't change.
+    
+    Parameters
+    ----------
+    datanode --> str, the datanode which has lost the chunks
+    lost_chunks --> list, the names of the chunks lost
+    
+    Returns
+    -------
+    None
+    """
+    global start
+    c_to_replicate = []
+    stripes_to_rebuild = {}
+    files = {}
+    logging.warning('{} has lost {} chunks'.format(datanode, len(lost_chunks)))
+    for c in lost_chunks:
+        #the shared chunks (deduplicated or copied on write) are recorded into the chunks collection, the other ones into the documents of their files
+        stored = collections['chunks'].find_one({'_id': c})
+        if stored is not None:
+            handlers = [stored['master']]+stored['replicas']
+        else:
+            fid = c.split('_')[0]
+            if fid not in files:
+                files[fid] = collections['fs'].find_one({'_id': ObjectId(fid)}) if ObjectId.is_valid(fid) else None
+            f = files[fid]
+            if f is None or c not in f['chunks_bkp']:
+                logging.warning('Chunk {} lost by {} is not used by any file'.format(c, datanode))
+                continue
+            #the cells of an erasure coded file have no replicas, they are rebuilt from the other cells of their stripes
+            if parse_policy(f.get('policy')) is not None:
+                (data_chunks, parity_chunks) = parse_policy(f['policy'])
+                (stripe, layout) = stripe_layout(int(c.split('_')[1]), f['data_cells'], data_chunks, parity_chunks)
+                if (fid, stripe) not in stripes_to_rebuild:
+                    cells = []
+                    for sn in layout:
+                        #the data cells beyond the end of the file don't exist
+                        if sn is None:
+                            cells.append(None)
+                        else:
+                            name = '{}_{}'.format(fid, str(sn))
+                            cells.append((f['chunks_bkp'][name].replace('[dot]', '.').replace('[colon]', ':'), name))
+                    stripes_to_rebuild[(fid, stripe)] = {'data_chunks': data_chunks, 'parity_chunks': parity_chunks, 'cells': cells, 'lost': {}}
+                stripes_to_rebuild[(fid, stripe)]['lost'][layout.index(int(c.split('_')[1]))] = datanode
+                continue
+            handlers = [f['chunks_bkp'][c]]+f['replicas'].get(c, [])
+        #the chunk is copied from a datanode up which handles it
+        handlers = [dn.replace('[dot]', '.').replace('[colon]', ':') for dn in handlers]
+        sources = [dn for dn in handlers if dn != datanode and start.get(dn, 0) > 0]
+        if len(sources) == 0:
+            logging.critical('Chunk {} lost by {} has no other replica available'.format(c, datanode))
+            continue
+        c_to_replicate.append({'chunk': c, 'master': sources[0], 'new_replica': datanode})
+    start_recovery(c_to_replicate)
+    start_ec_recovery(list(stripes_to_rebuild.values()))
+    logging.info('{} chunks lost by {} replicated again'.format(len(c_to_replicate)+sum(len(st['lost']) for st in stripes_to_rebuild.values()), datanode))
         
         
 class HeartbeatThread(threading.Thread):
@@ -1411,7 +2102,7 @@ class CountdownThread(threading.Thread):
         #align the slave namenodes metadata database with a rpc call
         for nn in namenodes:
             loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-            with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+            with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
                 try:
                     proxy.record_trash_s(inserted_documents) #xml rpc call
                 except Exception as e:
@@ -1419,6 +2110,98 @@ class CountdownThread(threading.Thread):
                     logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
         return ids
         
+    def recover_erasure_coded(self, f):
+        """After a node has failed, allow to choose new datanodes for the cells of an erasure coded file the failed node was handling; the file document is updated in place.
+        
+        Parameters
+        ----------
+        self --> CountdownThread class, self reference to the object instance
+        f --> dict, the MongoDB object which represents the erasure coded file
+        
+        Returns
+        -------
+        (stripes_to_rebuild, lost_cells) --> tuple(list, list), the stripes to rebuild (see chunks_handler.start_ec_recovery) and the cells lost by the failed datanode
+        """
+        global start
+        failed = self.get_dn().replace('.', '[dot]').replace(':', '[colon]')
+        (data_chunks, parity_chunks) = parse_policy(f['policy'])
+        up_nodes = list(filter(lambda x: start[x]>0 and x != self.get_dn(), start.keys()))
+        lost_cells = list(f['chunks'][failed])
+        stripes = {}
+        #group the lost cells by stripe, a stripe can be rebuilt reading it only once
+        for c in lost_cells:
+            (stripe, layout) = stripe_layout(int(c.split('_')[1]), f['data_cells'], data_chunks, parity_chunks)
+            if stripe not in stripes:
+                stripes[stripe] = {'layout': layout, 'lost': {}}
+            stripes[stripe]['lost'][layout.index(int(c.split('_')[1]))] = c
+        stripes_to_rebuild = []
+        for stripe in stripes.values():
+            cells = []
+            for sn in stripe['layout']:
+                #the data cells beyond the end of the file don't exist
+                if sn is None:
+                    cells.append(None)
+                else:
+                    name = '{}_{}'.format(str(f['_id']), str(sn))
+                    cells.append((f['chunks_bkp'][name].replace('[dot]', '.').replace('[colon]', ':'), name))
+            lost = {}
+            for i in stripe['lost']:
+                c = stripe['lost'][i]
+                #the new datanode should not handle other cells of the same stripe, otherwise a single failure could lose more cells
+                used = [cell[0] for cell in cells if cell is not None]
+                candidates = [dn for dn in up_nodes if dn not in used] or up_nodes
+                new_dn = random.choice(candidates)
+                cells[i] = (new_dn, c)
+                lost[i] = new_dn
+                #update the MongoDB document which represents the current file with the new datanode for the cell
+                try:
+                    f['chunks'][new_dn.replace('.', '[dot]').replace(':', '[colon]')].append(c)
+                except KeyError:
+                    f['chunks'][new_dn.replace('.', '[dot]').replace(':', '[colon]')] = [c]
+                f['chunks'][failed].remove(c)
+                f['chunks_bkp'][c] = new_dn.replace('.', '[dot]').replace(':', '[colon]')
+            stripes_to_rebuild.append({'data_chunks': data_chunks, 'parity_chunks': parity_chunks, 'cells': cells, 'lost': lost})
+        del f['chunks'][failed]
+        return (stripes_to_rebuild, lost_cells)
+        
+    def recover_chunks_store(self):
+        """After a node has failed, allow to choose new master/replica nodes for the deduplicated chunks the failed node was a master/replica; the placement of these chunks is recorded into the chunks collection instead of the file documents.
+        
+        Parameters
+        ----------
+        self --> CountdownThread class, self reference to the object instance
+        
+        Returns
+        -------
+        (c_to_replicate, updatedone_documents) --> tuple(list, list), the chunks to replicate one time (see chunks_handler.start_recovery), the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
+        """
+        updatedone_documents = []
+        failed = self.get_dn().replace('.', '[dot]').replace(':', '[colon]')
+        #get the chunks MongoDB collection
+        chunks_store = get_chunks_store(self.get_client())
+        c_to_replicate = []
+        stored = {}
+        for c in chunks_store.find({'$or': [{'master': failed}, {'replicas': failed}]}):
+            stored[c['_id']] = c
+            #the first datanode which handles a secondary replica of the chunk becomes the master datanode for that chunk
+            if c['master'] == failed:
+                c['master'] = c['replicas'][0]
+                c['replicas'] = c['replicas'][1:]
+            else:
+                c['replicas'].remove(failed)
+            #insert the current chunk in the list of the ones to replicate one time
+            c_to_replicate.append({'chunk': c['_id'], 'not_good': list(map(lambda x: x.replace('[dot]', '.').replace('[colon]', ':'), c['replicas']))+[self.get_dn()], 'master': c['master'].replace('[dot]', '.').replace('[colon]', ':')})
+        #for each chunk to replicate choose a new datanode which handles a secondary replica
+        c_to_replicate = choose_recovery_replica(c_to_replicate)
+        for c in c_to_replicate:
+            chunk = stored[c['chunk']]
+            chunk['replicas'].append(c['new_replica'].replace('.', '[dot]').replace(':', '[colon]'))
+            #update the MongoDB chunk document with the new values of primary and secondary datanodes
+            chunks_store.update_one({'_id': chunk['_id']}, {'$set': {'master': chunk['master'], 'replicas': chunk['replicas']}})
+            #insert into the list needed for aligning the other namenodes
+            updatedone_documents.append(({'_id': chunk['_id']}, {'$set': {'master': chunk['master'], 'replicas': chunk['replicas']}}, 'chunks'))
+        return (c_to_replicate, updatedone_documents)
+        
     def recover_from_disaster(self):
         """After a node has failed, allow to choose new master/replica nodes for the chunks the failed node was a master/replica.
         
@@ -1438,7 +2221,19 @@ class CountdownThread(threading.Thread):
         query = {"$or": [{"chunks.{}".format(self.get_dn().replace('.', '[dot]').replace(':', '[colon]')) : {"$exists" : "true"}}, {"replicas_bkp.{}".format(self.get_dn().replace('.', '[dot]').replace(':', '[colon]')) : {"$exists" : "true"}}]}
         files = fs.find(query)
         c_to_replicate_tot = []
+        stripes_to_rebuild_tot = []
+        lost_cells_tot = []
         for f in files:
+            #the cells of an erasure coded file have no replicas, they must be rebuilt from the other cells of their stripes
+            if parse_policy(f.get('policy')) is not None:
+                (stripes_to_rebuild, lost_cells) = self.recover_erasure_coded(f)
+                #update the MongoDB file document with the new values
+                fs.update_one({ '_id': f['_id'] }, {'$set': {'chunks': f['chunks'], 'chunks_bkp': f['chunks_bkp']}})
+                #insert into the list needed for aligning the other namenodes
+                updatedone_documents.append(({ '_id': f['_id'] }, {'$set': {'chunks': f['chunks'], 'chunks_bkp': f['chunks_bkp']}}, 'fs'))
+                stripes_to_rebuild_tot.extend(stripes_to_rebuild)
+                lost_cells_tot.extend(lost_cells)
+                continue
             c_to_replicate = []
             #the chunks for which the failed datanode handles a primary replica  
             c_to_replace = list(f['chunks'][self.get_dn().replace('.', '[dot]').replace(':', '[colon]')])
@@ -1477,10 +2272,16 @@ class CountdownThread(threading.Thread):
             #insert into the list needed for aligning the other namenodes
             updatedone_documents.append(({ '_id': f['_id'] }, {'$set': {'chunks': f['chunks'], 'chunks_bkp': f['chunks_bkp'], 'replicas': f['replicas'], 'replicas_bkp': f['replicas_bkp']}}, 'fs'))
             c_to_replicate_tot.extend(c_to_replicate)
+        #the deduplicated chunks are shared between the files, their placement is recorded only once
+        (c_to_replicate, chunks_updated) = self.recover_chunks_store()
+        c_to_replicate_tot.extend(c_to_replicate)
+        updatedone_documents.extend(chunks_updated)
         start_recovery(c_to_replicate_tot)
+        start_ec_recovery(stripes_to_rebuild_tot)
         #fill the trash collection with the chunks to delete from teh failed datanode
         #when the failed datanode will be up again, the primary and secondary replicas handled by it mu be deleted because it's not the handler anymore, some other datanode took its place
         trash = list(map(lambda x: {'datanode': self.get_dn(), 'chunk': x['chunk']}, c_to_replicate_tot))
+        trash.extend(map(lambda x: {'datanode': self.get_dn(), 'chunk': x}, lost_cells_tot))
         ids = self.record_trash(trash)
         #mark the node as recovered 
         self.set_recovered(True)
@@ -1491,7 +2292,7 @@ class CountdownThread(threading.Thread):
         #align the slave namenodes metadata database with a rpc call
         for nn in namenodes:
             loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-            with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+            with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
                 try:
                     proxy.recover_from_disaster_s(updatedone_documents) #xml rpc call
                 except Exception as e:
@@ -1526,7 +2327,7 @@ class CountdownThread(threading.Thread):
         #align the slave namenodes metadata database with a rpc call
         for nn in namenodes:
             loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
-            with xmlrpc.client.ServerProxy(loc_namenode) as proxy:
+            with xmlrpc.client.ServerProxy(loc_namenode, allow_none=True) as proxy:
                 try:
                     proxy.flush_trash_s(deletemany_documents) #xml rpc call
                 except Exception as e:
@@ -1577,36 +2378,262 @@ class CountdownThread(threading.Thread):
                 time.sleep(10)      
     
     
+class GarbageCollectorThread(threading.Thread):
+    """Thread Class for running the garbage collector of the shared chunks (deduplicated or copied on write); periodically, the chunks not referenced anymore by any file are deleted from the datanodes."""
+    
+    def __init__(self, client, interval):
+        threading.Thread.__init__(self)
+        self.client = client
+        self.interval = interval
+        
+    def get_client(self):
+        """Method for getting the 'client' object attribute.
+        
+        Parameters
+        ----------
+        self --> GarbageCollectorThread class, self reference to the object instance
+        
+        Returns
+        -------
+        self.client --> pymoMongoClient class, MongoDB client
+        """
+        return self.client
+
+    def set_client(self, client):
+        """Method for setting the 'client' object attribute.
+        
+        Parameters
+        ----------
+        self --> GarbageCollectorThread class, self reference to the object instance
+        client --> pymoMongoClient class, MongoDB client
+        
+        Returns
+        -------
+        None
+        """
+        self.client = client
+        
+    def get_interval(self):
+        """Method for getting the 'interval' object attribute.
+        
+        Parameters
+        ----------
+        self --> GarbageCollectorThread class, self reference to the object instance
+        
+        Returns
+        -------
+        self.interval --> int, seconds between two garbage collections
+        """
+        return self.interval
+
+    def set_interval(self, interval):
+        """Method for setting the 'interval' object attribute.
+        
+        Parameters
+        ----------
+        self --> GarbageCollectorThread class, self reference to the object instance
+        interval --> int, seconds between two garbage collections
+        
+        Returns
+        -------
+        None
+        """
+        self.interval = interval
+        
+    def collect(self):
+        """Allow to delete from the datanodes and from the chunks collection the chunks without references.
+        
+        Parameters
+        ----------
+        self --> GarbageCollectorThread class, self reference to the object instance
+        
+        Returns
+        -------
+        None
+        """
+        updatedone_documents = []
+        deletedone_documents = []
+        #get the chunks MongoDB collection
+        chunks_store = get_chunks_store(self.get_client())
+        hosts = {}
+        #the chunks are tombstoned until they are deleted from the datanodes, so that no file put in the meantime references them or writes them again
+        with collection:
+            for c in chunks_store.find({'refs': {'$lte': 0}}, {'_id': 1}):
+                #the chunk is deleted only if in the meantime no file has referenced it again
+                chunk = chunks_store.find_one_and_update({'_id': c['_id'], 'refs': {'$lte': 0}}, {'$set': {'tombstone': True}})
+                if chunk is None:
+                    continue
+                collecting.add(chunk['_id'])
+                #insert into the lists needed for aligning the other namenodes
+                updatedone_documents.append(({'_id': chunk['_id']}, {'$set': {'tombstone': True}}, 'chunks'))
+                deletedone_documents.append(({'_id': chunk['_id']}, 'chunks'))
+                for dn in [chunk['master']] + chunk['replicas']:
+                    try:
+                        hosts[dn.replace('[dot]', '.').replace('[colon]', ':')].append(chunk['_id'])
+                    except KeyError:
+                        hosts[dn.replace('[dot]', '.').replace('[colon]', ':')] = [chunk['_id']]
+        if len(deletedone_documents) == 0:
+            return
+        try:
+            #the tombstones are aligned before the deletion, a slave which becomes master must not reference these chunks either
+            self.align(updatedone_documents, [])
+            #the shared chunks are deleted by exact name, the name of a chunk shared after a copy can be the prefix of other chunks names
+            for dn in hosts:
+                try:
+                    start_flush(hosts[dn], dn, get_gc_timeout())
+                except Exception as e:
+                    #the datanode is not reachable, the chunks will remain as garbage on it
+                    logging.error('Garbage collection failed on {}: {}'.format(dn, e))
+        finally:
+            #the chunks are not on the datanodes anymore, the files with them can be put again
+            with collection:
+                for (condition, col) in deletedone_documents:
+                    chunks_store.delete_one(condition)
+                    collecting.discard(condition['_id'])
+        logging.info('Garbage collected {} chunks'.format(len(deletedone_documents)))
+        self.align([], deletedone_documents)
+        return
+
+    def align(self, updatedone_documents, deletedone_documents):
+        """Method for aligning the chunks collection of the slave namenodes after a step of the garbage collection.
+        
+        Parameters
+        ----------
+        self --> GarbageCollectorThread class, self reference to the object instance
+        updatedone_documents --> list, the list of the conditions for updating MongoDB documents, the values which have to be updated and the collection in which perform the update
+        deletedone_documents --> list, the list of the conditions for deleting MongoDB documents and the collection in which perform the delete
+        
+        Returns
+        -------
+        None
+        """
+        #align the slave namenodes metadata database with a rpc call, a slave which hangs does not stop the collection
+        for nn in namenodes:
+            loc_namenode = 'http://{}:{}/'.format(nn['host'], nn['port'])
+            with xmlrpc.client.ServerProxy(loc_namenode, transport=TimeoutTransport(get_gc_timeout()), allow_none=True) as proxy:
+                try:
+                    proxy.gc_s(updatedone_documents, deletedone_documents) #xml rpc call
+                except Exception as e:
+                    #the namenode is not reachable
+                    logging.error("Something went wrong during slave namenodes alignment: {}".format(e))
+        return
+        
+    def run(self):
+        """Target method for the class; every interval seconds the garbage collection starts, only on the master namenode.
+        
+        Parameters
+        ----------
+        self --> GarbageCollectorThread class, self reference to the object instance
+        
+        Returns
+        -------
+        None
+        """
+        while True:
+            time.sleep(self.get_interval())
+            #only the master namenode handles the datanodes
+            if not you_the_master:
+                continue
+            self.collect()
+    
+    
+def master_only(func):
+    """Function for wrapping a rpc function which can be invoked by the clients, so that it's executed only by the master namenode; a client which calls a slave namenode gets a NotMasterException and looks for the master again.
+    
+    Parameters
+    ----------
+    func --> function, the rpc function
+    
+    Returns
+    -------
+    wrapper --> function, the rpc function executed only by the master namenode
+    """
+    @functools.wraps(func)
+    def wrapper(*args):
+        if not you_the_master:
+            raise NotMasterException(sys.argv[1])
+        return func(*args)
+    return wrapper
+
+
+def authenticated(func):
+    """Function for wrapping a rpc function which can be invoked by the clients, so that it's executed only with a valid session; the user who requires the operation and the groups are the ones of the session, not the ones sent by the client.
+    
+    Parameters
+    ----------
+    func --> function, the rpc function
+    
+    Returns
+    -------
+    wrapper --> function, the rpc function executed only with a valid session
+    """
+    signature = inspect.signature(func)
+    @functools.wraps(func)
+    def wrapper(*args):
+        (username, token) = getattr(credentials, 'value', None) or (None, None)
+        if token is None:
+            raise InvalidSessionException(username)
+        (username, groups) = validate_session(username, token)
+        bound = signature.bind_partial(*args)
+        if 'required_by' in signature.parameters:
+            bound.arguments['required_by'] = username
+        if 'grp' in signature.parameters:
+            bound.arguments['grp'] = groups
+        return func(*bound.args, **bound.kwargs)
+    return wrapper
+
+
+class SessionRequestHandler(SimpleXMLRPCRequestHandler):
+    """Class for handling the rpc calls, the credentials of the session are sent with the basic HTTP authentication (username and token)."""
+
+    def do_POST(self):
+        try:
+            (username, token) = base64.b64decode(self.headers.get('Authorization', '').split()[-1]).decode().split(':', 1)
+            credentials.value = (username, token)
+        except:
+            credentials.value = None
+        SimpleXMLRPCRequestHandler.do_POST(self)
+
+
 class ServerThread(threading.Thread):
     """Thread Class for running a RPC server which listens for commands by the clients."""
     
     def __init__(self):
         threading.Thread.__init__(self)
-        self.server = SimpleXMLRPCServer((namenode['host'], namenode['port']), allow_none=True)
-        #register all the rpc functions that can be invoked remotely by a client
-        self.server.register_function(mkdir, 'mkdir')
-        self.server.register_function(touch, 'touch')
-        self.server.register_function(ls, 'ls')
-        self.server.register_function(rm, 'rm')
-        self.server.register_function(rmr, 'rmr')
-        self.server.register_function(get_file, 'get_file')
-        self.server.register_function(cp, 'cp')
-        self.server.register_function(mv, 'mv')
-        self.server.register_function(count, 'count')
-        self.server.register_function(countr, 'countr')
-        self.server.register_function(du, 'du')
-        self.server.register_function(chown, 'chown')
-        self.server.register_function(chgrp, 'chgrp')
-        self.server.register_function(chmod, 'chmod')
-        self.server.register_function(put_file, 'put_file')
-        self.server.register_function(mkfs, 'mkfs')
-        self.server.register_function(groupadd, 'groupadd')
-        self.server.register_function(useradd, 'useradd')
-        self.server.register_function(groupdel, 'groupdel')
-        self.server.register_function(userdel, 'userdel')
-        self.server.register_function(passwd, 'passwd')
-        self.server.register_function(usermod, 'usermod')
-        self.server.register_function(get_user, 'get_user') 
+        self.server = SimpleXMLRPCServer((namenode['host'], namenode['port']), requestHandler=SessionRequestHandler, allow_none=True)
+        #register all the rpc functions that can be invoked remotely by a client, only the master namenode executes them and only with a valid session
+        self.server.register_function(master_only(authenticated(mkdir)), 'mkdir')
+        self.server.register_function(master_only(authenticated(touch)), 'touch')
+        self.server.register_function(master_only(authenticated(ls)), 'ls')
+        self.server.register_function(master_only(authenticated(rm)), 'rm')
+        self.server.register_function(master_only(authenticated(rmr)), 'rmr')
+        self.server.register_function(master_only(authenticated(get_file)), 'get_file')
+        self.server.register_function(master_only(authenticated(get_tree)), 'get_tree')
+        self.server.register_function(master_only(authenticated(cp)), 'cp')
+        self.server.register_function(master_only(authenticated(mv)), 'mv')
+        self.server.register_function(master_only(authenticated(count)), 'count')
+        self.server.register_function(master_only(authenticated(countr)), 'countr')
+        self.server.register_function(master_only(authenticated(du)), 'du')
+        self.server.register_function(master_only(authenticated(chown)), 'chown')
+        self.server.register_function(master_only(authenticated(chgrp)), 'chgrp')
+        self.server.register_function(master_only(authenticated(chmod)), 'chmod')
+        self.server.register_function(master_only(authenticated(put_file)), 'put_file')
+        self.server.register_function(master_only(authenticated(mkdirs)), 'mkdirs')
+        self.server.register_function(master_only(authenticated(put_files)), 'put_files')
+        self.server.register_function(master_only(authenticated(commit_chunks)), 'commit_chunks')
+        self.server.register_function(master_only(authenticated(batch)), 'batch')
+        self.server.register_function(master_only(authenticated(setpolicy)), 'setpolicy')
+        self.server.register_function(master_only(authenticated(get_policy)), 'get_policy')
+        self.server.register_function(master_only(authenticated(mkfs)), 'mkfs')
+        self.server.register_function(master_only(authenticated(groupadd)), 'groupadd')
+        self.server.register_function(master_only(authenticated(useradd)), 'useradd')
+        self.server.register_function(master_only(authenticated(groupdel)), 'groupdel')
+        self.server.register_function(master_only(authenticated(userdel)), 'userdel')
+        self.server.register_function(master_only(authenticated(passwd)), 'passwd')
+        self.server.register_function(master_only(authenticated(usermod)), 'usermod')
+        self.server.register_function(master_only(authenticated(get_user)), 'get_user') 
+        self.server.register_function(master_only(authenticated(whoami)), 'whoami')
+        self.server.register_function(master_only(login), 'login')
         self.server.register_function(mkdir_s, 'mkdir_s')
         self.server.register_function(touch_s, 'touch_s')
         self.server.register_function(rm_s, 'rm_s')
@@ -1614,9 +2641,11 @@ class ServerThread(threading.Thread):
         self.server.register_function(cp_s, 'cp_s')
         self.server.register_function(mv_s, 'mv_s')
         self.server.register_function(put_file_s, 'put_file_s')
+        self.server.register_function(batch_s, 'batch_s')
         self.server.register_function(chown_s, 'chown_s')
         self.server.register_function(chgrp_s, 'chgrp_s')
         self.server.register_function(chmod_s, 'chmod_s')
+        self.server.register_function(setpolicy_s, 'setpolicy_s')
         self.server.register_function(groupadd_s, 'groupadd_s')
         self.server.register_function(useradd_s, 'useradd_s')
         self.server.register_function(groupdel_s, 'groupdel_s')
@@ -1627,6 +2656,9 @@ class ServerThread(threading.Thread):
         self.server.register_function(record_trash_s, 'record_trash_s')
         self.server.register_function(flush_trash_s, 'flush_trash_s')
         self.server.register_function(recover_from_disaster_s, 'recover_from_disaster_s')
+        self.server.register_function(commit_chunks_s, 'commit_chunks_s')
+        self.server.register_function(gc_s, 'gc_s')
+        self.server.register_function(dequeue_deletions_s, 'dequeue_deletions_s')
         self.server.register_function(get_status, 'get_status')
         
     def get_server(self):
@@ -1679,6 +2711,14 @@ def main():
     if get_replica_set() > len(get_datanodes_list()):
         logging.critical('Impossible to start! Not enough datanodes to handle the replica set')
         return
+    #the namenodes must sign the sessions with the same secret, otherwise the sessions opened with the master are refused by the next one
+    if get_session_secret() is None:
+        if namenodes:
+            logging.critical('Impossible to start! The session_secret shared by the namenodes is not configured')
+            return
+        logging.critical('The session_secret is not configured: a random one is used, the sessions will not be valid after a restart of the namenode')
+    #the deletion queue of a namespace made before it was indexed is indexed too
+    collections['deletions'].create_index([('datanode', ASCENDING), ('_id', ASCENDING)])
     logging.info('Namenode started')
     #create the server thread for handling rpc invokations
     server_thread = ServerThread()
@@ -1697,8 +2737,12 @@ def main():
         countdown_threads[dn] = CountdownThread(lock, dn, client)
         countdown_threads[dn].start()
     logging.info('Datanodes countdowns started')
+    #create the thread which reclaims the deduplicated chunks not referenced anymore
+    gc_thread = GarbageCollectorThread(client, get_gc_interval())
+    gc_thread.start()
     server_thread.join()
     heartbeat_thread.join()
+    gc_thread.join()
     for dn in countdown_threads:
         countdown_threads[dn].join()
     
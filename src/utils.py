@@ -1,15 +1,17 @@
 import datetime
 import json 
+import xmlrpc.client
 import multiprocessing
 import random
+import os
 from bson.objectid import ObjectId
-from exceptions import AccessDeniedException, NotFoundException
+from exceptions import AccessDeniedException, NotFoundException, InvalidPolicyException
 
 
 conf = json.load(open('conf.json','r'))
 
 
-def create_file_node(name, parent, own, grp, size=0):
+def create_file_node(name, parent, own, grp, size=0, codec='none', stored_size=None, policy='replication', data_cells=0, sequence=None):
     """Return a file node as a dict.
     
     Parameters
@@ -19,6 +21,11 @@ def create_file_node(name, parent, own, grp, size=0):
     own --> str, owner of the file
     grp --> str, group of the file, the main user's group
     size --> int, size of the file in bytes
+    codec --> str, the codec used for compressing the chunks of the file
+    stored_size --> int, size of the file in bytes as it's stored into the datanodes (after compression), if None it's equal to size
+    policy --> str, the storage policy of the file, either replication or RS-<DATA_CHUNKS>-<PARITY_CHUNKS> for erasure coding
+    data_cells --> int, the number of chunks which contain the file content (the parity chunks of an erasure coded file follow them)
+    sequence --> list, the hashes of the content addressed chunks which compose the file, in order (None if the chunks are not deduplicated)
     
     Returns
     -------
@@ -28,6 +35,9 @@ def create_file_node(name, parent, own, grp, size=0):
     #owner --> rw
     #group --> r 
     #others --> r
+    #if the chunks are not compressed, the stored size is the logical one
+    if stored_size is None:
+        stored_size = size
     #create the file node for MongoDB
     file = {
             'name': name,
@@ -38,6 +48,11 @@ def create_file_node(name, parent, own, grp, size=0):
             'replicas': {},
             'replicas_bkp': {},
             'size': size, 
+            'stored_size': stored_size,
+            'codec': codec,
+            'policy': policy,
+            'data_cells': data_cells,
+            'sequence': sequence,
             'creation': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'update': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'own': own,
@@ -77,6 +92,7 @@ def create_directory_node(name, parent, own, grp):
                 'type': 'd',
                 'files': [], 
                 'directories': [],
+                'policy': None,
                 'creation': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'own': own,
                 'grp': grp,
@@ -89,6 +105,33 @@ def create_directory_node(name, parent, own, grp):
     return directory
 
 
+def create_chunk_node(chunk_hash, master, replicas, refs, pending=None):
+    """Return a content addressed chunk node as a dict.
+    
+    Parameters
+    ----------
+    chunk_hash --> str, the hash of the chunk payload, used also as chunk name into the datanodes
+    master --> str, the datanode which handles the primary replica of the chunk
+    replicas --> list, the datanodes which handle the secondary replicas of the chunk
+    refs --> int, the number of references to the chunk from the files
+    pending --> list, the ids of the files which are writing the chunk, until one of them is acknowledged by the datanodes (None or empty if the chunk is already stored)
+    
+    Returns
+    -------
+    chunk --> dict, chunk object 
+    """
+    #create the chunk node for MongoDB
+    chunk = {
+            '_id': chunk_hash,
+            'master': master,
+            'replicas': replicas,
+            'refs': refs,
+            'pending': pending if pending is not None else [],
+            'creation': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+    return chunk
+
+
 def create_group_node(name, users):
     """Return a group node as a dict.
     
@@ -266,6 +309,16 @@ def is_allowed(operation_type, mode, role):
             'ancestor': 'x',
             'parent': 'rx',
             'resource': None
+        },
+        'setpolicy': {
+            'ancestor': 'x',
+            'parent': 'rx',
+            'resource': None
+        },
+        'get_policy': {
+            'ancestor': 'x',
+            'parent': 'x',
+            'resource': None
         }
     }
     #get the needed permissions for the current operation and resouce role
@@ -443,7 +496,7 @@ def decode_mongodoc(lst, type_lst):
                 doc['_id'] = str(doc['_id']) #each id of the MongoDB documents must be casted
             elif col == 'groups':
                 doc['_id'] = str(doc['_id']) #each id of the MongoDB documents must be casted
-            elif col == 'trash':
+            elif col in ['trash', 'deletions']:
                 doc['_id'] = str(doc['_id']) #each id of the MongoDB documents must be casted
             else:
                 pass
@@ -503,7 +556,7 @@ def encode_mongodoc(lst, type_lst):
                 doc['_id'] = ObjectId(doc['_id']) #each id of the MongoDB documents must be casted back
             elif col == 'groups':
                 doc['_id'] = ObjectId(doc['_id']) #each id of the MongoDB documents must be casted back
-            elif col == 'trash':
+            elif col in ['trash', 'deletions']:
                 doc['_id'] = ObjectId(doc['_id'])#each id of the MongoDB documents must be casted back
             else:
                 pass
@@ -572,6 +625,780 @@ def get_max_concurrency():
     return threads_n
 
 
+def get_transfer_engine():
+    """Function for getting from the configuration file the engine which transfers the chunks between the client and the datanodes.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    engine --> str, either thread (a pool of max_thread_concurrency threads) or asyncio (an event loop with async_concurrency transfers in flight)
+    """
+    try:
+        engine = conf['transfer_engine']
+        if engine not in ['thread', 'asyncio']:
+            engine = 'thread'
+    except:
+        engine = 'thread'
+    return engine
+
+
+def get_async_concurrency():
+    """Function for getting from the configuration file the maximum number of chunk transfers in flight with the asyncio engine.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    concurrency --> int, the maximum number of transfers in flight
+    """
+    try:
+        concurrency = int(conf['async_concurrency'])
+        if concurrency <= 0:
+            concurrency = 256
+    except:
+        concurrency = 256
+    return concurrency
+
+
+def get_batch_size():
+    """Function for getting from the configuration file the maximum size of a batch of files put together by put_dir; the files of a batch are allocated with one rpc and their chunks are written together.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    batch_size --> int, the maximum size of a batch, in bytes
+    """
+    try:
+        batch_size = int(conf['batch_size'])
+        if batch_size <= 0:
+            batch_size = 268435456
+    except:
+        batch_size = 268435456
+    return batch_size
+
+
+def get_read_ahead():
+    """Function for getting from the configuration file how many chunks a file reader of the client reads ahead of the one being read.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    read_ahead --> int, the number of chunks read in background, 0 for reading each chunk only when it's required
+    """
+    try:
+        read_ahead = int(conf['read_ahead'])
+        if read_ahead < 0:
+            read_ahead = 4
+    except:
+        read_ahead = 4
+    return read_ahead
+
+
+def get_chunk_cache_memory():
+    """Function for getting from the configuration file the maximum size of the memory tier of the client chunk cache.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    memory_size --> int, the maximum size of the chunks cached in memory, in bytes, 0 for disabling the tier
+    """
+    try:
+        memory_size = int(conf['chunk_cache_memory'])
+        if memory_size < 0:
+            memory_size = 268435456
+    except:
+        memory_size = 268435456
+    return memory_size
+
+
+def get_chunk_cache_disk():
+    """Function for getting from the configuration file the maximum size of the disk tier of the client chunk cache.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    disk_size --> int, the maximum size of the chunks cached on disk, in bytes, 0 for disabling the tier
+    """
+    try:
+        disk_size = int(conf['chunk_cache_disk'])
+        if disk_size < 0:
+            disk_size = 0
+    except:
+        disk_size = 0
+    return disk_size
+
+
+def get_chunk_cache_dir():
+    """Function for getting from the configuration file the directory of the disk tier of the client chunk cache.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    directory --> str, the local directory in which the chunks are cached
+    """
+    try:
+        directory = conf['chunk_cache_dir']
+        if not directory:
+            directory = os.path.join(os.path.expanduser('~'), '.hmdfs_cache')
+    except:
+        directory = os.path.join(os.path.expanduser('~'), '.hmdfs_cache')
+    return os.path.expanduser(directory)
+
+
+def get_datanode_cache_size():
+    """Function for getting from the configuration file the maximum size of the hot chunks cache of each datanode.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    cache_size --> int, the maximum size of the chunks a datanode keeps in memory, in bytes, 0 for disabling the cache
+    """
+    try:
+        cache_size = int(conf['datanode_cache_size'])
+        if cache_size < 0:
+            cache_size = 268435456
+    except:
+        cache_size = 268435456
+    return cache_size
+
+
+def get_datanode_cache_policy():
+    """Function for getting from the configuration file the eviction policy of the hot chunks cache of the datanodes.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    policy --> str, either lru (least recently used) or lfu (least frequently used)
+    """
+    try:
+        policy = conf['datanode_cache_policy'].lower()
+        if policy not in ['lru', 'lfu']:
+            policy = 'lru'
+    except:
+        policy = 'lru'
+    return policy
+
+
+def get_mmap_cache_size():
+    """Function for getting from the configuration file how many chunks each datanode keeps memory mapped for the range reads.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    mappings --> int, the maximum number of chunks mapped at the same time, 0 for never mapping the chunks
+    """
+    try:
+        mappings = int(conf['mmap_cache_size'])
+        if mappings < 0:
+            mappings = 1024
+    except:
+        mappings = 1024
+    return mappings
+
+
+def get_durability():
+    """Function for getting from the configuration file when a datanode syncs a chunk written to the disk.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    durability --> str, either none (the chunk is left into the page cache of the operating system), chunk (every chunk is synced before the write is acknowledged) or group (the chunks written concurrently are synced together before the writes are acknowledged)
+    """
+    try:
+        durability = conf['durability'].lower()
+        if durability not in ['none', 'chunk', 'group']:
+            durability = 'chunk'
+    except:
+        durability = 'chunk'
+    return durability
+
+
+def get_storage_layout():
+    """Function for getting from the configuration file how a datanode lays out the chunks into its storage directory.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    layout --> str, either flat (all the chunks into the storage directory) or hashed (the chunks into two levels of 256 subdirectories, chosen by the hash of their names)
+    """
+    try:
+        layout = conf['storage_layout'].lower()
+        if layout not in ['flat', 'hashed']:
+            layout = 'hashed'
+    except:
+        layout = 'hashed'
+    return layout
+
+
+def get_disk_workers():
+    """Function for getting from the configuration file how many threads of a datanode do the I/O of each of its storage directories.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    workers --> int, the size of the I/O pool of each storage directory
+    """
+    #the workers must be a positive integer
+    try:
+        workers = int(conf['disk_workers'])
+        if workers <= 0:
+            workers = 4
+    except:
+        workers = 4
+    return workers
+
+
+def get_small_chunk_size():
+    """Function for getting from the configuration file up to which size a chunk is packed by a datanode into its container files, instead of being stored into a file of its own.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    size --> int, the size of the biggest chunk packed, in bytes (0 for never packing the chunks)
+    """
+    #the size must be a non negative integer
+    try:
+        size = int(conf['small_chunk_size'])
+        if size < 0:
+            size = 65536
+    except:
+        size = 65536
+    return size
+
+
+def get_container_size():
+    """Function for getting from the configuration file the size of the container files of a datanode, into which the small chunks are appended.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    size --> int, the size at which a container file is closed and a new one is opened, in bytes
+    """
+    #the size must be a positive integer
+    try:
+        size = int(conf['container_size'])
+        if size <= 0:
+            size = 268435456
+    except:
+        size = 268435456
+    return size
+
+
+def get_compaction_ratio():
+    """Function for getting from the configuration file the fraction of a container file made of deleted or overwritten chunks at which a datanode compacts it.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    ratio --> float, the fraction of garbage which triggers the compaction, between 0 (excluded) and 1
+    """
+    #the ratio must be into (0, 1]
+    try:
+        ratio = float(conf['compaction_ratio'])
+        if ratio <= 0 or ratio > 1:
+            ratio = 0.5
+    except:
+        ratio = 0.5
+    return ratio
+
+
+def get_group_commit_window():
+    """Function for getting from the configuration file for how many seconds a datanode waits for other writes before syncing them together, with the group durability.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    window --> float, the time window of a group commit, in seconds
+    """
+    #the window must be a non negative number
+    try:
+        window = float(conf['group_commit_window'])
+        if window < 0:
+            window = 0.001
+    except:
+        window = 0.001
+    return window
+
+
+def get_write_acks(copies):
+    """Function for getting from the configuration file how many copies of a chunk must be written (with the configured durability) before the write is acknowledged to the client.
+    
+    Parameters
+    ----------
+    copies --> int, the copies of the chunk to write (the primary one and the replicas)
+    
+    Returns
+    -------
+    acks --> int, the copies written before the acknowledgement, the other ones are written in background
+    """
+    #0 means all the copies
+    try:
+        acks = int(conf['write_acks'])
+        if acks <= 0:
+            acks = copies
+    except:
+        acks = copies
+    return min(acks, copies)
+
+
+def get_master_cache_ttl():
+    """Function for getting from the configuration file for how many seconds the client keeps using the master namenode it has found, before asking the datanodes again.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    ttl --> float, the time to live of the master namenode cached, in seconds
+    """
+    try:
+        ttl = float(conf['master_cache_ttl'])
+        if ttl < 0:
+            ttl = 60.0
+    except:
+        ttl = 60.0
+    return ttl
+
+
+def get_master_lookup_timeout():
+    """Function for getting from the configuration file how long the client waits for a datanode which is asked for the master namenode.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    timeout --> float, the timeout, in seconds
+    """
+    try:
+        timeout = float(conf['master_lookup_timeout'])
+        if timeout <= 0:
+            timeout = 2.0
+    except:
+        timeout = 2.0
+    return timeout
+
+
+def get_transfer_retries():
+    """Function for getting from the configuration file how many times a failed chunk transfer is retried.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    retries --> int, the number of retries
+    """
+    try:
+        retries = int(conf['transfer_retries'])
+        if retries < 0:
+            retries = 2
+    except:
+        retries = 2
+    return retries
+
+
+def get_hedged_reads():
+    """Function for getting from the configuration file if a chunk read must be hedged, i.e. sent also to another replica when the first one is slow.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    hedged --> bool, True if the reads must be hedged, False otherwise
+    """
+    try:
+        hedged = bool(conf['hedged_reads'])
+    except:
+        hedged = True
+    return hedged
+
+
+def get_hedge_percentile():
+    """Function for getting from the configuration file the percentile of the chunks read latencies after which a read is hedged.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    percentile --> float, the percentile, between 0 and 100
+    """
+    try:
+        percentile = float(conf['hedge_percentile'])
+        if percentile <= 0 or percentile > 100:
+            percentile = 95.0
+    except:
+        percentile = 95.0
+    return percentile
+
+
+def get_compression_codec():
+    """Function for getting the codec used for compressing the chunks from the configuration file.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    codec --> str, the name of the codec, none if the chunks must not be compressed
+    """
+    try:
+        codec = str(conf['compression_codec'])
+    except:
+        codec = 'none'
+    return codec
+
+
+def encode_chunk_payload(payload):
+    """Function for encoding the binary payload of a chunk before sending it to a datanode; the datanodes decode the payload as ISO-8859-1, so every byte is preserved as it is (also for compressed payloads).
+    
+    Parameters
+    ----------
+    payload --> bytes, the chunk payload
+    
+    Returns
+    -------
+    payload --> str, the chunk payload encoded as a string
+    """
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload).decode('ISO-8859-1')
+    return payload
+
+
+def decode_chunk_payload(content):
+    """Function for decoding the response of a datanode for a chunk get request into the binary chunk payload.
+    
+    Parameters
+    ----------
+    content --> bytes, the body of the response, the json representation of the chunk payload encoded as a string
+    
+    Returns
+    -------
+    json.loads(content).encode('ISO-8859-1') --> bytes, the chunk payload
+    """
+    return json.loads(content).encode('ISO-8859-1')
+
+
+def decode_chunk_response(content, content_type):
+    """Function for decoding the response of a datanode for a raw chunk get request into the binary chunk payload; the datanodes which don't serve the raw chunks answer with the chunk payload encoded as a string.
+    
+    Parameters
+    ----------
+    content --> bytes, the body of the response
+    content_type --> str, the content type of the response
+    
+    Returns
+    -------
+    payload --> bytes, the chunk payload
+    """
+    if content_type is not None and content_type.startswith('application/octet-stream'):
+        return content
+    return decode_chunk_payload(content)
+
+
+def get_deduplication():
+    """Function for getting from the configuration file if the chunks of the replicated files must be deduplicated (content addressed chunks).
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    dedup --> bool, True if the chunks must be deduplicated, False otherwise
+    """
+    try:
+        dedup = bool(conf['deduplication'])
+    except:
+        dedup = False
+    return dedup
+
+
+def get_session_ttl():
+    """Function for getting from the configuration file for how many seconds a session token issued by the master namenode is valid.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    ttl --> int, the time to live of a session, in seconds
+    """
+    try:
+        ttl = int(conf['session_ttl'])
+        if ttl <= 0:
+            ttl = 3600
+    except:
+        ttl = 3600
+    return ttl
+
+
+def get_session_secret():
+    """Function for getting from the configuration file the secret with which the namenodes sign the session tokens; it must be the same for all the namenodes, so the sessions survive a change of the master namenode.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    secret --> bytes, the secret, None if it's not configured
+    """
+    try:
+        secret = conf['session_secret'].encode()
+        if not secret:
+            secret = None
+    except:
+        secret = None
+    return secret
+
+
+def get_gc_interval():
+    """Function for getting from the configuration file every how many seconds the garbage collector reclaims the chunks not referenced anymore.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    interval --> int, the interval in seconds
+    """
+    try: 
+        interval = int(conf['gc_interval'])
+        if interval <= 0:
+            interval = 60
+    except:
+        interval = 60
+    return interval
+
+
+def get_gc_timeout():
+    """Function for getting from the configuration file how long the garbage collector waits for a datanode or a slave namenode, so one which hangs does not stop the collection.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    timeout --> float, the timeout, in seconds
+    """
+    try:
+        timeout = float(conf['gc_timeout'])
+        if timeout <= 0:
+            timeout = 30.0
+    except:
+        timeout = 30.0
+    return timeout
+
+
+def get_deletion_batch_size():
+    """Function for getting from the configuration file how many removed files each batch of the deletion queue holds, a datanode deletes the chunks of a batch at a time.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    size --> int, the number of file prefixes of each batch
+    """
+    try: 
+        size = int(conf['deletion_batch_size'])
+        if size <= 0:
+            size = 1000
+    except:
+        size = 1000
+    return size
+
+
+def get_deletion_window():
+    """Function for getting from the configuration file how many batches of the deletion queue the master namenode gives to a datanode before it acknowledges them.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    window --> int, the number of batches a datanode deletes at the same time
+    """
+    try: 
+        window = int(conf['deletion_window'])
+        if window <= 0:
+            window = 4
+    except:
+        window = 4
+    return window
+
+
+def get_copy_on_write():
+    """Function for getting from the configuration file if cp must share the chunks of the source file instead of copying them (copy on write).
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    cow --> bool, True if the chunks must be shared, False otherwise
+    """
+    try:
+        cow = bool(conf['copy_on_write'])
+    except:
+        cow = True
+    return cow
+
+
+def get_storage_policy():
+    """Function for getting the default storage policy of the files from the configuration file.
+    
+    Parameters
+    ----------
+    None
+    
+    Returns
+    -------
+    policy --> str, the default storage policy, either replication or RS-<DATA_CHUNKS>-<PARITY_CHUNKS>
+    """
+    try:
+        policy = str(conf['storage_policy'])
+        parse_policy(policy)
+    except:
+        policy = 'replication'
+    return policy
+
+
+def parse_policy(policy):
+    """Function for parsing a storage policy.
+    
+    Parameters
+    ----------
+    policy --> str, the storage policy, either replication or RS-<DATA_CHUNKS>-<PARITY_CHUNKS>, e.g. RS-6-3
+    
+    Returns
+    -------
+    (data_chunks, parity_chunks) --> tuple(int, int), the number of data and parity chunks of each stripe, None if the policy is replication
+    """
+    if policy is None or policy == 'replication':
+        return None
+    try:
+        rs, data_chunks, parity_chunks = policy.split('-')
+        data_chunks = int(data_chunks)
+        parity_chunks = int(parity_chunks)
+    except:
+        raise InvalidPolicyException(policy)
+    #a stripe can have at most 255 cells over GF(2^8)
+    if rs != 'RS' or data_chunks <= 0 or parity_chunks <= 0 or data_chunks+parity_chunks > 255:
+        raise InvalidPolicyException(policy)
+    return (data_chunks, parity_chunks)
+
+
+def get_file_cells(file):
+    """Function for getting all the chunks of a file (for an erasure coded file both the data and the parity ones) with the datanodes which handle them.
+    
+    Parameters
+    ----------
+    file --> dict, the object which represents the file, as returned by get_file
+    
+    Returns
+    -------
+    cells --> dict, key: sequence number, value: tuple(list, str) with the datanodes which handle the chunk (primary first) and the chunk name
+    """
+    locations = {}
+    for dn in file['chunks']:
+        for c in file['chunks'][dn]:
+            #the chunks of an erasure coded file don't have secondary replicas
+            locations[c] = [dn] + file['replicas'].get(c, [])
+    #the deduplicated chunks are named with their hash, the same chunk can be at different positions into the file
+    if file.get('sequence') is not None:
+        return {sn: (locations[c], c) for (sn, c) in enumerate(file['sequence'])}
+    cells = {}
+    for c in locations:
+        cells[int(c.split('_')[1])] = (locations[c], c)
+    return cells
+
+
+def get_data_chunks(file):
+    """Function for getting the list of the chunks which contain the content of a file, sorted by sequence number; the parity chunks of an erasure coded file are ignored.
+    
+    Parameters
+    ----------
+    file --> dict, the object which represents the file, as returned by get_file
+    
+    Returns
+    -------
+    chunks --> list, tuples which contains (list of datanodes which handle a replica of a chunk of file, chunk name, sequence number of the chunk)
+    """
+    cells = get_file_cells(file)
+    data_cells = len(cells)
+    #the parity chunks of an erasure coded file follow the data ones
+    if parse_policy(file.get('policy')) is not None:
+        data_cells = file['data_cells']
+    chunks = [(cells[sn][0], cells[sn][1], sn) for sn in sorted(cells) if sn < data_cells]
+    return chunks
+
+
 def get_replica_set():
     """Function for getting the number of replicas from the configuration file.
     
@@ -621,6 +1448,23 @@ def get_datanode_setting(datanode):
     return conf['datanodes_setting'][datanode]
 
 
+def get_datanode_storages(setting):
+    """Function for getting the storage directories of a datanode, one for each of its disks.
+    
+    Parameters
+    ----------
+    setting --> dict, the setting of the datanode (see get_datanode_setting)
+    
+    Returns
+    -------
+    storages --> list, the storage directories of the datanode
+    """
+    #a single storage directory can be given as a string
+    if isinstance(setting['storage'], str):
+        return [setting['storage']]
+    return list(setting['storage'])
+
+
 def get_datanodes():
     """Function for getting the datanodes settings from the configuration file.
     
@@ -662,3 +1506,26 @@ def get_namenodes():
     """
     return conf['namenodes_setting']
 
+
+class TimeoutTransport(xmlrpc.client.Transport):
+    """Class for the rpc calls which must not wait more than a timeout for the answer."""
+
+    def __init__(self, timeout):
+        xmlrpc.client.Transport.__init__(self)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        """Method for opening the connection to the host of a rpc call, as xmlrpc.client.Transport.make_connection; the connection gets the timeout, so both connecting and waiting for the answer raise socket.timeout (an OSError) after it.
+        
+        Parameters
+        ----------
+        self --> TimeoutTransport class, self reference to the object instance
+        host --> str, the host (and port) of the server
+        
+        Returns
+        -------
+        conn --> http.client.HTTPConnection class, the connection to the host
+        """
+        conn = xmlrpc.client.Transport.make_connection(self, host)
+        conn.timeout = self.timeout
+        return conn